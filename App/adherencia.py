@@ -0,0 +1,166 @@
+"""
+Motor de adherencia por medicamento.
+
+Las dosis esperadas siguen la agenda de la app (`calcular_agenda`): la
+primera se debe en `created_at` y, después de cada toma, la siguiente a
+`frecuencia_horas` de esa toma; si no hay toma, los recordatorios siguen cada
+`frecuencia_horas` desde la última dosis debida. Todo termina en el fin del
+tratamiento (`duracion_dias`; 0 es indefinido).
+
+Cada toma responde a la dosis más cercana desde la toma anterior: si está a
+menos de `ADHERENCIA_TOLERANCIA_MINUTOS` cuenta como a tiempo, si no como
+tardía, y las dosis que quedaron antes sin toma son omitidas. Las dosis
+posteriores a la última toma cuentan como omitidas recién cuando pasó la
+tolerancia: antes todavía se pueden tomar a tiempo. Una toma que
+llega más de media frecuencia antes de su dosis (p. ej. un doble toque) no
+cuenta, pero como en la app mueve la agenda.
+
+`calcular_adherencia` lo hace de una vez para todos los medicamentos y las
+ventanas `ADHERENCIA_VENTANAS` (días hacia atrás desde ahora): lee las tomas
+ordenadas con `values_list(...).iterator()` por bloques, las pasa a arrays de
+NumPy y cuenta con operaciones vectorizadas (la toma anterior de cada toma
+sale de desplazar el array ordenado, `bincount` por medicamento), sin un loop
+de Python por toma. El resultado queda en `AdherenciaMedicamento`, que es lo
+que lee la página de estadísticas.
+
+Necesita las tomas de la ventana más larga: RETENCION_TOMAS_DIAS debe ser
+mayor (ver retencion.py).
+"""
+from datetime import timedelta
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import AdherenciaMedicamento, Medicamento, RegistroToma
+from .recordatorios import fin_tratamiento
+
+
+def medicamentos_evaluables(desde, ahora):
+    """Medicamentos con dosis esperadas entre `desde` y `ahora`."""
+    return (
+        Medicamento.objects
+        .filter(frecuencia_horas__gt=0, created_at__lt=ahora)
+        .filter(Q(duracion_dias=0) | Q(fecha_fin_tratamiento__gte=timezone.localdate(desde)))
+    )
+
+
+def _bloques(iterable, tamano):
+    while bloque := list(islice(iterable, tamano)):
+        yield bloque
+
+
+def _en_grilla(a, freq, n, desde, hasta):
+    """Cuántas de las `n` dosis a, a + freq, ... caen en [desde, hasta)."""
+    k_desde = np.maximum(np.ceil((desde - a) / freq), 0)
+    k_hasta = np.minimum(np.ceil((hasta - a) / freq), n)
+    return np.maximum(k_hasta - k_desde, 0)
+
+
+def calcular_adherencia(ahora=None, lote=100_000):
+    """Recalcula AdherenciaMedicamento y devuelve cuántos medicamentos evaluó."""
+    ahora = ahora or timezone.now()
+    ventanas = sorted(settings.ADHERENCIA_VENTANAS)
+    desde = ahora - timedelta(days=ventanas[-1])
+    tolerancia = settings.ADHERENCIA_TOLERANCIA_MINUTOS * 60
+    t_ahora = ahora.timestamp()
+
+    meds = list(
+        medicamentos_evaluables(desde, ahora).order_by('id')
+        .only('id', 'created_at', 'frecuencia_horas', 'duracion_dias', 'fecha_fin_tratamiento')
+    )
+    if not meds:
+        AdherenciaMedicamento.objects.all().delete()
+        return 0
+
+    ids = np.array([m.id for m in meds], dtype=np.int64)
+    inicio = np.array([m.created_at.timestamp() for m in meds])
+    freq = np.array([m.frecuencia_horas * 3600.0 for m in meds])
+    fin = np.array([fin_tratamiento(m).timestamp() if m.duracion_dias else np.inf for m in meds])
+    # Las dosis cuentan si se debían antes de min(fin, ahora)
+    fin = np.minimum(fin, t_ahora)
+    inicios_ventana = [t_ahora - dias * 86400 for dias in ventanas]
+
+    def posiciones(med_id):
+        pos = np.minimum(np.searchsorted(ids, med_id), len(ids) - 1)
+        return pos, ids[pos] == med_id
+
+    # Una toma puede ir hasta media frecuencia antes de su dosis. La última
+    # toma anterior a lo que se lee solo marca cuándo se debía la siguiente.
+    desde_tomas = desde - timedelta(seconds=freq.max() / 2)
+    ultima = np.full(len(ids), np.nan)
+    anteriores = (
+        RegistroToma.objects.filter(fecha_hora__lt=desde_tomas)
+        .values('medicamento_id').annotate(ultima=Max('fecha_hora')).values_list('medicamento_id', 'ultima')
+    )
+    for med_id, fecha in anteriores:
+        pos, valida = posiciones(med_id)
+        if valida:
+            ultima[pos] = fecha.timestamp()
+
+    esperadas, tomadas, a_tiempo = (np.zeros((len(ventanas), len(ids))) for _ in range(3))
+    tomas = (
+        RegistroToma.objects.filter(fecha_hora__gte=desde_tomas, fecha_hora__lte=ahora)
+        .order_by('medicamento_id', 'fecha_hora').values_list('medicamento_id', 'fecha_hora')
+    )
+    for bloque in _bloques(tomas.iterator(chunk_size=lote), lote):
+        med_id = np.fromiter((f[0] for f in bloque), np.int64, len(bloque))
+        t = np.fromiter((f[1].timestamp() for f in bloque), np.float64, len(bloque))
+        pos, valida = posiciones(med_id)
+        pos, t = pos[valida], t[valida]
+        if not len(t):
+            continue
+        f = freq[pos]
+
+        # La toma anterior del mismo medicamento (o la del bloque anterior)
+        primera = np.r_[True, np.diff(pos) != 0]
+        anterior = np.r_[np.nan, t[:-1]]
+        anterior[primera] = ultima[pos[primera]]
+        debida = np.where(np.isnan(anterior), inicio[pos], anterior + f)
+        # Dosis a la que responde: las k anteriores quedaron sin toma
+        k = np.rint((t - debida) / f)
+        cuenta = k >= 0
+        k = np.maximum(k, 0)
+        dosis = debida + k * f
+        puntual = np.abs(t - dosis) <= tolerancia
+        ultima_del_bloque = np.r_[primera[1:], True]
+        ultima[pos[ultima_del_bloque]] = t[ultima_del_bloque]
+
+        for w, inicio_ventana in enumerate(inicios_ventana):
+            tomada = cuenta & (dosis >= inicio_ventana) & (dosis < fin[pos])
+            omitidas = _en_grilla(debida, f, k, inicio_ventana, fin[pos])
+            esperadas[w] += np.bincount(pos, omitidas + tomada, minlength=len(ids))
+            tomadas[w] += np.bincount(pos, tomada, minlength=len(ids))
+            a_tiempo[w] += np.bincount(pos, tomada & puntual, minlength=len(ids))
+
+    # Después de la última toma, las dosis cuya tolerancia ya pasó quedaron sin toma
+    siguiente = np.where(np.isnan(ultima), inicio, ultima + freq)
+    cerradas = np.minimum(fin, t_ahora - tolerancia)
+    for w, inicio_ventana in enumerate(inicios_ventana):
+        esperadas[w] += _en_grilla(siguiente, freq, np.inf, inicio_ventana, cerradas)
+
+    filas = []
+    for w, dias in enumerate(ventanas):
+        for i in np.flatnonzero(esperadas[w]):
+            filas.append(AdherenciaMedicamento(
+                medicamento_id=int(ids[i]),
+                ventana_dias=dias,
+                esperadas=int(esperadas[w, i]),
+                a_tiempo=int(a_tiempo[w, i]),
+                tardias=int(tomadas[w, i] - a_tiempo[w, i]),
+                omitidas=int(esperadas[w, i] - tomadas[w, i]),
+                calculado_en=ahora,
+            ))
+
+    with transaction.atomic():
+        AdherenciaMedicamento.objects.bulk_create(
+            filas, batch_size=1000, update_conflicts=True,
+            unique_fields=['medicamento', 'ventana_dias'],
+            update_fields=['esperadas', 'a_tiempo', 'tardias', 'omitidas', 'calculado_en'],
+        )
+        # Medicamentos que ya no tienen dosis en la ventana
+        AdherenciaMedicamento.objects.filter(calculado_en__lt=ahora).delete()
+    return len(meds)
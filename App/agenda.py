@@ -0,0 +1,66 @@
+"""
+Cálculo de la agenda de medicamentos (próxima dosis, días restantes).
+
+Se apoya en las columnas desnormalizadas de `Medicamento` (`ultima_toma`,
+`proxima_toma`, `fecha_fin_tratamiento`), así que `snapshot_medicamentos`
+resuelve todos los medicamentos de un queryset en una sola consulta.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+
+def calcular_proxima_toma(med, ahora=None):
+    """
+    Lógica:
+    - Sin tomas previas -> NO hay countdown (remaining=0) y el botón está habilitado.
+    - Con tomas previas  -> countdown hasta última_toma + frecuencia.
+    """
+    now = ahora or timezone.now()
+
+    # 1) Nunca se ha tomado -> permitir tomar ahora
+    if not med.ultima_toma or med.frecuencia_horas in (None, 0):
+        return now, 0, True  # next_due, remaining_seconds, can_take
+
+    # 2) Ya hubo una toma -> próxima según frecuencia (columna proxima_toma)
+    next_due = med.proxima_toma
+    remaining_seconds = max(int((next_due - now).total_seconds()), 0)
+    can_take = remaining_seconds == 0
+    return next_due, remaining_seconds, can_take
+
+
+def calcular_dias_restantes(med, hoy=None):
+    """
+    Días restantes = duracion_dias - días transcurridos desde created_at.
+    Si no hay duracion_dias, retorna None.
+    """
+    if not med.duracion_dias:
+        return None
+
+    hoy = hoy or timezone.localdate()
+    return max((med.fecha_fin() - hoy).days, 0)
+
+
+def info_medicamento(med, ahora=None, hoy=None):
+    """Entrada de la agenda para un medicamento."""
+    proxima, restantes, puede_tomar = calcular_proxima_toma(med, ahora)
+    return {
+        'obj': med,
+        'proxima': proxima,
+        'restantes': restantes,
+        'puede_tomar': puede_tomar,
+        'dias_restantes': calcular_dias_restantes(med, hoy),
+    }
+
+
+def snapshot_medicamentos(medicamentos):
+    """Agenda de todos los medicamentos del queryset en una sola consulta."""
+    ahora = timezone.now()
+    hoy = timezone.localdate()
+    return [info_medicamento(m, ahora, hoy) for m in medicamentos]
+
+
+def rango_del_dia(fecha):
+    """(inicio, fin) del día local `fecha`, para filtrar DateTimeField por rango."""
+    inicio = timezone.make_aware(datetime.combine(fecha, time.min))
+    return inicio, inicio + timedelta(days=1) - timedelta(microseconds=1)
@@ -0,0 +1,304 @@
+"""
+Benchmark de carga contra el URLconf real (`App/urls.py`).
+
+Ejecuta peticiones concurrentes (un hilo por conexión simulada) con el
+cliente de pruebas de Django, que recorre middleware, vistas y templates
+igual que en producción, o contra un servidor local (`--servidor`).
+`ejecutar_carga_async` hace lo mismo a través del handler ASGI, con una
+corrutina por conexión simulada. Lo usa el comando `benchmark`; los datos
+salen de `generar_datos_prueba`.
+"""
+import asyncio
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+
+# nombre -> (método, nombre de la URL, ¿necesita medicamento_id?)
+ENDPOINTS = {
+    'home': ('get', 'home', False),
+    'medicamentos': ('get', 'medicamentos', False),
+    'hidratacion': ('get', 'hidratacion', False),
+    'perfil': ('get', 'perfil_usuario', False),
+    'notificaciones': ('get', 'notificaciones', False),
+    'registrar_toma': ('post', 'registrar_toma', True),
+}
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por interpolación lineal."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = (len(ordenados) - 1) * p / 100
+    i = int(k)
+    if i + 1 >= len(ordenados):
+        return ordenados[-1]
+    return ordenados[i] + (ordenados[i + 1] - ordenados[i]) * (k - i)
+
+
+def resumir(latencias, errores, segundos):
+    """Estadísticas por endpoint: n, errores, p50/p95/p99, media (ms) y req/s."""
+    resumen = {}
+    for nombre in sorted(set(latencias) | set(errores)):
+        ms = latencias.get(nombre, [])
+        resumen[nombre] = {
+            'n': len(ms),
+            'errores': errores.get(nombre, 0),
+            'p50': percentil(ms, 50),
+            'p95': percentil(ms, 95),
+            'p99': percentil(ms, 99),
+            'media': statistics.fmean(ms) if ms else 0.0,
+            'rps': len(ms) / segundos if segundos else 0.0,
+        }
+    return resumen
+
+
+def formatear(resumen, segundos):
+    lineas = [
+        f"{'endpoint':<16}{'n':>7}{'err':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'media':>9}{'req/s':>9}"
+    ]
+    for nombre, r in resumen.items():
+        lineas.append(
+            f"{nombre:<16}{r['n']:>7}{r['errores']:>6}{r['p50']:>9.1f}{r['p95']:>9.1f}"
+            f"{r['p99']:>9.1f}{r['media']:>9.1f}{r['rps']:>9.1f}"
+        )
+    total = sum(r['n'] for r in resumen.values())
+    lineas.append(f"Total: {total} peticiones en {segundos:.2f} s ({total / segundos if segundos else 0:.1f} req/s)")
+    return "\n".join(lineas)
+
+
+class ClienteDjango:
+    """Cliente de pruebas autenticado como `user` (un hilo a la vez)."""
+
+    def __init__(self, user):
+        self.client = Client()
+        self.client.force_login(user)
+
+    def pedir(self, metodo, url):
+        return getattr(self.client, metodo)(url).status_code
+
+
+class ClienteServidor:
+    """Peticiones HTTP reales a un servidor local con la sesión de `user`."""
+
+    def __init__(self, user, base):
+        self.base = base.rstrip('/')
+        cliente = Client()
+        cliente.force_login(user)  # crea la sesión en la misma base que usa el servidor
+        connection.close()  # el cliente no retiene conexiones: sólo cuentan las del servidor
+        self.cookies = {settings.SESSION_COOKIE_NAME: cliente.cookies[settings.SESSION_COOKIE_NAME].value}
+        self.pedir('get', reverse('medicamentos'))  # obtiene la cookie CSRF para los POST
+
+    def pedir(self, metodo, url):
+        headers = {'Cookie': '; '.join(f"{k}={v}" for k, v in self.cookies.items())}
+        if metodo == 'post':
+            headers['X-CSRFToken'] = self.cookies.get(settings.CSRF_COOKIE_NAME, '')
+            headers['Referer'] = self.base + '/'
+        peticion = urllib.request.Request(
+            self.base + url, method=metodo.upper(), headers=headers, data=b'' if metodo == 'post' else None
+        )
+        try:
+            with urllib.request.urlopen(peticion) as respuesta:
+                respuesta.read()
+                estado = respuesta.status
+                cabeceras = respuesta.headers
+        except urllib.error.HTTPError as e:
+            estado, cabeceras = e.code, e.headers
+        for valor in cabeceras.get_all('Set-Cookie') or []:
+            for nombre, morsel in SimpleCookie(valor).items():
+                self.cookies[nombre] = morsel.value
+        return estado
+
+
+class ClienteAsgi:
+    """AsyncClient autenticado como `user`: las peticiones pasan por el handler ASGI."""
+
+    def __init__(self, user):
+        self.user = user
+        self.client = AsyncClient()
+
+    async def iniciar(self):
+        await self.client.aforce_login(self.user)
+        return self
+
+    async def pedir(self, metodo, url):
+        return (await getattr(self.client, metodo)(url)).status_code
+
+
+class MonitorConexiones:
+    """
+    Cuenta las conexiones a la base abiertas durante la carga y los hilos que
+    las abrieron. Con `servidor` y Postgres muestrea además pg_stat_activity
+    para obtener el pico de conexiones que mantuvo el servidor.
+    """
+
+    def __init__(self, servidor=None, intervalo=0.2):
+        self.servidor = servidor
+        self.intervalo = intervalo
+        self.abiertas = 0
+        self.hilos = set()
+        self.pico_postgres = None
+        self._lock = threading.Lock()
+        self._fin = threading.Event()
+        self._muestreador = None
+
+    def __enter__(self):
+        connection_created.connect(self._creada)
+        if self.servidor and connection.vendor == 'postgresql':
+            self._muestreador = threading.Thread(target=self._muestrear, daemon=True)
+            self._muestreador.start()
+        return self
+
+    def __exit__(self, *exc):
+        connection_created.disconnect(self._creada)
+        self._fin.set()
+        if self._muestreador:
+            self._muestreador.join()
+
+    def _creada(self, sender, connection, **kwargs):
+        if self._muestreador and threading.current_thread() is self._muestreador:
+            return
+        with self._lock:
+            self.abiertas += 1
+            self.hilos.add(threading.get_ident())
+
+    def _muestrear(self):
+        self.pico_postgres = 0
+        try:
+            with connection.cursor() as cursor:
+                while not self._fin.wait(self.intervalo):
+                    cursor.execute(
+                        "SELECT count(*) FROM pg_stat_activity "
+                        "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+                    )
+                    self.pico_postgres = max(self.pico_postgres, cursor.fetchone()[0])
+        finally:
+            connection.close()
+
+    def resumen(self):
+        return {'abiertas': self.abiertas, 'hilos': len(self.hilos), 'pico_postgres': self.pico_postgres}
+
+
+def formatear_conexiones(conexiones):
+    linea = f"Conexiones a la base: {conexiones['abiertas']} abiertas desde {conexiones['hilos']} hilos"
+    if conexiones['pico_postgres'] is not None:
+        linea += f"; pico en el servidor (pg_stat_activity): {conexiones['pico_postgres']}"
+    return linea
+
+
+def _repartir(usuarios, endpoints, peticiones, concurrencia):
+    meds_por_usuario = {
+        u.id: list(u.medicamentos.values_list('id', flat=True)) for u in usuarios
+    }
+    tareas = []
+    for nombre in endpoints:
+        metodo, url_name, con_med = ENDPOINTS[nombre]
+        for i in range(peticiones):
+            user = usuarios[i % len(usuarios)]
+            if con_med:
+                meds = meds_por_usuario[user.id]
+                if not meds:
+                    continue
+                url = reverse(url_name, args=[random.choice(meds)])
+            else:
+                url = reverse(url_name)
+            tareas.append((nombre, user, metodo, url))
+    random.shuffle(tareas)
+    return [tareas[i::concurrencia] for i in range(concurrencia)]
+
+
+def ejecutar_carga(usuarios, endpoints, peticiones, concurrencia, servidor=None):
+    """
+    Lanza `peticiones` por endpoint repartidas entre `usuarios`, con
+    `concurrencia` hilos. Devuelve (latencias_ms, errores, segundos, conexiones).
+    """
+    lotes = _repartir(usuarios, endpoints, peticiones, concurrencia)
+    latencias = defaultdict(list)
+    errores = defaultdict(int)
+    lock = threading.Lock()
+    local = threading.local()
+
+    def cliente_para(user):
+        clientes = getattr(local, 'clientes', None)
+        if clientes is None:
+            clientes = local.clientes = {}
+        if user.id not in clientes:
+            clientes[user.id] = ClienteServidor(user, servidor) if servidor else ClienteDjango(user)
+        return clientes[user.id]
+
+    def ejecutar(tarea):
+        nombre, user, metodo, url = tarea
+        cliente = cliente_para(user)
+        inicio = time.perf_counter()
+        try:
+            estado = cliente.pedir(metodo, url)
+        except Exception:
+            estado = 599
+        ms = (time.perf_counter() - inicio) * 1000
+        with lock:
+            if estado >= 400:
+                errores[nombre] += 1
+            else:
+                latencias[nombre].append(ms)
+
+    def ejecutar_y_cerrar(lote):
+        try:
+            for tarea in lote:
+                ejecutar(tarea)
+        finally:
+            connection.close()  # cada hilo abre su propia conexión
+
+    with MonitorConexiones(servidor) as monitor:
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            list(pool.map(ejecutar_y_cerrar, lotes))
+        segundos = time.perf_counter() - inicio
+    return latencias, errores, segundos, monitor.resumen()
+
+
+def ejecutar_carga_async(usuarios, endpoints, peticiones, concurrencia):
+    """
+    Como `ejecutar_carga`, pero con `concurrencia` corrutinas contra el
+    handler ASGI. Las vistas async (VISTAS_ASYNC) corren en el event loop; las
+    síncronas y el ORM async pasan por el hilo único de sync_to_async.
+    """
+    lotes = _repartir(usuarios, endpoints, peticiones, concurrencia)
+    latencias = defaultdict(list)
+    errores = defaultdict(int)
+
+    async def ejecutar_lote(lote, clientes):
+        for nombre, user, metodo, url in lote:
+            if user.id not in clientes:
+                clientes[user.id] = await ClienteAsgi(user).iniciar()
+            inicio = time.perf_counter()
+            try:
+                estado = await clientes[user.id].pedir(metodo, url)
+            except Exception:
+                estado = 599
+            ms = (time.perf_counter() - inicio) * 1000
+            if estado >= 400:
+                errores[nombre] += 1
+            else:
+                latencias[nombre].append(ms)
+
+    async def principal():
+        await asyncio.gather(*(ejecutar_lote(lote, {}) for lote in lotes))
+
+    with MonitorConexiones() as monitor:
+        inicio = time.perf_counter()
+        asyncio.run(principal())
+        segundos = time.perf_counter() - inicio
+    return latencias, errores, segundos, monitor.resumen()
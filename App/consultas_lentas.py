@@ -0,0 +1,128 @@
+"""
+Registro de consultas lentas.
+
+`registro` es un execute_wrapper que se instala en cada conexión (ver
+signals.py) cuando `CONSULTAS_LENTAS_MS` > 0. Toda consulta que supere el
+umbral se registra en el logger `App.consultas_lentas` con el archivo y la
+línea de App/ que la originó, el SQL normalizado y su duración. La primera
+vez que aparece cada huella de SQL se adjunta su plan (EXPLAIN ANALYZE en
+Postgres, EXPLAIN QUERY PLAN en SQLite).
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+
+
+logger = logging.getLogger('App.consultas_lentas')
+
+DIRECTORIO_APP = Path(__file__).resolve().parent
+# Módulos de infraestructura que nunca son el "origen" de una consulta
+IGNORAR = {'consultas_lentas.py', 'middleware.py', 'metricas.py'}
+
+_explicadas = set()
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def normalizar(sql):
+    """SQL sin literales ni listas IN variables, para agrupar consultas iguales."""
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    sql = re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+    sql = sql.replace('%s', '?')
+    sql = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(...)', sql)
+    return re.sub(r'\s+', ' ', sql).strip()
+
+
+def huella(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode()).hexdigest()[:12]
+
+
+def origen(maximo=3):
+    """
+    Frames de App/ que llevaron a la consulta, del más interno al más
+    externo: 'App/agenda.py:60 en snapshot_medicamentos <- App/views.py:185
+    en medicamentos_view'.
+    """
+    frames = []
+    for frame in reversed(traceback.extract_stack()):
+        ruta = Path(frame.filename)
+        if DIRECTORIO_APP in ruta.parents and ruta.name not in IGNORAR:
+            archivo = ruta.relative_to(DIRECTORIO_APP.parent).as_posix()
+            frames.append(f"{archivo}:{frame.lineno} en {frame.name}")
+            if len(frames) == maximo:
+                break
+    return " <- ".join(frames) or "desconocido"
+
+
+def explicar(conexion, sql, params):
+    """Plan de ejecución de la consulta, o None si no se pudo obtener."""
+    if conexion.vendor == 'postgresql':
+        analizar = settings.CONSULTAS_LENTAS_ANALYZE and sql.lstrip().upper().startswith('SELECT')
+        prefijo = 'EXPLAIN (ANALYZE, BUFFERS) ' if analizar else 'EXPLAIN '
+    elif conexion.vendor == 'sqlite':
+        prefijo = 'EXPLAIN QUERY PLAN '
+    else:
+        prefijo = 'EXPLAIN '
+
+    _local.explicando = True
+    try:
+        # Savepoint: en Postgres un EXPLAIN fallido no debe abortar la transacción del request.
+        with transaction.atomic(using=conexion.alias):
+            with conexion.cursor() as cursor:
+                cursor.execute(prefijo + sql, params)
+                filas = cursor.fetchall()
+    except Exception:
+        return None
+    finally:
+        _local.explicando = False
+    return "\n".join(" ".join(str(c) for c in fila) for fila in filas)
+
+
+def registro(execute, sql, params, many, context):
+    if getattr(_local, 'explicando', False):
+        return execute(sql, params, many, context)
+
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        ms = (time.perf_counter() - inicio) * 1000
+        umbral = settings.CONSULTAS_LENTAS_MS
+        if umbral and ms >= umbral:
+            registrar(context['connection'], sql, params, many, ms)
+
+
+def registrar(conexion, sql, params, many, ms):
+    normalizado = normalizar(sql)
+    id_huella = huella(normalizado)
+    with _lock:
+        nueva = id_huella not in _explicadas
+        _explicadas.add(id_huella)
+
+    plan = explicar(conexion, sql, params) if nueva and not many else None
+    mensaje = f"Consulta lenta {ms:.1f} ms [{id_huella}] {origen()}\n  SQL: {normalizado}"
+    if plan:
+        mensaje += "\n  Plan:\n    " + plan.replace("\n", "\n    ")
+    logger.warning(
+        mensaje,
+        extra={'duracion_ms': ms, 'huella': id_huella, 'sql_normalizado': normalizado},
+    )
+
+
+def instalar(conexion):
+    """
+    Agrega el wrapper a la conexión (una sola vez) como el más externo: su
+    duración incluye la de los demás wrappers, p. ej. el de métricas.
+    """
+    if registro not in conexion.execute_wrappers:
+        # Al principio de la lista (Django la aplica al revés, así queda por
+        # fuera de todos): `connection.execute_wrapper()` hace pop() del
+        # último al salir, así no se quita este por error.
+        conexion.execute_wrappers.insert(0, registro)
@@ -0,0 +1,8 @@
+from . import notificaciones
+
+
+def token_notificaciones(request):
+    """Token firmado para el polling de notificaciones sin sesión."""
+    if not request.user.is_authenticated:
+        return {}
+    return {'token_notificaciones': notificaciones.emitir_token(request.user.id)}
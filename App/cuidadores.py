@@ -0,0 +1,92 @@
+"""
+Panel del cuidador.
+
+Un paciente comparte sus datos con un cuidador (`RelacionCuidador`, alta
+desde su perfil). El panel lista los pacientes por páginas con paginación
+keyset: `?despues=<username>` pide los que siguen al último mostrado, sin
+OFFSET, así la página 10 cuesta lo mismo que la primera.
+
+Cada página sale de un número fijo de consultas sin importar cuántos
+pacientes ni medicamentos haya:
+
+1. pacientes con su perfil (`select_related`), la próxima dosis (`Min` de
+   `proxima_toma` de los medicamentos activos) y las dosis atrasadas de hoy
+   (`Subquery` con `Count` sobre `RecordatorioMedicamento`, para no
+   multiplicar filas con el join de medicamentos);
+2. medicamentos activos (`Prefetch` ordenado por `proxima_toma`);
+3. registro de hidratación de hoy (`Prefetch` filtrado por fecha).
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Count, F, IntegerField, Min, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .agenda import rango_del_dia
+from .models import Medicamento, PerfilUsuario, RecordatorioMedicamento, RegistroHidratacion
+
+
+def _hidratacion(paciente):
+    """(vasos, meta, progreso) de hoy; sin registro la meta sale del perfil."""
+    if paciente.hidratacion_hoy:
+        registro = paciente.hidratacion_hoy[0]
+        return registro.vasos_tomados, registro.meta_vasos, registro.progreso() if registro.meta_vasos else 0
+    try:
+        meta = paciente.perfilusuario.calcular_meta_agua_vasos()
+    except PerfilUsuario.DoesNotExist:
+        meta = 8
+    return 0, meta, 0
+
+
+def pacientes(cuidador_id, despues=None, por_pagina=None, ahora=None):
+    """
+    Una página de pacientes de `cuidador_id` ordenados por username, después
+    de `despues`. Devuelve (pacientes, username para la página siguiente o None).
+    """
+    por_pagina = por_pagina or settings.CUIDADOR_PACIENTES_POR_PAGINA
+    ahora = ahora or timezone.now()
+    hoy = timezone.localdate(ahora)
+    inicio_dia, _ = rango_del_dia(hoy)
+
+    atrasadas = (
+        RecordatorioMedicamento.objects
+        .filter(
+            medicamento__usuario=OuterRef('pk'), medicamento__activo=True, tomado=False,
+            hora__gte=inicio_dia, hora__lt=ahora,
+        )
+        .order_by()
+        .values('medicamento__usuario')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    consulta = (
+        User.objects
+        .filter(cuidadores__cuidador_id=cuidador_id)
+        .select_related('perfilusuario')
+        .annotate(
+            proxima_dosis=Min('medicamentos__proxima_toma', filter=Q(medicamentos__activo=True)),
+            dosis_atrasadas=Coalesce(Subquery(atrasadas, output_field=IntegerField()), 0),
+        )
+        .prefetch_related(
+            Prefetch(
+                'medicamentos',
+                queryset=Medicamento.objects.filter(activo=True)
+                .order_by(F('proxima_toma').asc(nulls_last=True), 'nombre'),
+                to_attr='medicamentos_activos',
+            ),
+            Prefetch(
+                'hidrataciones', queryset=RegistroHidratacion.objects.filter(fecha=hoy), to_attr='hidratacion_hoy',
+            ),
+        )
+        .order_by('username')
+    )
+    if despues:
+        consulta = consulta.filter(username__gt=despues)
+
+    # Una fila de más indica si hay página siguiente
+    filas = list(consulta[:por_pagina + 1])
+    siguiente = filas[por_pagina - 1].username if len(filas) > por_pagina else None
+    filas = filas[:por_pagina]
+    for paciente in filas:
+        paciente.vasos_hoy, paciente.meta_vasos_hoy, paciente.progreso_agua = _hidratacion(paciente)
+    return filas, siguiente
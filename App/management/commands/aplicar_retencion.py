@@ -0,0 +1,36 @@
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from App.retencion import aplicar_retencion
+
+
+class Command(BaseCommand):
+    help = (
+        "Pasa las tomas, notificaciones y dosis más viejas que RETENCION_*_DIAS a los "
+        "resúmenes diarios y las borra por lotes. Pensado para un cron diario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000, help="Filas por transacción.")
+        parser.add_argument(
+            '--archivo', help="Directorio donde agregar las filas borradas "
+                              "(tomas-AAAA-MM-DD.jsonl y notificaciones-AAAA-MM-DD.jsonl).",
+        )
+
+    def handle(self, *args, **options):
+        with ExitStack() as pila:
+            archivos = {}
+            if options['archivo']:
+                directorio = Path(options['archivo'])
+                directorio.mkdir(parents=True, exist_ok=True)
+                hoy = timezone.localdate()
+                for tabla in ('tomas', 'notificaciones'):
+                    archivos[tabla] = pila.enter_context(
+                        open(directorio / f"{tabla}-{hoy}.jsonl", 'a', encoding='utf-8')
+                    )
+            borradas = aplicar_retencion(lote=options['lote'], archivos=archivos)
+        for tabla, n in borradas.items():
+            self.stdout.write(f"{n} {tabla} depuradas")
@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from App.benchmark import (
+    ENDPOINTS, ejecutar_carga, ejecutar_carga_async, formatear, formatear_conexiones, resumir,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark concurrente de los endpoints (p50/p95/p99 y req/s). "
+        "Usa los usuarios creados con generar_datos_prueba."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prefijo', default='bench', help="Prefijo de los usuarios a usar.")
+        parser.add_argument('--usuarios', type=int, default=20, help="Cuántos usuarios distintos simular.")
+        parser.add_argument('--peticiones', type=int, default=200, help="Peticiones por endpoint.")
+        parser.add_argument('--concurrencia', type=int, default=8)
+        parser.add_argument(
+            '--endpoints', nargs='+', choices=sorted(ENDPOINTS),
+            default=['home', 'medicamentos', 'hidratacion', 'perfil', 'notificaciones'],
+            help="registrar_toma escribe en la base; se incluye sólo si se pide.",
+        )
+        parser.add_argument(
+            '--servidor', help="URL de un servidor local (p. ej. http://127.0.0.1:8000). "
+                               "Sin esto se usa el cliente de pruebas en proceso.",
+        )
+        parser.add_argument(
+            '--modo', choices=['wsgi', 'asgi', 'ambos'], default='wsgi',
+            help="Handler en proceso: wsgi (hilos), asgi (corrutinas; usa las vistas async si "
+                 "VISTAS_ASYNC=True) o ambos (asgi en un subproceso con VISTAS_ASYNC=True).",
+        )
+        parser.add_argument('--json', action='store_true', help="Imprime el resultado en JSON.")
+
+    def handle(self, *args, **options):
+        usuarios = list(
+            User.objects.filter(username__startswith=f"{options['prefijo']}_").order_by('id')[:options['usuarios']]
+        )
+        if not usuarios:
+            raise CommandError(
+                f"No hay usuarios '{options['prefijo']}_*'. Ejecuta primero: manage.py generar_datos_prueba"
+            )
+
+        if options['servidor'] and options['modo'] != 'wsgi':
+            raise CommandError("Con --servidor el modo lo decide el despliegue; no uses --modo.")
+        if options['modo'] == 'asgi' and not settings.VISTAS_ASYNC:
+            self.stderr.write("Aviso: VISTAS_ASYNC=False, se miden las vistas síncronas bajo ASGI.")
+
+        if options['modo'] == 'ambos':
+            resultados = {'wsgi': self.medir('wsgi', usuarios, options), 'asgi': self.subproceso_asgi(options)}
+        else:
+            resultados = {options['modo']: self.medir(options['modo'], usuarios, options)}
+
+        if options['json']:
+            salida = resultados[options['modo']] if options['modo'] != 'ambos' else resultados
+            self.stdout.write(json.dumps(salida, indent=2))
+            return
+        for modo, r in resultados.items():
+            if len(resultados) > 1:
+                self.stdout.write(f"\n== {modo.upper()} ==")
+            self.stdout.write(formatear(r['endpoints'], r['segundos']))
+            self.stdout.write(formatear_conexiones(r['conexiones']))
+        if len(resultados) > 1:
+            self.stdout.write("\n" + self.comparar(resultados['wsgi'], resultados['asgi']))
+
+    def medir(self, modo, usuarios, options):
+        # El cliente de pruebas usa el host 'testserver'
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            if modo == 'asgi':
+                latencias, errores, segundos, conexiones = ejecutar_carga_async(
+                    usuarios, options['endpoints'], options['peticiones'], options['concurrencia'],
+                )
+            else:
+                latencias, errores, segundos, conexiones = ejecutar_carga(
+                    usuarios, options['endpoints'], options['peticiones'],
+                    options['concurrencia'], servidor=options['servidor'],
+                )
+        return {'segundos': segundos, 'conexiones': conexiones, 'endpoints': resumir(latencias, errores, segundos)}
+
+    def subproceso_asgi(self, options):
+        """El URLconf elige las vistas al importarse: ASGI se mide en otro proceso."""
+        comando = [
+            sys.executable, '-m', 'django', 'benchmark', '--modo', 'asgi', '--json',
+            '--prefijo', options['prefijo'], '--usuarios', str(options['usuarios']),
+            '--peticiones', str(options['peticiones']), '--concurrencia', str(options['concurrencia']),
+            '--endpoints', *options['endpoints'],
+        ]
+        entorno = {**os.environ, 'VISTAS_ASYNC': 'True'}
+        proceso = subprocess.run(comando, env=entorno, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if proceso.returncode:
+            raise CommandError(f"Falló el benchmark ASGI:\n{proceso.stderr}")
+        return json.loads(proceso.stdout)
+
+    def comparar(self, wsgi, asgi):
+        lineas = [f"{'endpoint':<16}{'req/s wsgi':>12}{'req/s asgi':>12}{'p95 wsgi':>10}{'p95 asgi':>10}"]
+        for nombre in wsgi['endpoints']:
+            w, a = wsgi['endpoints'][nombre], asgi['endpoints'].get(nombre, {})
+            lineas.append(
+                f"{nombre:<16}{w['rps']:>12.1f}{a.get('rps', 0):>12.1f}{w['p95']:>10.1f}{a.get('p95', 0):>10.1f}"
+            )
+        lineas.append(
+            f"Conexiones a la base: wsgi {wsgi['conexiones']['abiertas']}, asgi {asgi['conexiones']['abiertas']}"
+        )
+        return "\n".join(lineas)
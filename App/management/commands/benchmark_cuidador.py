@@ -0,0 +1,69 @@
+import re
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from App.benchmark import percentil
+from App.models import PerfilUsuario, RelacionCuidador
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark del panel del cuidador: recorre todas las páginas de un cuidador "
+        "con N pacientes y mide consultas y latencia por página."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=500)
+        parser.add_argument('--prefijo', default='paciente', help="Prefijo de los pacientes sintéticos.")
+        parser.add_argument('--repeticiones', type=int, default=5, help="Veces que se recorre el panel completo.")
+
+    def handle(self, *args, **options):
+        prefijo, n = options['prefijo'], options['pacientes']
+        existentes = User.objects.filter(username__startswith=f"{prefijo}_").count()
+        if existentes < n:
+            call_command(
+                'generar_datos_prueba', usuarios=n - existentes, prefijo=prefijo, medicamentos=3,
+                tomas=30, dias_hidratacion=1, notificaciones=0, stdout=self.stdout,
+            )
+
+        cuidador, _ = User.objects.get_or_create(username=f"cuidador_{prefijo}")
+        PerfilUsuario.objects.update_or_create(user=cuidador, defaults={'es_cuidador': True})
+        pacientes = User.objects.filter(username__startswith=f"{prefijo}_").order_by('id')[:n]
+        RelacionCuidador.objects.bulk_create(
+            (RelacionCuidador(cuidador=cuidador, paciente=p) for p in pacientes), ignore_conflicts=True,
+        )
+
+        client = Client()
+        client.force_login(cuidador)
+        latencias, consultas, paginas = [], set(), 0
+        # El cliente de pruebas usa el host 'testserver'
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for _ in range(options['repeticiones']):
+                url, paginas = reverse('panel_cuidador'), 0
+                while url:
+                    with CaptureQueriesContext(connection) as capturadas:
+                        inicio = time.perf_counter()
+                        response = client.get(url)
+                        latencias.append((time.perf_counter() - inicio) * 1000)
+                    consultas.add(len(capturadas))
+                    paginas += 1
+                    # Fuera del runner de tests no hay response.context: se sigue el enlace
+                    siguiente = re.search(r'href="(\?despues=[^"]+)"', response.content.decode())
+                    url = reverse('panel_cuidador') + siguiente[1] if siguiente else None
+
+        total = RelacionCuidador.objects.filter(cuidador=cuidador).count()
+        self.stdout.write(f"Pacientes: {total} en {paginas} páginas de {settings.CUIDADOR_PACIENTES_POR_PAGINA}")
+        self.stdout.write(f"Consultas por página: {sorted(consultas)}")
+        self.stdout.write(
+            f"Latencia por página: p50 {percentil(latencias, 50):.1f} ms, p95 {percentil(latencias, 95):.1f} ms, "
+            f"media {statistics.fmean(latencias):.1f} ms"
+        )
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from App.adherencia import calcular_adherencia
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula la adherencia de todos los medicamentos en las ventanas "
+        "ADHERENCIA_VENTANAS (tabla AdherenciaMedicamento). Pensado para un cron diario."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=100_000, help="Tomas leídas por bloque.")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        evaluados = calcular_adherencia(lote=options['lote'])
+        self.stdout.write(f"{evaluados} medicamentos evaluados en {time.perf_counter() - inicio:.1f} s")
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from App.recordatorios import desactivar_tratamientos_terminados
+
+
+class Command(BaseCommand):
+    help = (
+        "Desactiva los medicamentos cuyo tratamiento terminó (un solo UPDATE). "
+        "El programador de recordatorios lo hace una vez por día."
+    )
+
+    def handle(self, *args, **options):
+        desactivados = desactivar_tratamientos_terminados()
+        self.stdout.write(f"{desactivados} tratamientos desactivados")
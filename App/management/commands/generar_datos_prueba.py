@@ -0,0 +1,126 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from App.models import (
+    Medicamento, Notificacion, PerfilUsuario, RegistroHidratacion, RegistroToma,
+)
+
+
+LOTE = 5000
+
+
+class Command(BaseCommand):
+    help = "Genera usuarios sintéticos con medicamentos, tomas, hidratación y notificaciones (bulk_create)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=100)
+        parser.add_argument('--medicamentos', type=int, default=5, help="Medicamentos por usuario.")
+        parser.add_argument('--tomas', type=int, default=500, help="Tomas históricas por usuario.")
+        parser.add_argument('--dias-hidratacion', type=int, default=180, help="Días de historial de agua por usuario.")
+        parser.add_argument('--notificaciones', type=int, default=1000, help="Notificaciones históricas por usuario.")
+        parser.add_argument('--prefijo', default='bench', help="Prefijo de los nombres de usuario.")
+        parser.add_argument('--password', default='bench-password-123')
+        parser.add_argument('--semilla', type=int, default=0)
+
+    def handle(self, *args, **options):
+        random.seed(options['semilla'])
+        prefijo = options['prefijo']
+        inicio_id = User.objects.filter(username__startswith=f"{prefijo}_").count()
+        password = make_password(options['password'])  # un solo hash para todos
+
+        creados = 0
+        total = options['usuarios']
+        # Por bloques de usuarios para acotar memoria con N grandes
+        por_bloque = max(1, LOTE // max(1, options['tomas']))
+        while creados < total:
+            n = min(por_bloque, total - creados)
+            with transaction.atomic():
+                self.generar_bloque(
+                    [f"{prefijo}_{inicio_id + creados + i}" for i in range(n)], password, options
+                )
+            creados += n
+            self.stdout.write(f"{creados}/{total} usuarios")
+
+        self.stdout.write(self.style.SUCCESS(f"Listo: {total} usuarios con prefijo '{prefijo}_'."))
+
+    def generar_bloque(self, usernames, password, options):
+        ahora = timezone.now()
+        hoy = timezone.localdate()
+
+        users = User.objects.bulk_create(User(username=u, password=password) for u in usernames)
+        PerfilUsuario.objects.bulk_create(
+            PerfilUsuario(
+                user=u,
+                peso_kg=random.randint(50, 100),
+                altura_cm=random.randint(150, 195),
+                sexo=random.choice('MF'),
+                nivel_actividad=random.choice(['sedentario', 'ligero', 'moderado', 'intenso']),
+                recordatorio_horas=random.choice([1, 2, 3]),
+            )
+            for u in users
+        )
+
+        meds = []
+        for u in users:
+            for i in range(options['medicamentos']):
+                med = Medicamento(
+                    usuario=u,
+                    nombre=f"Medicamento {i}",
+                    dosis=f"{random.choice([1, 2])} comprimido(s)",
+                    frecuencia_horas=random.choice([6, 8, 12, 24]),
+                    duracion_dias=random.choice([7, 14, 30, 90]),
+                )
+                med.calcular_agenda()  # bulk_create no llama a save()
+                meds.append(med)
+        meds = Medicamento.objects.bulk_create(meds)
+
+        # Tomas históricas repartidas entre los medicamentos de cada usuario
+        tomas = []
+        if options['medicamentos']:
+            for idx in range(len(users)):
+                propios = meds[idx * options['medicamentos']:(idx + 1) * options['medicamentos']]
+                for k in range(options['tomas']):
+                    med = propios[k % len(propios)]
+                    horas = k // len(propios) * med.frecuencia_horas + random.random()
+                    tomas.append(RegistroToma(medicamento=med, fecha_hora=ahora - timedelta(hours=horas)))
+        RegistroToma.objects.bulk_create(tomas, batch_size=LOTE)
+
+        # La agenda desnormalizada se calcula en Python (bulk_create no dispara signals)
+        ultimas = {}
+        for t in tomas:
+            actual = ultimas.get(t.medicamento_id)
+            if actual is None or t.fecha_hora > actual:
+                ultimas[t.medicamento_id] = t.fecha_hora
+        for med in meds:
+            med.ultima_toma = ultimas.get(med.id)
+            med.calcular_agenda()
+        Medicamento.objects.bulk_update(meds, Medicamento.CAMPOS_AGENDA, batch_size=LOTE)
+
+        RegistroHidratacion.objects.bulk_create(
+            (
+                RegistroHidratacion(
+                    usuario=u, fecha=hoy - timedelta(days=d),
+                    vasos_tomados=random.randint(0, 12), meta_vasos=10,
+                )
+                for u in users for d in range(1, options['dias_hidratacion'] + 1)
+            ),
+            batch_size=LOTE,
+        )
+
+        tipos = ['agua', 'medicamento', 'resumen']
+        Notificacion.objects.bulk_create(
+            (
+                Notificacion(
+                    usuario=u, tipo=tipos[k % 3], mensaje="Notificación histórica",
+                    fecha_envio=ahora - timedelta(hours=k), enviado=True,
+                )
+                for u in users for k in range(1, options['notificaciones'] + 1)
+            ),
+            batch_size=LOTE,
+        )
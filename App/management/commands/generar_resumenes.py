@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from App.resumen_diario import generar_resumenes
+
+
+class Command(BaseCommand):
+    help = "Crea el resumen diario de medicamentos de todos los usuarios que lo tienen activado."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help="Día del resumen (AAAA-MM-DD). Por defecto, hoy.")
+        parser.add_argument('--lote', type=int, default=1000, help="Usuarios por lote.")
+
+    def handle(self, *args, **options):
+        hoy = None
+        if options['fecha']:
+            try:
+                hoy = date.fromisoformat(options['fecha'])
+            except ValueError:
+                raise CommandError("--fecha debe tener el formato AAAA-MM-DD")
+        creados = generar_resumenes(hoy, lote=options['lote'])
+        self.stdout.write(f"{creados} resúmenes creados")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from App.recordatorios import Programador
+
+
+class Command(BaseCommand):
+    help = "Proceso de fondo que crea los recordatorios de medicamentos e hidratación cuando vencen."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--resync', type=int, default=60,
+            help="Segundos entre recargas desde la base (dosis próximas y perfiles cambiados).",
+        )
+        parser.add_argument(
+            '--una-vez', action='store_true',
+            help="Procesa lo vencido una sola vez y termina (útil desde cron).",
+        )
+
+    def handle(self, *args, **options):
+        programador = Programador(resync=options['resync'], stdout=self.stdout)
+        try:
+            programador.ejecutar(una_vez=options['una_vez'])
+        except KeyboardInterrupt:
+            self.stdout.write("Programador detenido.")
@@ -0,0 +1,47 @@
+import io
+import pstats
+import re
+import statistics
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# <fecha>-<vista>-<ms>ms-<pid>.prof (ver PerfiladorMiddleware)
+NOMBRE_PERFIL = re.compile(r'^\d{8}-\d{6}-\d+-(?P<vista>.+)-(?P<ms>\d+)ms-\d+\.prof$')
+
+
+class Command(BaseCommand):
+    help = "Agrega los perfiles guardados por PerfiladorMiddleware y muestra las funciones más costosas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=None, help="Directorio de perfiles (por defecto PERFILADOR_DIR).")
+        parser.add_argument('--vista', help="Sólo perfiles de esta vista (nombre de la URL).")
+        parser.add_argument('--top', type=int, default=25)
+        parser.add_argument('--orden', choices=['cumulative', 'tottime', 'ncalls'], default='cumulative')
+
+    def handle(self, *args, **options):
+        directorio = Path(options['dir'] or settings.PERFILADOR_DIR)
+        archivos = []
+        tiempos = defaultdict(list)
+        for archivo in sorted(directorio.glob('*.prof')):
+            m = NOMBRE_PERFIL.match(archivo.name)
+            if not m or (options['vista'] and m['vista'] != options['vista']):
+                continue
+            archivos.append(str(archivo))
+            tiempos[m['vista']].append(int(m['ms']))
+
+        if not archivos:
+            raise CommandError(f"No hay perfiles en {directorio}.")
+
+        self.stdout.write(f"{'vista':<24}{'perfiles':>9}{'mediana ms':>12}{'máx ms':>9}")
+        for vista, ms in sorted(tiempos.items()):
+            self.stdout.write(f"{vista:<24}{len(ms):>9}{statistics.median(ms):>12.0f}{max(ms):>9}")
+        self.stdout.write("")
+
+        salida = io.StringIO()
+        stats = pstats.Stats(*archivos, stream=salida)
+        stats.strip_dirs().sort_stats(options['orden']).print_stats(options['top'])
+        self.stdout.write(salida.getvalue())
@@ -0,0 +1,91 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from App.agenda import rango_del_dia
+from App.models import Medicamento, Notificacion, RegistroHidratacion, RegistroToma
+from App.recordatorios import perfiles_programables, recordatorios_pendientes
+
+
+def consultas_frecuentes():
+    """
+    (descripción, queryset, índices aceptados) de las consultas calientes de
+    las vistas y del programador. Basta con que el plan mencione uno de los
+    índices (en SQLite la restricción única aparece como sqlite_autoindex).
+    """
+    usuario_id = User.objects.values_list('id', flat=True).first() or 1
+    medicamento_id = Medicamento.objects.values_list('id', flat=True).first() or 1
+    ahora = timezone.now()
+    hoy = timezone.localdate()
+    return [
+        (
+            "obtener_notificaciones: pendientes del usuario",
+            Notificacion.objects.filter(usuario_id=usuario_id, enviado=False),
+            ['notif_pendientes_idx'],
+        ),
+        (
+            "generar_resumenes: resumen del día",
+            Notificacion.objects.filter(
+                usuario_id=usuario_id, tipo='resumen', fecha_envio__range=rango_del_dia(hoy)
+            ),
+            ['notif_usuario_tipo_fecha_idx'],
+        ),
+        (
+            "programador: último aviso de agua",
+            Notificacion.objects.filter(usuario_id=usuario_id, tipo='agua').order_by('-fecha_envio')[:1],
+            ['notif_usuario_tipo_fecha_idx'],
+        ),
+        (
+            "agenda: última toma del medicamento",
+            RegistroToma.objects.filter(medicamento_id=medicamento_id).order_by('-fecha_hora')[:1],
+            ['toma_medicamento_fecha_idx'],
+        ),
+        (
+            "hidratacion_view: registro del día",
+            RegistroHidratacion.objects.filter(usuario_id=usuario_id, fecha=hoy),
+            ['hidratacion_usuario_fecha_uniq', 'sqlite_autoindex_App_registrohidratacion'],
+        ),
+        (
+            "desactivar_tratamientos: tratamientos terminados",
+            Medicamento.objects.filter(activo=True, duracion_dias__gt=0, fecha_fin_tratamiento__lt=hoy),
+            ['fecha_fin_tratamiento'],
+        ),
+        (
+            "programador: dosis que vencen en el próximo minuto (todos los usuarios)",
+            recordatorios_pendientes(ahora - timedelta(hours=1), ahora + timedelta(minutes=1)),
+            ['recordatorio_pendiente_idx'],
+        ),
+        (
+            "programador: perfiles cambiados desde la última recarga",
+            perfiles_programables().filter(updated_at__gte=ahora),
+            ['perfil_actualizado_idx'],
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta EXPLAIN sobre las consultas frecuentes y verifica que usen los índices esperados. "
+        "Pensado para SQLite: en PostgreSQL, con tablas chicas el planner puede preferir un seq scan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--plan', action='store_true', help="Muestra el plan completo de cada consulta.")
+
+    def handle(self, *args, **options):
+        fallas = 0
+        for descripcion, queryset, indices in consultas_frecuentes():
+            plan = queryset.explain()
+            ok = any(indice in plan for indice in indices)
+            fallas += not ok
+            estado = self.style.SUCCESS("OK   ") if ok else self.style.ERROR("FALLA")
+            self.stdout.write(f"{estado} {descripcion}")
+            if options['plan'] or not ok:
+                self.stdout.write("      " + plan.replace("\n", "\n      "))
+
+        if fallas:
+            raise CommandError(f"{fallas} consulta(s) no usan el índice esperado ({connection.vendor}).")
+        self.stdout.write(f"Todas las consultas usan sus índices ({connection.vendor}).")
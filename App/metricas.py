@@ -0,0 +1,160 @@
+"""
+Métricas por vista en formato de texto de Prometheus.
+
+Cada proceso (worker de gunicorn) acumula sus contadores en memoria y cada
+`METRICAS_FLUSH_SEGUNDOS` los vuelca a `METRICAS_DIR/<pid>-<inicio>.json`
+con un reemplazo atómico. El endpoint /metrics suma los archivos de todos
+los procesos, así que no hace falta coordinación entre workers. Conviene
+vaciar `METRICAS_DIR` en cada despliegue.
+
+Además de las vistas cuenta aciertos y fallos de las caches de la aplicación
+(`registrar_cache`), p. ej. el tablero de `home`.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _vacia():
+    return {
+        'peticiones': 0,
+        'segundos': 0.0,
+        'buckets': [0] * len(BUCKETS),
+        'consultas': 0,
+        'db_segundos': 0.0,
+    }
+
+
+_lock = threading.Lock()
+_vistas = defaultdict(_vacia)
+_caches = defaultdict(lambda: {'aciertos': 0, 'fallos': 0})
+_archivo = f"{os.getpid()}-{int(time.time())}.json"
+_ultimo_volcado = 0.0
+
+
+def registrar(vista, segundos, consultas, db_segundos):
+    """Acumula una petición atendida por `vista` (nombre de la URL)."""
+    with _lock:
+        m = _vistas[vista]
+        m['peticiones'] += 1
+        m['segundos'] += segundos
+        m['consultas'] += consultas
+        m['db_segundos'] += db_segundos
+        for i, limite in enumerate(BUCKETS):
+            if segundos <= limite:
+                m['buckets'][i] += 1
+        volcar = _toca_volcar()
+    if volcar:
+        volcar_a_disco()
+
+
+def registrar_cache(nombre, acierto):
+    """Cuenta un acierto o un fallo de la cache `nombre`."""
+    with _lock:
+        _caches[nombre]['aciertos' if acierto else 'fallos'] += 1
+        volcar = _toca_volcar()
+    if volcar:
+        volcar_a_disco()
+
+
+def _toca_volcar():
+    """Con `_lock` tomado: True cada METRICAS_FLUSH_SEGUNDOS."""
+    global _ultimo_volcado
+    ahora = time.monotonic()
+    if ahora - _ultimo_volcado < settings.METRICAS_FLUSH_SEGUNDOS:
+        return False
+    _ultimo_volcado = ahora
+    return True
+
+
+def reiniciar():
+    """Vacía los contadores de este proceso (tests)."""
+    with _lock:
+        _vistas.clear()
+        _caches.clear()
+
+
+def volcar_a_disco():
+    """Escribe el estado de este proceso en su archivo (reemplazo atómico)."""
+    with _lock:
+        datos = json.dumps({'vistas': _vistas, 'caches': _caches})
+    directorio = Path(settings.METRICAS_DIR)
+    directorio.mkdir(parents=True, exist_ok=True)
+    temporal = directorio / f".{_archivo}.tmp"
+    temporal.write_text(datos)
+    os.replace(temporal, directorio / _archivo)
+
+
+def leer_todos():
+    """Suma las métricas de todos los procesos: (vistas, caches)."""
+    volcar_a_disco()
+    total = defaultdict(_vacia)
+    caches = defaultdict(lambda: {'aciertos': 0, 'fallos': 0})
+    for archivo in Path(settings.METRICAS_DIR).glob('*.json'):
+        try:
+            datos = json.loads(archivo.read_text())
+        except (OSError, ValueError):
+            continue  # archivo de otro proceso a medio escribir o ilegible
+        # Los volcados anteriores a las métricas de cache eran sólo {vista: métricas}
+        for vista, m in datos.get('vistas', datos).items():
+            t = total[vista]
+            t['peticiones'] += m['peticiones']
+            t['segundos'] += m['segundos']
+            t['consultas'] += m['consultas']
+            t['db_segundos'] += m['db_segundos']
+            t['buckets'] = [a + b for a, b in zip(t['buckets'], m['buckets'])]
+        for nombre, c in datos.get('caches', {}).items():
+            caches[nombre]['aciertos'] += c['aciertos']
+            caches[nombre]['fallos'] += c['fallos']
+    return total, caches
+
+
+def formato_prometheus(vistas, caches=None):
+    lineas = [
+        "# HELP medalert_peticiones_total Peticiones atendidas por vista.",
+        "# TYPE medalert_peticiones_total counter",
+    ]
+    for vista, m in sorted(vistas.items()):
+        lineas.append(f'medalert_peticiones_total{{vista="{vista}"}} {m["peticiones"]}')
+
+    lineas += [
+        "# HELP medalert_latencia_segundos Latencia de las peticiones por vista.",
+        "# TYPE medalert_latencia_segundos histogram",
+    ]
+    for vista, m in sorted(vistas.items()):
+        for limite, n in zip(BUCKETS, m['buckets']):
+            lineas.append(f'medalert_latencia_segundos_bucket{{vista="{vista}",le="{limite}"}} {n}')
+        lineas.append(f'medalert_latencia_segundos_bucket{{vista="{vista}",le="+Inf"}} {m["peticiones"]}')
+        lineas.append(f'medalert_latencia_segundos_sum{{vista="{vista}"}} {m["segundos"]:.6f}')
+        lineas.append(f'medalert_latencia_segundos_count{{vista="{vista}"}} {m["peticiones"]}')
+
+    lineas += [
+        "# HELP medalert_consultas_db_total Consultas SQL ejecutadas por vista.",
+        "# TYPE medalert_consultas_db_total counter",
+    ]
+    for vista, m in sorted(vistas.items()):
+        lineas.append(f'medalert_consultas_db_total{{vista="{vista}"}} {m["consultas"]}')
+
+    lineas += [
+        "# HELP medalert_db_segundos_total Tiempo en la base de datos por vista.",
+        "# TYPE medalert_db_segundos_total counter",
+    ]
+    for vista, m in sorted(vistas.items()):
+        lineas.append(f'medalert_db_segundos_total{{vista="{vista}"}} {m["db_segundos"]:.6f}')
+
+    lineas += [
+        "# HELP medalert_cache_total Lecturas de las caches de la aplicación (acierto o fallo).",
+        "# TYPE medalert_cache_total counter",
+    ]
+    for nombre, c in sorted((caches or {}).items()):
+        lineas.append(f'medalert_cache_total{{cache="{nombre}",resultado="acierto"}} {c["aciertos"]}')
+        lineas.append(f'medalert_cache_total{{cache="{nombre}",resultado="fallo"}} {c["fallos"]}')
+    return "\n".join(lineas) + "\n"
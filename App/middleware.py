@@ -0,0 +1,144 @@
+import cProfile
+import hmac
+import os
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from . import metricas
+
+
+class ContadorConsultas:
+    """execute_wrapper que cuenta las consultas y el tiempo pasado en la base."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas += 1
+            self.segundos += time.perf_counter() - inicio
+
+
+def nombre_vista(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'sin_ruta'
+    return match.url_name or match.view_name or 'sin_nombre'
+
+
+class MetricasMiddleware:
+    """
+    Registra por nombre de URL: peticiones, histograma de latencia, consultas
+    SQL y tiempo en la base. Se exponen en /metrics (ver metricas.py).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        contador = ContadorConsultas()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contador):
+            response = self.get_response(request)
+        metricas.registrar(
+            nombre_vista(request), time.perf_counter() - inicio, contador.consultas, contador.segundos
+        )
+        return response
+
+    async def __acall__(self, request):
+        contador = ContadorConsultas()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contador):
+            response = await self.get_response(request)
+        metricas.registrar(
+            nombre_vista(request), time.perf_counter() - inicio, contador.consultas, contador.segundos
+        )
+        return response
+
+
+class PerfiladorMiddleware:
+    """
+    Ejecuta cProfile en una fracción de las peticiones (`PERFILADOR_TASA`) o
+    cuando llega la cabecera `X-Perfilar` con `PERFILADOR_TOKEN`. Cada perfil
+    se guarda en `PERFILADOR_DIR` como `<fecha>-<vista>-<ms>ms-<pid>.prof` y
+    se conservan los últimos `PERFILADOR_MAX_ARCHIVOS`. Para agregarlos:
+    `manage.py resumen_perfiles`.
+
+    Con WSGI se perfila la petición entera. Con ASGI la cadena de middleware
+    es async y cProfile mediría también las demás corrutinas del event loop:
+    `process_view` perfila sólo las vistas síncronas, dentro del hilo de
+    `sync_to_async` en el que corren. Las vistas async pasan sin perfilar.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)  # ver process_view
+        if not self.debe_perfilar(request):
+            return self.get_response(request)
+        return self.perfilar(request, self.get_response, request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """
+        Con la cadena async, Django corre este método en el mismo hilo que las
+        vistas síncronas (sync_to_async con thread_sensitive): si toca
+        perfilar, llama a la vista desde acá y devuelve su respuesta.
+        """
+        if not iscoroutinefunction(self) or iscoroutinefunction(view_func):
+            return None
+        if connection.settings_dict.get('ATOMIC_REQUESTS') or not self.debe_perfilar(request):
+            return None  # con ATOMIC_REQUESTS la vista debe correr dentro de la transacción de Django
+        return self.perfilar(request, view_func, request, *view_args, **view_kwargs)
+
+    def perfilar(self, request, funcion, *args, **kwargs):
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            return funcion(*args, **kwargs)  # otro perfilador activo en este hilo
+        inicio = time.perf_counter()
+        try:
+            response = funcion(*args, **kwargs)
+        finally:
+            perfil.disable()
+        self.guardar(perfil, nombre_vista(request), (time.perf_counter() - inicio) * 1000)
+        return response
+
+    def debe_perfilar(self, request):
+        token = settings.PERFILADOR_TOKEN
+        cabecera = request.headers.get('X-Perfilar', '')
+        if token and cabecera and hmac.compare_digest(cabecera, token):
+            return True
+        return random.random() < settings.PERFILADOR_TASA
+
+    def guardar(self, perfil, vista, ms):
+        directorio = Path(settings.PERFILADOR_DIR)
+        directorio.mkdir(parents=True, exist_ok=True)
+        nombre = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{vista}-{ms:.0f}ms-{os.getpid()}.prof"
+        perfil.dump_stats(directorio / nombre)
+
+        archivos = sorted(directorio.glob('*.prof'))  # el nombre empieza con la fecha
+        for viejo in archivos[:-settings.PERFILADOR_MAX_ARCHIVOS]:
+            viejo.unlink(missing_ok=True)
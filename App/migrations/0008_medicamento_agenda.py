@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:05
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def rellenar_agenda(apps, schema_editor):
+    """Calcula ultima_toma, proxima_toma y fecha_fin_tratamiento de las filas existentes."""
+    Medicamento = apps.get_model('App', 'Medicamento')
+    lote = []
+    for med in Medicamento.objects.annotate(ultima=Max('tomas__fecha_hora')).iterator(chunk_size=1000):
+        med.ultima_toma = med.ultima
+        med.fecha_fin_tratamiento = med.created_at.date() + timedelta(days=med.duracion_dias or 0)
+        if med.ultima and med.frecuencia_horas:
+            med.proxima_toma = med.ultima + timedelta(hours=med.frecuencia_horas)
+        else:
+            med.proxima_toma = med.ultima or med.created_at
+        lote.append(med)
+        if len(lote) >= 1000:
+            Medicamento.objects.bulk_update(lote, ['ultima_toma', 'proxima_toma', 'fecha_fin_tratamiento'])
+            lote = []
+    if lote:
+        Medicamento.objects.bulk_update(lote, ['ultima_toma', 'proxima_toma', 'fecha_fin_tratamiento'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0007_perfilusuario_notificar_medicamentos_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicamento',
+            name='fecha_fin_tratamiento',
+            field=models.DateField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='medicamento',
+            name='proxima_toma',
+            field=models.DateTimeField(blank=True, db_index=True, editable=False, help_text='Próxima dosis. Sin tomas previas es created_at (se puede tomar ya).', null=True),
+        ),
+        migrations.AddField(
+            model_name='medicamento',
+            name='ultima_toma',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(rellenar_agenda, migrations.RunPython.noop),
+    ]
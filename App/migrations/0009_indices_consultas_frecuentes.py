@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:06
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def fusionar_hidratacion_duplicada(apps, schema_editor):
+    """Une las filas repetidas (usuario, fecha) antes de crear la restricción única."""
+    RegistroHidratacion = apps.get_model('App', 'RegistroHidratacion')
+    duplicados = (
+        RegistroHidratacion.objects.values('usuario_id', 'fecha')
+        .annotate(n=Count('id'), primero=Min('id'), vasos=Sum('vasos_tomados'))
+        .filter(n__gt=1)
+    )
+    for dup in duplicados:
+        filas = RegistroHidratacion.objects.filter(usuario_id=dup['usuario_id'], fecha=dup['fecha'])
+        filas.filter(id=dup['primero']).update(vasos_tomados=dup['vasos'])
+        filas.exclude(id=dup['primero']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0008_medicamento_agenda'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(fusionar_hidratacion_duplicada, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(condition=models.Q(('enviado', False)), fields=['usuario'], name='notif_pendientes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificacion',
+            index=models.Index(fields=['usuario', 'tipo', '-fecha_envio'], name='notif_usuario_tipo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrotoma',
+            index=models.Index(fields=['medicamento', '-fecha_hora'], name='toma_medicamento_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='registrohidratacion',
+            constraint=models.UniqueConstraint(fields=('usuario', 'fecha'), name='hidratacion_usuario_fecha_uniq'),
+        ),
+    ]
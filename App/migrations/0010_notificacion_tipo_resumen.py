@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0009_indices_consultas_frecuentes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notificacion',
+            name='tipo',
+            field=models.CharField(choices=[('medicamento', 'Medicamento'), ('agua', 'Agua'), ('resumen', 'Resumen diario')], max_length=20),
+        ),
+    ]
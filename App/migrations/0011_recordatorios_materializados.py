@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0010_notificacion_tipo_resumen'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicamento',
+            name='recordatorios_hasta',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='recordatoriomedicamento',
+            name='notificado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='recordatoriomedicamento',
+            index=models.Index(condition=models.Q(('notificado', False), ('tomado', False)), fields=['hora'], name='recordatorio_pendiente_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recordatoriomedicamento',
+            constraint=models.UniqueConstraint(fields=('medicamento', 'hora'), name='recordatorio_medicamento_hora_uniq'),
+        ),
+    ]
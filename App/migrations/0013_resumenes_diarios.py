@@ -0,0 +1,41 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0012_medicamento_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiarioNotificacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tipo', models.CharField(choices=[('medicamento', 'Medicamento'), ('agua', 'Agua'), ('resumen', 'Resumen diario')], max_length=20)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_notificaciones', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'fecha', 'tipo'), name='resumen_notif_usuario_fecha_tipo_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenDiarioToma',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('tomas', models.PositiveIntegerField(default=0)),
+                ('medicamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes_diarios', to='App.medicamento')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('medicamento', 'fecha'), name='resumen_toma_medicamento_fecha_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.7 on 2026-10-17 22:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0013_resumenes_diarios'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdherenciaMedicamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ventana_dias', models.PositiveSmallIntegerField()),
+                ('esperadas', models.PositiveIntegerField(default=0)),
+                ('a_tiempo', models.PositiveIntegerField(default=0)),
+                ('tardias', models.PositiveIntegerField(default=0, help_text='Tomadas fuera de la tolerancia.')),
+                ('omitidas', models.PositiveIntegerField(default=0)),
+                ('calculado_en', models.DateTimeField()),
+                ('medicamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='adherencias', to='App.medicamento')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('medicamento', 'ventana_dias'), name='adherencia_medicamento_ventana_uniq')],
+            },
+        ),
+    ]
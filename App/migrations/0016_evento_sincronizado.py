@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:05
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0015_relacion_cuidador'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoSincronizado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(help_text='Generada por el cliente (p. ej. un UUID).', max_length=64)),
+                ('tipo', models.CharField(choices=[('toma', 'Toma de medicamento'), ('agua', 'Vasos de agua')], max_length=10)),
+                ('ocurrido_en', models.DateTimeField(help_text='Hora del evento según el cliente.')),
+                ('recibido_en', models.DateTimeField(default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='eventos_sincronizados', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('usuario', 'clave'), name='evento_sincronizado_usuario_clave_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('App', '0016_evento_sincronizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfilusuario',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='perfilusuario',
+            index=models.Index(fields=['updated_at'], name='perfil_actualizado_idx'),
+        ),
+    ]
@@ -1,7 +1,12 @@
+from datetime import timedelta
+
 from django.db import models
+from django.db.models import Max, Q
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from . import versiones
+
 
 # --- PERFIL DE USUARIO ---
 class PerfilUsuario(models.Model):
@@ -35,6 +40,13 @@ class PerfilUsuario(models.Model):
     recordatorio_horas = models.FloatField(default=2, help_text="Cada cuántas horas recordar tomar agua.")
     notificar_medicamentos = models.BooleanField(default=True)
     notificar_resumen_diario = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # El programador recarga sólo los perfiles cambiados desde su última pasada
+            models.Index(fields=['updated_at'], name='perfil_actualizado_idx'),
+        ]
 
     def __str__(self):
         return self.user.username
@@ -79,19 +91,75 @@ class Medicamento(models.Model):
     instrucciones = models.TextField(blank=True, null=True)
     activo = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    # Versión de la tarjeta cacheada en medicamentos.html (no cambia con la agenda)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # --- Agenda desnormalizada (se mantiene en save() y en signals.py) ---
+    ultima_toma = models.DateTimeField(null=True, blank=True, editable=False)
+    proxima_toma = models.DateTimeField(
+        null=True, blank=True, editable=False, db_index=True,
+        help_text="Próxima dosis. Sin tomas previas es created_at (se puede tomar ya)."
+    )
+    fecha_fin_tratamiento = models.DateField(null=True, blank=True, editable=False, db_index=True)
+    # Hasta dónde están generados los RecordatorioMedicamento (ver recordatorios.py)
+    recordatorios_hasta = models.DateTimeField(null=True, blank=True, editable=False)
+
+    CAMPOS_AGENDA = ['ultima_toma', 'proxima_toma', 'fecha_fin_tratamiento']
+    # Si cambian, se regeneran los recordatorios pendientes (signals.py)
+    CAMPOS_PROGRAMA = ('frecuencia_horas', 'duracion_dias', 'activo')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._programa_original = instance.programa()
+        return instance
+
+    def programa(self):
+        return tuple(self.__dict__.get(campo) for campo in self.CAMPOS_PROGRAMA)
+
+    def programa_cambio(self):
+        original = getattr(self, '_programa_original', None)
+        return original is not None and original != self.programa()
+
+    def save(self, *args, **kwargs):
+        self.calcular_agenda()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | set(self.CAMPOS_AGENDA)
+        super().save(*args, **kwargs)
+
+    def calcular_agenda(self):
+        """Recalcula proxima_toma y fecha_fin_tratamiento a partir de ultima_toma."""
+        inicio = self.created_at or timezone.now()
+        self.fecha_fin_tratamiento = inicio.date() + timedelta(days=self.duracion_dias or 0)
+        if self.ultima_toma and self.frecuencia_horas:
+            self.proxima_toma = self.ultima_toma + timedelta(hours=self.frecuencia_horas)
+        else:
+            self.proxima_toma = self.ultima_toma or inicio
+
+    def recalcular_ultima_toma(self):
+        """Vuelve a leer la última toma desde la base (p. ej. tras borrar una)."""
+        self.ultima_toma = self.tomas.aggregate(ultima=Max('fecha_hora'))['ultima']
+        self.save(update_fields=self.CAMPOS_AGENDA)
+
     def actualizar_estado(self):
-        """Desactiva automáticamente si el tratamiento terminó."""
-        hoy = timezone.now().date()
-        if self.activo and hoy > self.fecha_fin():
+        """
+        Desactiva el medicamento si el tratamiento terminó. Para todos a la
+        vez: recordatorios.desactivar_tratamientos_terminados.
+        """
+        hoy = timezone.localdate()
+        if self.activo and self.duracion_dias and hoy > self.fecha_fin():
+            Medicamento.objects.filter(pk=self.pk).update(activo=False)
             self.activo = False
-            self.save()   
+            versiones.invalidar(self.usuario_id)
 
     def __str__(self):
         return f"{self.nombre} ({self.usuario.username})"
 
     def fecha_fin(self):
         """Fecha en que termina el tratamiento desde el día en que se creó."""
+        if self.fecha_fin_tratamiento:
+            return self.fecha_fin_tratamiento
         fecha_inicio = self.created_at.date()
         return fecha_inicio + timezone.timedelta(days=self.duracion_dias)
 
@@ -103,6 +171,20 @@ class RecordatorioMedicamento(models.Model):
     hora = models.DateTimeField(help_text="Fecha y hora exacta del recordatorio.")
     tomado = models.BooleanField(default=False)
     fecha_toma = models.DateTimeField(null=True, blank=True)
+    notificado = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            # bulk_create(ignore_conflicts=True) al extender la ventana no duplica dosis
+            models.UniqueConstraint(fields=['medicamento', 'hora'], name='recordatorio_medicamento_hora_uniq'),
+        ]
+        indexes = [
+            # Programador: dosis pendientes que vencen en un rango de `hora`
+            models.Index(
+                fields=['hora'], condition=Q(notificado=False, tomado=False),
+                name='recordatorio_pendiente_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Recordatorio de {self.medicamento.nombre} a las {self.hora.strftime('%H:%M')}"
@@ -116,6 +198,12 @@ class RegistroHidratacion(models.Model):
     vasos_tomados = models.PositiveIntegerField(default=0)
     meta_vasos = models.PositiveIntegerField(default=8, help_text="Meta diaria de vasos.")
 
+    class Meta:
+        constraints = [
+            # Una fila por usuario y día (evita duplicados de get_or_create concurrentes)
+            models.UniqueConstraint(fields=['usuario', 'fecha'], name='hidratacion_usuario_fecha_uniq'),
+        ]
+
     def __str__(self):
         return f"Hidratación de {self.usuario.username} - {self.fecha}"
 
@@ -130,6 +218,7 @@ class Notificacion(models.Model):
     TIPO_CHOICES = (
         ('medicamento', 'Medicamento'),
         ('agua', 'Agua'),
+        ('resumen', 'Resumen diario'),
     )
 
     usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notificaciones')
@@ -138,6 +227,14 @@ class Notificacion(models.Model):
     fecha_envio = models.DateTimeField(default=timezone.now)
     enviado = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Polling / stream: pendientes del usuario (índice parcial, sólo enviado=False)
+            models.Index(fields=['usuario'], condition=Q(enviado=False), name='notif_pendientes_idx'),
+            # Último aviso por tipo (agua, resumen del día)
+            models.Index(fields=['usuario', 'tipo', '-fecha_envio'], name='notif_usuario_tipo_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"Notificación {self.tipo} - {self.usuario.username}"
     
@@ -147,5 +244,110 @@ class RegistroToma(models.Model):
     medicamento = models.ForeignKey('Medicamento', on_delete=models.CASCADE, related_name='tomas')
     fecha_hora = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['medicamento', '-fecha_hora'], name='toma_medicamento_fecha_idx'),
+        ]
+
     def __str__(self):
         return f"{self.medicamento.nombre} - {self.fecha_hora.strftime('%d/%m %H:%M')}"
+
+
+# --- RESÚMENES DIARIOS (retención, ver retencion.py) ---
+class ResumenDiarioToma(models.Model):
+    """Tomas por medicamento y día de los RegistroToma ya depurados."""
+    medicamento = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='resumenes_diarios')
+    fecha = models.DateField()
+    tomas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicamento', 'fecha'], name='resumen_toma_medicamento_fecha_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicamento.nombre} - {self.fecha}: {self.tomas} tomas"
+
+
+class ResumenDiarioNotificacion(models.Model):
+    """Notificaciones por usuario, tipo y día de las ya depuradas."""
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='resumenes_notificaciones')
+    fecha = models.DateField()
+    tipo = models.CharField(max_length=20, choices=Notificacion.TIPO_CHOICES)
+    cantidad = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'fecha', 'tipo'], name='resumen_notif_usuario_fecha_tipo_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario.username} - {self.fecha} {self.tipo}: {self.cantidad}"
+
+
+# --- ADHERENCIA (ver adherencia.py) ---
+class AdherenciaMedicamento(models.Model):
+    """Dosis esperadas, tomadas y omitidas de un medicamento en los últimos `ventana_dias`."""
+    medicamento = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='adherencias')
+    ventana_dias = models.PositiveSmallIntegerField()
+    esperadas = models.PositiveIntegerField(default=0)
+    a_tiempo = models.PositiveIntegerField(default=0)
+    tardias = models.PositiveIntegerField(default=0, help_text="Tomadas fuera de la tolerancia.")
+    omitidas = models.PositiveIntegerField(default=0)
+    calculado_en = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medicamento', 'ventana_dias'], name='adherencia_medicamento_ventana_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicamento.nombre} ({self.ventana_dias} días): {self.porcentaje()}%"
+
+    @property
+    def tomadas(self):
+        return self.a_tiempo + self.tardias
+
+    def porcentaje(self):
+        """Porcentaje de dosis tomadas, o None si no se esperaba ninguna."""
+        if not self.esperadas:
+            return None
+        return round(self.tomadas / self.esperadas * 100, 1)
+
+
+# --- CUIDADORES (ver cuidadores.py) ---
+class RelacionCuidador(models.Model):
+    """Un paciente comparte sus medicamentos e hidratación con un cuidador."""
+    cuidador = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pacientes')
+    paciente = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cuidadores')
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cuidador', 'paciente'], name='relacion_cuidador_paciente_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.cuidador.username} cuida a {self.paciente.username}"
+
+
+# --- SINCRONIZACIÓN SIN CONEXIÓN (ver sincronizacion.py) ---
+class EventoSincronizado(models.Model):
+    """Clave de idempotencia de un evento que la PWA registró sin conexión."""
+    TIPO_CHOICES = [
+        ('toma', 'Toma de medicamento'),
+        ('agua', 'Vasos de agua'),
+    ]
+    usuario = models.ForeignKey(User, on_delete=models.CASCADE, related_name='eventos_sincronizados')
+    clave = models.CharField(max_length=64, help_text="Generada por el cliente (p. ej. un UUID).")
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+    ocurrido_en = models.DateTimeField(help_text="Hora del evento según el cliente.")
+    recibido_en = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='evento_sincronizado_usuario_clave_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario.username} - {self.tipo} {self.clave}"
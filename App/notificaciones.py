@@ -0,0 +1,205 @@
+"""
+Entrega de notificaciones en tiempo real.
+
+El endpoint SSE (`stream_notificaciones`) mantiene una conexión abierta por
+cliente y sólo consulta la base de datos cuando se crea una `Notificacion`
+para ese usuario. Requiere servir el proyecto con `TomaBien.asgi`; bajo WSGI
+el cliente vuelve al polling de `/notificaciones/`.
+
+El polling usa un cursor: la cache guarda el id de la última notificación de
+cada usuario y mientras el cliente ya lo haya visto no se consulta la base.
+
+Además puede autenticarse con un token firmado (`emitir_token`) en lugar de
+la sesión, así `/notificaciones/poll/` no lee ni la sesión ni el usuario:
+- vence a los `NOTIFICACIONES_TOKEN_MAX_AGE` segundos (401 al cliente, que
+  vuelve a pedir uno con su sesión en `/notificaciones/?since=`);
+- pasada la mitad de su vida, cada respuesta trae uno nuevo en `token`;
+- no se revoca al cerrar sesión: sigue sirviendo hasta vencer, y sólo da
+  acceso a las notificaciones del usuario.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db.models import Max
+
+from .models import Notificacion
+
+
+# usuario_id -> {(loop, evento)} de cada conexión abierta en este proceso
+_suscriptores = defaultdict(set)
+_lock = threading.Lock()
+
+
+def suscribir(usuario_id):
+    """Registra una conexión del usuario y devuelve su suscripción."""
+    suscripcion = (asyncio.get_running_loop(), asyncio.Event())
+    with _lock:
+        _suscriptores[usuario_id].add(suscripcion)
+    return suscripcion
+
+
+def desuscribir(usuario_id, suscripcion):
+    with _lock:
+        conexiones = _suscriptores.get(usuario_id)
+        if conexiones:
+            conexiones.discard(suscripcion)
+            if not conexiones:
+                del _suscriptores[usuario_id]
+
+
+def avisar(usuario_id):
+    """
+    Despierta las conexiones abiertas del usuario. Puede llamarse desde
+    cualquier hilo (las vistas síncronas corren fuera del event loop).
+    """
+    with _lock:
+        conexiones = list(_suscriptores.get(usuario_id, ()))
+    for loop, evento in conexiones:
+        try:
+            loop.call_soon_threadsafe(evento.set)
+        except RuntimeError:
+            # El loop ya se cerró; la conexión se limpiará en su `finally`.
+            pass
+
+
+def _clave_cursor(usuario_id):
+    return f"notificaciones:ultima:{usuario_id}"
+
+
+def ultima_notificacion_id(usuario_id):
+    """Id de la última notificación del usuario (0 si no tiene), desde la cache."""
+    clave = _clave_cursor(usuario_id)
+    ultima = cache.get(clave)
+    if ultima is None:
+        ultima = Notificacion.objects.filter(usuario_id=usuario_id).aggregate(m=Max('id'))['m'] or 0
+        cache.set(clave, ultima, settings.NOTIFICACIONES_CURSOR_TTL)
+    return ultima
+
+
+async def aultima_notificacion_id(usuario_id):
+    """Versión async de `ultima_notificacion_id`."""
+    clave = _clave_cursor(usuario_id)
+    ultima = await cache.aget(clave)
+    if ultima is None:
+        ultima = (await Notificacion.objects.filter(usuario_id=usuario_id).aaggregate(m=Max('id')))['m'] or 0
+        await cache.aset(clave, ultima, settings.NOTIFICACIONES_CURSOR_TTL)
+    return ultima
+
+
+def actualizar_cursor(usuario_id, notificacion_id):
+    """
+    Avanza el cursor al crear una notificación. bulk_create no dispara la
+    signal: quien lo use debe llamar a esta función.
+    """
+    clave = _clave_cursor(usuario_id)
+    if notificacion_id > (cache.get(clave) or 0):
+        cache.set(clave, notificacion_id, settings.NOTIFICACIONES_CURSOR_TTL)
+
+
+def _clave_ack(usuario_id):
+    return f"notificaciones:ack:{usuario_id}"
+
+
+def version_ack(usuario_id):
+    """
+    Cambia cada vez que se confirman notificaciones del usuario; va en el ETag
+    del polling junto con el cursor. Arranca en `time.time_ns()`, así si la
+    cache la descarta no se vuelve a un valor ya usado (ver versiones.py).
+    """
+    clave = _clave_ack(usuario_id)
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), settings.NOTIFICACIONES_CURSOR_TTL)
+        version = cache.get(clave)
+    return version
+
+
+def registrar_ack(usuario_id):
+    cache.set(_clave_ack(usuario_id), time.time_ns(), settings.NOTIFICACIONES_CURSOR_TTL)
+
+
+SAL_TOKEN = 'App.notificaciones.token'
+
+
+def emitir_token(usuario_id):
+    return signing.dumps({'u': usuario_id, 'iat': int(time.time())}, salt=SAL_TOKEN)
+
+
+def verificar_token(token):
+    """
+    Devuelve (usuario_id, token_nuevo). token_nuevo es None salvo que el
+    token haya pasado la mitad de su vida. Lanza signing.BadSignature (o
+    SignatureExpired) si no es válido.
+    """
+    max_age = settings.NOTIFICACIONES_TOKEN_MAX_AGE
+    datos = signing.loads(token, salt=SAL_TOKEN, max_age=max_age)
+    usuario_id = datos['u']
+    nuevo = None
+    if time.time() - datos['iat'] > max_age / 2:
+        nuevo = emitir_token(usuario_id)
+    return usuario_id, nuevo
+
+
+async def tomar_pendientes(usuario_id):
+    """Devuelve las notificaciones no enviadas y las marca como enviadas."""
+    pendientes = [
+        n async for n in Notificacion.objects.filter(
+            usuario_id=usuario_id, enviado=False
+        ).values('id', 'tipo', 'mensaje')
+    ]
+    if pendientes:
+        await Notificacion.objects.filter(
+            id__in=[n['id'] for n in pendientes]
+        ).aupdate(enviado=True)
+        await cache.aset(_clave_ack(usuario_id), time.time_ns(), settings.NOTIFICACIONES_CURSOR_TTL)
+    return pendientes
+
+
+async def pendientes_desde(usuario_id, desde_id):
+    """Notificaciones no confirmadas del usuario con id mayor que `desde_id`."""
+    return [
+        n async for n in Notificacion.objects.filter(
+            usuario_id=usuario_id, enviado=False, id__gt=desde_id
+        ).order_by('id').values('id', 'tipo', 'mensaje')
+    ]
+
+
+async def eventos_usuario(usuario_id, desde_id=0):
+    """
+    Generador SSE. Consulta la base al conectar, cada vez que se crea una
+    notificación para el usuario y, como respaldo para notificaciones creadas
+    en otros procesos, cada `NOTIFICACIONES_STREAM_RESYNC` segundos.
+
+    No marca nada como enviado: el `id:` de cada evento es el cursor (el
+    navegador lo reenvía en `Last-Event-ID` al reconectar) y el cliente
+    confirma lo que recibió en /notificaciones/ack/, como con el polling.
+    """
+    loop = asyncio.get_running_loop()
+    _, evento = suscripcion = suscribir(usuario_id)
+    inicio = ultima_revision = loop.time()
+    revisar = True
+    try:
+        yield "retry: 5000\n\n"
+        while loop.time() - inicio < settings.NOTIFICACIONES_STREAM_DURACION:
+            if revisar:
+                evento.clear()
+                ultima_revision = loop.time()
+                for n in await pendientes_desde(usuario_id, desde_id):
+                    desde_id = n['id']
+                    yield f"id: {n['id']}\nevent: notificacion\ndata: {json.dumps(n)}\n\n"
+            try:
+                await asyncio.wait_for(
+                    evento.wait(), timeout=settings.NOTIFICACIONES_STREAM_HEARTBEAT
+                )
+                revisar = True
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                revisar = loop.time() - ultima_revision >= settings.NOTIFICACIONES_STREAM_RESYNC
+    finally:
+        desuscribir(usuario_id, suscripcion)
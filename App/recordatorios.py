@@ -0,0 +1,351 @@
+"""
+Programador de recordatorios.
+
+Las dosis de cada tratamiento se materializan en `RecordatorioMedicamento`
+por ventanas (`RECORDATORIOS_VENTANA_HORAS`) con bulk_create: la grilla parte
+de `proxima_toma` cada `frecuencia_horas` hasta `fecha_fin_tratamiento`.
+Al registrar una toma se marca la dosis como tomada y la grilla se rehace
+desde la toma; al editar el medicamento se rehacen las dosis futuras.
+
+El programador mantiene un heap con las dosis pendientes y con cada
+intervalo de hidratación (`PerfilUsuario.recordatorio_horas`) y crea la
+`Notificacion` justo cuando corresponde, en lugar de hacerlo como efecto
+secundario de las vistas. Los perfiles se leen todos al arrancar; después
+cada recarga lee sólo los cambiados (`updated_at`), y el aviso de agua
+reprograma el siguiente en el heap. Una vez por día desactiva los tratamientos
+terminados y, desde `RESUMEN_DIARIO_HORA`, genera los resúmenes diarios
+(resumen_diario.py). Lo ejecuta
+`manage.py programador_recordatorios`.
+"""
+import heapq
+import time
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
+from django.utils import timezone
+
+from . import versiones
+from .agenda import rango_del_dia
+from .models import Medicamento, Notificacion, PerfilUsuario, RecordatorioMedicamento
+from .resumen_diario import generar_resumenes
+
+
+MEDICAMENTO = 'medicamento'
+AGUA = 'agua'
+
+MENSAJE_MEDICAMENTO = "¡Es hora de tomar {nombre}! 💊"
+MENSAJE_AGUA = "¡Recuerda hidratarte! 💧"
+
+
+def medicamentos_programables(hoy=None):
+    """Medicamentos activos, con frecuencia y con tratamiento en curso."""
+    hoy = hoy or timezone.localdate()
+    return (
+        Medicamento.objects
+        .filter(activo=True, frecuencia_horas__gt=0)
+        .filter(Q(duracion_dias=0) | Q(fecha_fin_tratamiento__gt=hoy))
+    )
+
+
+def desactivar_tratamientos_terminados(hoy=None):
+    """
+    Desactiva en un solo UPDATE los tratamientos cuyo fin
+    (`fecha_fin_tratamiento` = created_at + duracion_dias) ya pasó y devuelve
+    cuántos cambió. duracion_dias=0 es un tratamiento sin fin.
+    """
+    hoy = hoy or timezone.localdate()
+    desactivados = Medicamento.objects.filter(
+        activo=True, duracion_dias__gt=0, fecha_fin_tratamiento__lt=hoy,
+    ).update(activo=False)
+    if desactivados:
+        versiones.invalidar_todos()  # update() no dispara signals
+    return desactivados
+
+
+# --- Dosis materializadas ---
+def fin_tratamiento(med):
+    """Primer instante sin dosis (inicio del día de fin), o None si es indefinido."""
+    if not med.duracion_dias:
+        return None
+    return rango_del_dia(med.fecha_fin_tratamiento)[0]
+
+
+def horas_dosis(med, desde, hasta):
+    """Horas de la grilla de `med` en [desde, hasta)."""
+    freq = timedelta(hours=med.frecuencia_horas)
+    fin = fin_tratamiento(med)
+    if fin and fin < hasta:
+        hasta = fin
+    hora = med.proxima_toma
+    if hora < desde:
+        hora += freq * -((hora - desde) // freq)  # primera dosis >= desde
+    horas = []
+    while hora < hasta:
+        horas.append(hora)
+        hora += freq
+    return horas
+
+
+def extender_recordatorios(ahora=None, lote=1000):
+    """
+    Genera las dosis hasta `ahora + RECORDATORIOS_VENTANA_HORAS` de los
+    medicamentos cuya ventana generada termina antes de la mitad de eso.
+    Tres consultas por lote de medicamentos. Devuelve cuántas dosis creó.
+    """
+    ahora = ahora or timezone.now()
+    ventana = timedelta(hours=settings.RECORDATORIOS_VENTANA_HORAS)
+    hasta = ahora + ventana
+    pendientes = (
+        medicamentos_programables(timezone.localdate(ahora))
+        .filter(Q(recordatorios_hasta__isnull=True) | Q(recordatorios_hasta__lt=ahora + ventana / 2))
+        # los que ya tienen generado todo su tratamiento no se vuelven a leer
+        .filter(Q(duracion_dias=0) | Q(recordatorios_hasta__isnull=True)
+                | Q(recordatorios_hasta__lt=F('fecha_fin_tratamiento')))
+        .only('id', 'frecuencia_horas', 'duracion_dias', 'proxima_toma',
+              'fecha_fin_tratamiento', 'recordatorios_hasta')
+    )
+    creados = 0
+    ultimo_id = 0
+    while True:
+        meds = list(pendientes.filter(id__gt=ultimo_id).order_by('id')[:lote])
+        if not meds:
+            return creados
+        ultimo_id = meds[-1].id
+
+        nuevos = []
+        for med in meds:
+            desde = med.recordatorios_hasta or med.proxima_toma
+            nuevos += [
+                RecordatorioMedicamento(medicamento_id=med.id, hora=hora)
+                for hora in horas_dosis(med, desde, hasta)
+            ]
+            fin = fin_tratamiento(med)
+            med.recordatorios_hasta = min(hasta, fin) if fin else hasta
+        RecordatorioMedicamento.objects.bulk_create(nuevos, batch_size=1000, ignore_conflicts=True)
+        Medicamento.objects.bulk_update(meds, ['recordatorios_hasta'], batch_size=1000)
+        creados += len(nuevos)
+
+
+def marcar_tomado(med, fecha):
+    """Marca como tomada la dosis a menos de media frecuencia de `fecha` (hay una como mucho)."""
+    marcar_tomados(med, [fecha])
+
+
+# Fechas por UPDATE en `marcar_tomados`: ~5 parámetros cada una, por debajo
+# del límite de 999 de SQLite
+FECHAS_POR_UPDATE = 100
+
+
+def marcar_tomados(med, fechas):
+    """
+    `marcar_tomado` para varias fechas con un UPDATE (por cada
+    FECHAS_POR_UPDATE); si dos caen en la misma dosis vale la primera.
+    """
+    if not med.frecuencia_horas:
+        return
+    media = timedelta(hours=med.frecuencia_horas) / 2
+    fechas = sorted(fechas)
+    for i in range(0, len(fechas), FECHAS_POR_UPDATE):
+        rangos = [(Q(hora__gt=f - media, hora__lte=f + media), f) for f in fechas[i:i + FECHAS_POR_UPDATE]]
+        RecordatorioMedicamento.objects.filter(
+            reduce(or_, (q for q, _ in rangos)), medicamento=med, tomado=False,
+        ).update(tomado=True, fecha_toma=Case(*(When(q, then=Value(f)) for q, f in rangos)))
+
+
+def reprogramar(med, desde):
+    """
+    Descarta las dosis pendientes posteriores a `desde`; la próxima extensión
+    las regenera desde `med.proxima_toma`. El llamador guarda
+    `med.recordatorios_hasta`.
+    """
+    pendientes = RecordatorioMedicamento.objects.filter(
+        medicamento=med, tomado=False, notificado=False, hora__gt=desde,
+    )
+    # Sin cascadas ni signals de borrado: delete() hace un único DELETE
+    pendientes.delete()
+    med.recordatorios_hasta = desde
+
+
+def avanzar_agenda(med, fecha):
+    """
+    Lleva la agenda de `med` a una toma en `fecha` si es la más reciente: la
+    próxima dosis y las siguientes se calculan desde ella. El UPDATE es
+    condicional: si otra petición ya registró una toma posterior, no se pisa.
+    """
+    if med.ultima_toma and fecha < med.ultima_toma:
+        return  # toma más antigua que la última conocida
+
+    med.ultima_toma = fecha
+    med.calcular_agenda()
+    reprogramar(med, fecha)
+    Medicamento.objects.filter(
+        Q(ultima_toma__isnull=True) | Q(ultima_toma__lte=fecha),
+        pk=med.pk,
+    ).update(
+        ultima_toma=med.ultima_toma, proxima_toma=med.proxima_toma,
+        recordatorios_hasta=med.recordatorios_hasta,
+    )
+
+
+def recordatorios_pendientes(desde, hasta):
+    """Dosis sin notificar ni tomar en [desde, hasta]: rango sobre el índice parcial de `hora`."""
+    return (
+        RecordatorioMedicamento.objects
+        .filter(notificado=False, tomado=False, hora__range=(desde, hasta), medicamento__activo=True)
+        .exclude(medicamento__usuario__perfilusuario__notificar_medicamentos=False)
+    )
+
+
+def perfiles_programables():
+    """Perfiles con intervalo de hidratación, anotados con el último aviso de agua."""
+    ultimo_aviso = Notificacion.objects.filter(
+        usuario=OuterRef('user_id'), tipo=AGUA
+    ).order_by('-fecha_envio').values('fecha_envio')[:1]
+    return (
+        PerfilUsuario.objects
+        .filter(recordatorio_horas__gt=0)
+        .annotate(ultimo_aviso=Subquery(ultimo_aviso))
+    )
+
+
+class Programador:
+    """
+    Heap de próximos vencimientos `(cuando, tipo, id)`. Un cambio de perfil
+    agrega su nuevo vencimiento sin sacar el anterior: `agua` guarda el
+    vigente de cada perfil y los demás se descartan al salir del heap.
+    """
+
+    def __init__(self, resync=60, stdout=None):
+        self.resync = timedelta(seconds=resync)
+        self.stdout = stdout
+        self.heap = []
+        self.agua = {}              # perfil_id -> vencimiento vigente
+        self.medicamentos = set()   # recordatorios ya en el heap
+        self.ultima_recarga = None
+        self.proxima_recarga = None
+        self.resumen_del_dia = None
+        self.barrido_del_dia = None
+
+    # --- Cálculo de vencimientos ---
+    def vencimiento_agua(self, perfil, ahora):
+        if not perfil.ultimo_aviso:
+            return ahora
+        return perfil.ultimo_aviso + timedelta(hours=perfil.recordatorio_horas)
+
+    # --- Heap ---
+    def programar_agua(self, perfil_id, cuando):
+        self.agua[perfil_id] = cuando
+        heapq.heappush(self.heap, (cuando, AGUA, perfil_id))
+
+    def recargar(self):
+        """
+        Extiende las ventanas de dosis y suma al heap lo nuevo de la base: las
+        dosis que vencen antes de la próxima recarga (un rango sobre
+        `RecordatorioMedicamento.hora`; las atrasadas más de
+        `RECORDATORIOS_TOLERANCIA_MINUTOS` ya no se avisan) y los perfiles
+        creados o cambiados desde la recarga anterior.
+        """
+        ahora = timezone.now()
+        extender_recordatorios(ahora)
+        tolerancia = timedelta(minutes=settings.RECORDATORIOS_TOLERANCIA_MINUTOS)
+        vencen = recordatorios_pendientes(ahora - tolerancia, ahora + self.resync).values_list('hora', 'id')
+        for hora, recordatorio_id in vencen:
+            if recordatorio_id not in self.medicamentos:
+                self.medicamentos.add(recordatorio_id)
+                heapq.heappush(self.heap, (hora, MEDICAMENTO, recordatorio_id))
+
+        perfiles = perfiles_programables()
+        if self.ultima_recarga:
+            perfiles = perfiles.filter(updated_at__gte=self.ultima_recarga)
+        for perfil in perfiles:
+            self.programar_agua(perfil.id, self.vencimiento_agua(perfil, ahora))
+        self.ultima_recarga = ahora
+        self.proxima_recarga = ahora + self.resync
+
+    def procesar_vencidos(self):
+        """Dispara todo lo vencido y devuelve cuántas notificaciones creó."""
+        creadas = 0
+        ahora = timezone.now()
+        while self.heap and self.heap[0][0] <= ahora:
+            cuando, tipo, obj_id = heapq.heappop(self.heap)
+            if tipo == MEDICAMENTO:
+                self.medicamentos.discard(obj_id)
+                creadas += self.disparar_medicamento(obj_id, ahora)
+            elif self.agua.get(obj_id) == cuando:
+                creadas += self.disparar_agua(obj_id, ahora)
+        return creadas
+
+    def disparar_medicamento(self, recordatorio_id, ahora):
+        # Se vuelve a leer: pudo registrarse la toma desde la última recarga.
+        tolerancia = timedelta(minutes=settings.RECORDATORIOS_TOLERANCIA_MINUTOS)
+        recordatorio = (
+            recordatorios_pendientes(ahora - tolerancia, ahora)
+            .select_related('medicamento').filter(id=recordatorio_id).first()
+        )
+        if not recordatorio:
+            return 0
+
+        med = recordatorio.medicamento
+        mensaje = MENSAJE_MEDICAMENTO.format(nombre=med.nombre)
+        creada = not Notificacion.objects.filter(
+            usuario_id=med.usuario_id, tipo=MEDICAMENTO, mensaje=mensaje, enviado=False
+        ).exists()
+        if creada:
+            Notificacion.objects.create(usuario_id=med.usuario_id, tipo=MEDICAMENTO, mensaje=mensaje)
+        RecordatorioMedicamento.objects.filter(id=recordatorio.id).update(notificado=True)
+        return int(creada)
+
+    def disparar_agua(self, perfil_id, ahora):
+        perfil = perfiles_programables().filter(id=perfil_id).first()
+        if not perfil:
+            del self.agua[perfil_id]  # borrado o sin intervalo de hidratación
+            return 0
+        cuando = self.vencimiento_agua(perfil, ahora)
+        if cuando > ahora:
+            self.programar_agua(perfil.id, cuando)
+            return 0
+
+        Notificacion.objects.create(usuario_id=perfil.user_id, tipo=AGUA, mensaje=MENSAJE_AGUA)
+        self.programar_agua(perfil.id, ahora + timedelta(hours=perfil.recordatorio_horas))
+        return 1
+
+    def barrer_tratamientos(self):
+        """Desactiva los tratamientos terminados, una vez por día."""
+        hoy = timezone.localdate()
+        if self.barrido_del_dia == hoy:
+            return
+        self.barrido_del_dia = hoy
+        desactivados = desactivar_tratamientos_terminados(hoy)
+        if desactivados and self.stdout:
+            self.stdout.write(f"{timezone.now():%H:%M:%S} {desactivados} tratamientos finalizados desactivados")
+
+    def generar_resumen_diario(self):
+        """Resúmenes del día, una vez por día a partir de RESUMEN_DIARIO_HORA (hora local)."""
+        ahora = timezone.localtime()
+        if self.resumen_del_dia == ahora.date() or ahora.hour < settings.RESUMEN_DIARIO_HORA:
+            return 0
+        self.resumen_del_dia = ahora.date()
+        return generar_resumenes(ahora.date())
+
+    # --- Bucle principal ---
+    def segundos_hasta_siguiente(self):
+        siguiente = self.proxima_recarga
+        if self.heap and self.heap[0][0] < siguiente:
+            siguiente = self.heap[0][0]
+        return max((siguiente - timezone.now()).total_seconds(), 0)
+
+    def ejecutar(self, una_vez=False):
+        self.recargar()
+        while True:
+            self.barrer_tratamientos()
+            creadas = self.generar_resumen_diario() + self.procesar_vencidos()
+            if creadas and self.stdout:
+                self.stdout.write(f"{timezone.now():%H:%M:%S} {creadas} notificaciones creadas")
+            if una_vez:
+                return
+            time.sleep(self.segundos_hasta_siguiente())
+            if timezone.now() >= self.proxima_recarga:
+                self.recargar()
@@ -0,0 +1,85 @@
+"""
+Resumen diario de medicamentos.
+
+`generar_resumenes` crea de una vez la notificación 'resumen' del día para
+todos los usuarios que la tienen activada (`notificar_resumen_diario`) y
+tienen medicamentos activos. Recorre los usuarios por lotes de id (keyset),
+con 4 consultas por lote y un `bulk_create`, así que la memoria no depende
+del total de usuarios. Es idempotente: quien ya tiene el resumen del día se
+salta. Lo ejecutan `manage.py generar_resumenes` y el programador de
+recordatorios.
+"""
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import notificaciones
+from .agenda import info_medicamento, rango_del_dia
+from .models import Medicamento, Notificacion
+
+
+RESUMEN = 'resumen'
+
+
+def usuarios_con_resumen():
+    """Usuarios con medicamentos activos que no desactivaron el resumen."""
+    return (
+        User.objects
+        .filter(Exists(Medicamento.objects.filter(usuario=OuterRef('pk'), activo=True)))
+        .exclude(perfilusuario__notificar_resumen_diario=False)
+    )
+
+
+def mensaje_resumen(medicamentos, ahora, hoy):
+    lineas = []
+    for med in medicamentos:
+        proxima = info_medicamento(med, ahora, hoy)['proxima']
+        lineas.append(f"{med.nombre}: próxima dosis a las {timezone.localtime(proxima):%H:%M}")
+    return "Resumen de hoy:\n" + "\n".join(lineas)
+
+
+def generar_resumenes(hoy=None, lote=1000):
+    """Crea los resúmenes que faltan para `hoy` y devuelve cuántos creó."""
+    hoy = hoy or timezone.localdate()
+    rango = rango_del_dia(hoy)
+    # Para otro día (--fecha) el resumen se fecha y calcula dentro de ese día:
+    # si no, caería en el de hoy y cada nueva ejecución crearía otro
+    ahora = min(max(timezone.now(), rango[0]), rango[1])
+    creados = 0
+    ultimo_id = 0
+
+    while True:
+        ids = list(
+            usuarios_con_resumen().filter(id__gt=ultimo_id)
+            .order_by('id').values_list('id', flat=True)[:lote]
+        )
+        if not ids:
+            return creados
+        ultimo_id = ids[-1]
+
+        con_resumen = set(
+            Notificacion.objects.filter(usuario_id__in=ids, tipo=RESUMEN, fecha_envio__range=rango)
+            .values_list('usuario_id', flat=True)
+        )
+        pendientes = [i for i in ids if i not in con_resumen]
+        if not pendientes:
+            continue
+
+        por_usuario = defaultdict(list)
+        for med in Medicamento.objects.filter(usuario_id__in=pendientes, activo=True).order_by('usuario_id', 'nombre'):
+            por_usuario[med.usuario_id].append(med)
+
+        nuevas = Notificacion.objects.bulk_create(
+            Notificacion(
+                usuario_id=usuario_id, tipo=RESUMEN, mensaje=mensaje_resumen(meds, ahora, hoy), fecha_envio=ahora,
+            )
+            for usuario_id, meds in por_usuario.items()
+        )
+        # bulk_create no dispara la signal de Notificacion
+        for n in nuevas:
+            if n.id:
+                notificaciones.actualizar_cursor(n.usuario_id, n.id)
+            notificaciones.avisar(n.usuario_id)
+        creados += len(nuevas)
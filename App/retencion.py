@@ -0,0 +1,149 @@
+"""
+Retención de datos históricos.
+
+`RegistroToma` y `Notificacion` crecen sin límite. `aplicar_retencion` pasa
+las filas más viejas que el plazo de retención a tablas de resumen diario
+(`ResumenDiarioToma`: tomas por medicamento y día; `ResumenDiarioNotificacion`:
+notificaciones por usuario, tipo y día) y luego las borra. También borra las
+dosis materializadas (`RecordatorioMedicamento`) ya pasadas y las claves de
+idempotencia de la sincronización (`EventoSincronizado`), que ya no se
+reenvían pasado SINCRONIZACION_MAX_DIAS.
+
+Cada lote es una transacción corta: leer `lote` filas por id, sumarlas a los
+resúmenes, archivarlas (opcional, JSONL) y borrarlas por id con un único
+DELETE (`delete()`; el lote se limita a `max_query_params` del motor).
+Mientras corre, `toma_eliminada` no hace nada (ver `en_curso`). Así ningún
+lock dura más que un lote y el volumen por usuario queda acotado sin
+importar la antigüedad de la cuenta. Se conserva la última toma de cada medicamento, que es la que
+reflejan `Medicamento.ultima_toma` / `proxima_toma`.
+
+Supone una sola ejecución a la vez (cron o `manage.py aplicar_retencion`).
+"""
+import json
+import threading
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import (
+    EventoSincronizado, Notificacion, RecordatorioMedicamento, RegistroToma, ResumenDiarioNotificacion,
+    ResumenDiarioToma,
+)
+
+
+_local = threading.local()
+
+
+def _acumular(modelo, claves, conteos, campo, **filtro):
+    """
+    Suma `conteos` ({valores de `claves`: n}) al `campo` de las filas de
+    `modelo`; `filtro` acota las filas existentes a leer. Crea las que faltan.
+    """
+    existentes = {
+        tuple(getattr(fila, c) for c in claves): fila
+        for fila in modelo.objects.select_for_update().filter(**filtro)
+    }
+    nuevas, cambiadas = [], []
+    for clave, n in conteos.items():
+        fila = existentes.get(clave)
+        if fila:
+            setattr(fila, campo, getattr(fila, campo) + n)
+            cambiadas.append(fila)
+        else:
+            nuevas.append(modelo(**dict(zip(claves, clave)), **{campo: n}))
+    modelo.objects.bulk_create(nuevas)
+    modelo.objects.bulk_update(cambiadas, [campo])
+
+
+def _archivar(archivo, filas):
+    for fila in filas:
+        archivo.write(json.dumps(fila, cls=DjangoJSONEncoder) + "\n")
+
+
+def en_curso():
+    """
+    True mientras se depura en este hilo. La retención nunca borra la última
+    toma de un medicamento, así que `toma_eliminada` no tiene nada que hacer.
+    """
+    return getattr(_local, 'activa', False)
+
+
+def _depurar(viejas, lote, resumir=None, archivo=None):
+    """Borra `viejas` por lotes (una transacción cada uno) y devuelve cuántas borró."""
+    # Cada lote va en un IN (...): no más parámetros de los que acepta el motor
+    lote = min(lote, connection.features.max_query_params or lote)
+    borradas = 0
+    while True:
+        with transaction.atomic():
+            filas = list(viejas.order_by('id').values()[:lote])
+            if not filas:
+                return borradas
+            if resumir:
+                resumir(filas)
+            if archivo:
+                _archivar(archivo, filas)
+            viejas.model.objects.filter(id__in=[f['id'] for f in filas]).delete()
+        borradas += len(filas)
+
+
+def _resumir_tomas(filas):
+    conteos = Counter(
+        (f['medicamento_id'], timezone.localdate(f['fecha_hora'])) for f in filas
+    )
+    _acumular(
+        ResumenDiarioToma, ('medicamento_id', 'fecha'), conteos, 'tomas',
+        medicamento_id__in={m for m, _ in conteos}, fecha__in={d for _, d in conteos},
+    )
+
+
+def _resumir_notificaciones(filas):
+    conteos = Counter(
+        (f['usuario_id'], timezone.localdate(f['fecha_envio']), f['tipo']) for f in filas
+    )
+    _acumular(
+        ResumenDiarioNotificacion, ('usuario_id', 'fecha', 'tipo'), conteos, 'cantidad',
+        usuario_id__in={u for u, _, _ in conteos}, fecha__in={d for _, d, _ in conteos},
+    )
+
+
+def tomas_viejas(corte):
+    """Tomas anteriores a `corte`, salvo la última de cada medicamento."""
+    return RegistroToma.objects.filter(fecha_hora__lt=corte).filter(
+        ~Q(fecha_hora=F('medicamento__ultima_toma'))
+    )
+
+
+def aplicar_retencion(ahora=None, lote=1000, archivos=None):
+    """
+    Aplica los plazos RETENCION_*_DIAS. `archivos` ({'tomas': f,
+    'notificaciones': f}) recibe las filas borradas en JSONL. Devuelve
+    cuántas filas borró de cada tabla.
+    """
+    ahora = ahora or timezone.now()
+    archivos = archivos or {}
+    corte_tomas = ahora - timedelta(days=settings.RETENCION_TOMAS_DIAS)
+    corte_notificaciones = ahora - timedelta(days=settings.RETENCION_NOTIFICACIONES_DIAS)
+    corte_recordatorios = ahora - timedelta(days=settings.RETENCION_RECORDATORIOS_DIAS)
+    corte_eventos = ahora - timedelta(days=settings.RETENCION_EVENTOS_DIAS)
+    _local.activa = True
+    try:
+        return {
+            'tomas': _depurar(
+                tomas_viejas(corte_tomas), lote, _resumir_tomas, archivos.get('tomas'),
+            ),
+            'notificaciones': _depurar(
+                Notificacion.objects.filter(fecha_envio__lt=corte_notificaciones), lote,
+                _resumir_notificaciones, archivos.get('notificaciones'),
+            ),
+            'recordatorios': _depurar(
+                RecordatorioMedicamento.objects.filter(hora__lt=corte_recordatorios), lote,
+            ),
+            'eventos': _depurar(EventoSincronizado.objects.filter(recibido_en__lt=corte_eventos), lote),
+        }
+    finally:
+        _local.activa = False
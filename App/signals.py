@@ -0,0 +1,92 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Medicamento, Notificacion, PerfilUsuario, RegistroHidratacion, RegistroToma
+from . import consultas_lentas, notificaciones, recordatorios, retencion, tendencias, versiones
+
+
+@receiver(post_save, sender=Notificacion)
+def notificacion_creada(sender, instance, created, **kwargs):
+    """Avanza el cursor del polling y avisa a las conexiones SSE del usuario."""
+    if created:
+        usuario_id, notificacion_id = instance.usuario_id, instance.id
+
+        def publicar():
+            notificaciones.actualizar_cursor(usuario_id, notificacion_id)
+            notificaciones.avisar(usuario_id)
+
+        transaction.on_commit(publicar)
+
+
+# --- Agenda desnormalizada de Medicamento ---
+@receiver(post_save, sender=RegistroToma)
+def toma_guardada(sender, instance, created, **kwargs):
+    """Mantiene ultima_toma / proxima_toma al registrar una toma."""
+    med = instance.medicamento
+    versiones.invalidar(med.usuario_id)
+    if not created:
+        med.recalcular_ultima_toma()
+        return
+
+    recordatorios.marcar_tomado(med, instance.fecha_hora)
+    recordatorios.avanzar_agenda(med, instance.fecha_hora)
+
+
+@receiver(post_save, sender=Medicamento)
+def medicamento_guardado(sender, instance, created, **kwargs):
+    """Al cambiar frecuencia, duración o estado se rehacen las dosis futuras."""
+    versiones.invalidar(instance.usuario_id)
+    if not created and instance.programa_cambio():
+        recordatorios.reprogramar(instance, timezone.now())
+        Medicamento.objects.filter(pk=instance.pk).update(recordatorios_hasta=instance.recordatorios_hasta)
+    instance._programa_original = instance.programa()
+
+
+@receiver(post_delete, sender=RegistroToma)
+def toma_eliminada(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Medicamento):
+        return  # se está borrando el medicamento completo
+    if retencion.en_curso():
+        return  # nunca borra la última toma: la agenda no cambia
+    med = Medicamento.objects.filter(pk=instance.medicamento_id).first()
+    if med:
+        versiones.invalidar(med.usuario_id)
+    if med and med.ultima_toma and instance.fecha_hora >= med.ultima_toma:
+        med.recalcular_ultima_toma()
+
+
+# --- Versión de los datos del usuario (cache del tablero) ---
+@receiver(post_delete, sender=Medicamento)
+@receiver(post_save, sender=RegistroHidratacion)
+@receiver(post_delete, sender=RegistroHidratacion)
+def datos_usuario_cambiados(sender, instance, **kwargs):
+    versiones.invalidar(instance.usuario_id)
+
+
+@receiver(post_save, sender=RegistroHidratacion)
+@receiver(post_delete, sender=RegistroHidratacion)
+def hidratacion_cambiada(sender, instance, **kwargs):
+    """
+    Los períodos cerrados de tendencias.py se cachean sin vencimiento: se
+    borran al confirmar, para que una lectura intermedia no vuelva a guardar
+    los datos viejos.
+    """
+    usuario_id, fecha = instance.usuario_id, instance.fecha
+    transaction.on_commit(lambda: tendencias.invalidar(usuario_id, fecha))
+
+
+@receiver(post_save, sender=PerfilUsuario)
+@receiver(post_delete, sender=PerfilUsuario)
+def perfil_cambiado(sender, instance, **kwargs):
+    versiones.invalidar(instance.user_id)
+
+
+@receiver(connection_created)
+def conexion_creada(sender, connection, **kwargs):
+    """Instala el registro de consultas lentas si está activado."""
+    if settings.CONSULTAS_LENTAS_MS > 0:
+        consultas_lentas.instalar(connection)
@@ -0,0 +1,167 @@
+"""
+Sincronización de lo que la PWA registró sin conexión.
+
+El cliente guarda en una cola (localStorage) cada toma y cada cambio de vasos
+de agua con la hora del teléfono y una clave única, y al reconectarse manda
+la cola entera en un solo POST. `aplicar`:
+
+- valida cada evento (medicamento del usuario, hora no futura ni más vieja
+  que SINCRONIZACION_MAX_DIAS) y rechaza los que no sirven con el motivo;
+- descarta los repetidos, dentro del lote o ya recibidos antes
+  (`EventoSincronizado`, único por usuario y clave): reenviar un lote cuya
+  respuesta se perdió no duplica nada;
+- inserta las claves y las tomas con un `bulk_create` por tabla, y crea los
+  registros de hidratación que falten con otro;
+- como `bulk_create` y `update()` no disparan signals, hace a mano lo que
+  harían: marca las dosis tomadas con un UPDATE por medicamento, avanza su
+  agenda una sola vez (con su toma más reciente) y suma los vasos de cada día
+  con un UPDATE con F(); luego invalida versiones y, al confirmar, tendencias.
+
+Si otra petición inserta entretanto alguna de las claves, el lote se
+reintenta (ya cuentan como duplicadas) hasta REINTENTOS veces; después la
+vista responde 409 y el cliente conserva la cola para el próximo envío.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import recordatorios, tendencias, versiones
+from .models import EventoSincronizado, Medicamento, PerfilUsuario, RegistroHidratacion, RegistroToma
+
+
+REINTENTOS = 3
+
+
+class LoteInvalido(ValueError):
+    """El cuerpo no es una lista de eventos o supera SINCRONIZACION_MAX_EVENTOS."""
+
+
+def _validar(evento, medicamentos, desde, hasta):
+    """(clave, tipo, fecha, dato) del evento, o ValueError con el motivo."""
+    if not isinstance(evento, dict):
+        raise ValueError("evento inválido")
+    clave = evento.get('clave')
+    if not isinstance(clave, str) or not 0 < len(clave) <= 64:
+        raise ValueError("clave inválida")
+    fecha = parse_datetime(str(evento.get('fecha_hora', '')))
+    if fecha is None:
+        raise ValueError("fecha_hora inválida")
+    if timezone.is_naive(fecha):
+        fecha = timezone.make_aware(fecha)
+    if not desde <= fecha <= hasta:
+        raise ValueError("fecha_hora fuera de rango")
+
+    tipo = evento.get('tipo')
+    if tipo == 'toma':
+        med = medicamentos.get(evento.get('medicamento_id'))
+        if med is None:
+            raise ValueError("medicamento no encontrado")
+        return clave, tipo, fecha, med
+    if tipo == 'agua':
+        cantidad = evento.get('cantidad', 1)
+        if not isinstance(cantidad, int) or not 0 < abs(cantidad) <= 100:
+            raise ValueError("cantidad inválida")
+        return clave, tipo, fecha, cantidad
+    raise ValueError("tipo inválido")
+
+
+def _insertar(usuario, validos, ahora):
+    """Inserta los eventos nuevos; devuelve (aplicados, duplicados)."""
+    existentes = set(
+        EventoSincronizado.objects.filter(usuario=usuario, clave__in=[v[0] for v in validos])
+        .values_list('clave', flat=True)
+    )
+    nuevos, duplicados = [], []
+    for evento in validos:
+        if evento[0] in existentes:
+            duplicados.append(evento[0])
+        else:
+            existentes.add(evento[0])
+            nuevos.append(evento)
+    if not nuevos:
+        return [], duplicados
+
+    tomas = [(fecha, med) for _, tipo, fecha, med in nuevos if tipo == 'toma']
+    vasos = defaultdict(int)
+    for _, tipo, fecha, cantidad in nuevos:
+        if tipo == 'agua':
+            vasos[timezone.localdate(fecha)] += cantidad
+
+    with transaction.atomic():
+        EventoSincronizado.objects.bulk_create(
+            EventoSincronizado(usuario=usuario, clave=clave, tipo=tipo, ocurrido_en=fecha, recibido_en=ahora)
+            for clave, tipo, fecha, _ in nuevos
+        )
+        RegistroToma.objects.bulk_create(RegistroToma(medicamento=med, fecha_hora=fecha) for fecha, med in tomas)
+        por_medicamento = defaultdict(list)
+        for fecha, med in tomas:
+            por_medicamento[med].append(fecha)
+        for med, fechas in por_medicamento.items():
+            recordatorios.marcar_tomados(med, fechas)
+            recordatorios.avanzar_agenda(med, max(fechas))
+
+        if vasos:
+            perfil = PerfilUsuario.objects.filter(user=usuario).first()
+            meta = perfil.calcular_meta_agua_vasos() if perfil else 8
+            RegistroHidratacion.objects.bulk_create(
+                (RegistroHidratacion(usuario=usuario, fecha=fecha, meta_vasos=meta) for fecha in vasos),
+                ignore_conflicts=True,
+            )
+            for fecha, cantidad in vasos.items():
+                RegistroHidratacion.objects.filter(usuario=usuario, fecha=fecha).update(
+                    vasos_tomados=Greatest(F('vasos_tomados') + cantidad, 0)
+                )
+
+            # Los períodos cerrados se cachean sin vencimiento: se borran al
+            # confirmar, para que una lectura intermedia no guarde los viejos
+            def invalidar_tendencias():
+                for fecha in vasos:
+                    tendencias.invalidar(usuario.id, fecha)
+
+            transaction.on_commit(invalidar_tendencias)
+        versiones.invalidar(usuario.id)
+    return [evento[0] for evento in nuevos], duplicados
+
+
+def aplicar(usuario, eventos, ahora=None):
+    """
+    Aplica un lote de eventos del cliente. Devuelve las claves aplicadas, las
+    duplicadas (ya aplicadas antes) y los rechazados con su motivo.
+    """
+    if not isinstance(eventos, list) or len(eventos) > settings.SINCRONIZACION_MAX_EVENTOS:
+        raise LoteInvalido(f"se esperaba una lista de hasta {settings.SINCRONIZACION_MAX_EVENTOS} eventos")
+    ahora = ahora or timezone.now()
+    desde = ahora - timedelta(days=settings.SINCRONIZACION_MAX_DIAS)
+    hasta = ahora + timedelta(minutes=settings.SINCRONIZACION_DESFASE_MINUTOS)
+    medicamentos = {med.id: med for med in Medicamento.objects.filter(usuario=usuario)}
+
+    validos, rechazados, vistas = [], [], set()
+    duplicados = []
+    for evento in eventos:
+        try:
+            valido = _validar(evento, medicamentos, desde, hasta)
+        except ValueError as e:
+            clave = evento.get('clave') if isinstance(evento, dict) else None
+            rechazados.append({'clave': clave, 'motivo': str(e)})
+            continue
+        if valido[0] in vistas:
+            duplicados.append(valido[0])
+        else:
+            vistas.add(valido[0])
+            validos.append(valido)
+
+    for intento in range(1, REINTENTOS + 1):
+        try:
+            aplicados, repetidos = _insertar(usuario, validos, ahora)
+            break
+        except IntegrityError:
+            # Otra petición insertó alguna de las claves entretanto: ya cuentan como duplicadas
+            if intento == REINTENTOS:
+                raise
+    return {'aplicados': aplicados, 'duplicados': duplicados + repetidos, 'rechazados': rechazados}
@@ -0,0 +1,44 @@
+"""
+`{% fragmento nombre var1 var2 ... %}...{% endfragmento %}`: como el tag
+`{% cache %}` de Django, pero con un TTL fijo (`FRAGMENTOS_CACHE_TTL`) y
+contando aciertos y fallos en las métricas (`fragmento_<nombre>`).
+
+Las variables forman la clave: deben cambiar cuando cambia el contenido
+(p. ej. `user.id version hoy`, ver App/versiones.py). Lo que depende del request (token CSRF, hora
+actual) va fuera del fragmento.
+"""
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from App import metricas
+
+
+register = template.Library()
+
+
+class FragmentoNode(template.Node):
+    def __init__(self, nodelist, nombre, variables):
+        self.nodelist = nodelist
+        self.nombre = nombre
+        self.variables = variables
+
+    def render(self, context):
+        clave = make_template_fragment_key(self.nombre, [v.resolve(context) for v in self.variables])
+        html = cache.get(clave)
+        metricas.registrar_cache(f"fragmento_{self.nombre}", html is not None)
+        if html is None:
+            html = self.nodelist.render(context)
+            cache.set(clave, html, settings.FRAGMENTOS_CACHE_TTL)
+        return html
+
+
+@register.tag
+def fragmento(parser, token):
+    partes = token.split_contents()
+    if len(partes) < 2:
+        raise template.TemplateSyntaxError("'fragmento' necesita un nombre")
+    nodelist = parser.parse(('endfragmento',))
+    parser.delete_first_token()
+    return FragmentoNode(nodelist, partes[1], [parser.compile_filter(p) for p in partes[2:]])
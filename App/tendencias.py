@@ -0,0 +1,144 @@
+"""
+Tendencias de hidratación por semana, mes o año.
+
+Cada período se agrega en la base (`TruncWeek`/`TruncMonth`/`TruncYear` con
+`Count` condicional y `Avg`): días registrados, días con la meta cumplida,
+progreso y vasos promedio. Los períodos cerrados no cambian salvo que se
+edite un día pasado, así que se cachean sin vencimiento; la signal de
+`RegistroHidratacion` borra los períodos del día que cambió (`invalidar`).
+El período en curso se calcula siempre. Como no vencen, con varios workers
+hace falta una cache compartida para que la invalidación llegue a todos.
+"""
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, FloatField, Q
+from django.db.models.functions import Cast, NullIf, TruncMonth, TruncWeek, TruncYear
+from django.utils import timezone
+
+from . import metricas
+from .models import RegistroHidratacion
+
+
+def _inicio_semana(fecha):
+    return fecha - timedelta(days=fecha.weekday())
+
+
+def _anterior_semana(inicio):
+    return inicio - timedelta(days=7)
+
+
+def _inicio_mes(fecha):
+    return fecha.replace(day=1)
+
+
+def _anterior_mes(inicio):
+    return (inicio - timedelta(days=1)).replace(day=1)
+
+
+def _inicio_anio(fecha):
+    return date(fecha.year, 1, 1)
+
+
+def _anterior_anio(inicio):
+    return date(inicio.year - 1, 1, 1)
+
+
+# periodo -> (función de truncado en SQL, inicio del período, inicio del anterior)
+PERIODOS = {
+    'semana': (TruncWeek, _inicio_semana, _anterior_semana),
+    'mes': (TruncMonth, _inicio_mes, _anterior_mes),
+    'anio': (TruncYear, _inicio_anio, _anterior_anio),
+}
+
+
+def _clave(usuario_id, periodo, inicio):
+    return f"App.tendencias.{usuario_id}.{periodo}.{inicio.isoformat()}"
+
+
+def invalidar(usuario_id, fecha):
+    """Descarta los períodos cacheados que contienen `fecha`."""
+    cache.delete_many([
+        _clave(usuario_id, periodo, inicio_de(fecha)) for periodo, (_, inicio_de, _) in PERIODOS.items()
+    ])
+
+
+def agregar(usuario_id, periodo, desde):
+    """{inicio del período: métricas} de los períodos desde `desde`, en una consulta."""
+    trunc = PERIODOS[periodo][0]
+    progreso = Cast(F('vasos_tomados'), FloatField()) * 100 / NullIf(F('meta_vasos'), 0)
+    filas = (
+        RegistroHidratacion.objects
+        .filter(usuario_id=usuario_id, fecha__gte=desde)
+        .annotate(inicio=trunc('fecha'))
+        .values('inicio')
+        .annotate(
+            dias_registrados=Count('id'),
+            dias_meta_cumplida=Count('id', filter=Q(vasos_tomados__gte=F('meta_vasos'))),
+            progreso_promedio=Avg(progreso),
+            vasos_promedio=Avg('vasos_tomados'),
+        )
+    )
+    return {
+        fila['inicio']: {
+            'dias_registrados': fila['dias_registrados'],
+            'dias_meta_cumplida': fila['dias_meta_cumplida'],
+            'progreso_promedio': round(fila['progreso_promedio'] or 0, 1),
+            'vasos_promedio': round(fila['vasos_promedio'] or 0, 1),
+        }
+        for fila in filas
+    }
+
+
+def rachas(usuario_id, desde, hoy):
+    """
+    (actual, máxima) de días seguidos con la meta cumplida desde `desde`. Si
+    hoy todavía no se cumplió, la racha actual cuenta hasta ayer.
+    """
+    dias = RegistroHidratacion.objects.filter(
+        usuario_id=usuario_id, fecha__gte=desde, fecha__lte=hoy, vasos_tomados__gte=F('meta_vasos'),
+    ).order_by('fecha').values_list('fecha', flat=True)
+    maxima = racha = 0
+    anterior = None
+    for dia in dias:
+        racha = racha + 1 if anterior and dia - anterior == timedelta(days=1) else 1
+        maxima = max(maxima, racha)
+        anterior = dia
+    actual = racha if anterior and (hoy - anterior).days <= 1 else 0
+    return actual, maxima
+
+
+def tendencias(usuario_id, periodo, cantidad, hoy=None):
+    """Los últimos `cantidad` períodos (el más viejo primero) y las rachas."""
+    hoy = hoy or timezone.localdate()
+    _, inicio_de, anterior = PERIODOS[periodo]
+    inicios = [inicio_de(hoy)]
+    while len(inicios) < cantidad:
+        inicios.append(anterior(inicios[-1]))
+    inicios.reverse()
+    actual = inicios[-1]
+
+    claves = {inicio: _clave(usuario_id, periodo, inicio) for inicio in inicios[:-1]}
+    cacheados = cache.get_many(claves.values())
+    faltan = [inicio for inicio in inicios[:-1] if claves[inicio] not in cacheados]
+    for inicio in inicios[:-1]:
+        metricas.registrar_cache('tendencias', inicio not in faltan)
+
+    calculados = agregar(usuario_id, periodo, faltan[0] if faltan else actual)
+    vacio = {'dias_registrados': 0, 'dias_meta_cumplida': 0, 'progreso_promedio': 0, 'vasos_promedio': 0}
+    cache.set_many({claves[inicio]: calculados.get(inicio, vacio) for inicio in faltan}, None)
+
+    resultado = []
+    for inicio in inicios:
+        if inicio == actual or inicio in faltan:
+            datos = calculados.get(inicio, vacio)
+        else:
+            datos = cacheados[claves[inicio]]
+        resultado.append({'inicio': inicio, **datos})
+    racha_actual, racha_maxima = rachas(usuario_id, inicios[0], hoy)
+    return {
+        'periodo': periodo,
+        'periodos': resultado,
+        'racha_actual': racha_actual,
+        'racha_maxima': racha_maxima,
+    }
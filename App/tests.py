@@ -1,3 +1,1115 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import consultas_lentas, metricas, notificaciones, sincronizacion, views
+from .models import (
+    AdherenciaMedicamento, EventoSincronizado, Medicamento, Notificacion, PerfilUsuario, RecordatorioMedicamento,
+    RegistroHidratacion, RegistroToma, RelacionCuidador, ResumenDiarioNotificacion, ResumenDiarioToma,
+)
+from .recordatorios import Programador, desactivar_tratamientos_terminados, extender_recordatorios
+from .adherencia import calcular_adherencia
+from .agenda import rango_del_dia
+from .resumen_diario import generar_resumenes
+from .retencion import aplicar_retencion
+
+
+# Presupuesto de latencia por request (ms). Es holgado a propósito: sirve para
+# detectar regresiones groseras (p. ej. consultas dentro de un loop), no para
+# medir. Se puede ajustar en CI con MEDALERT_LATENCIA_MAX_MS.
+LATENCIA_MAX_MS = float(os.environ.get('MEDALERT_LATENCIA_MAX_MS', 500))
+
+
+def sembrar_usuario(username, medicamentos=30, tomas=3000, notificaciones=2000, dias_hidratacion=365):
+    """Crea un usuario con un volumen de datos realista usando bulk_create."""
+    user = User.objects.create_user(username=username, password='clave-segura-123')
+    PerfilUsuario.objects.create(
+        user=user, peso_kg=70, altura_cm=170, sexo='F', nivel_actividad='moderado'
+    )
+    meds = [
+        Medicamento.objects.create(
+            usuario=user, nombre=f"Medicamento {i}", dosis="1 comprimido",
+            frecuencia_horas=8, duracion_dias=30,
+        )
+        for i in range(medicamentos)
+    ]
+    ahora = timezone.now()
+    if meds:
+        RegistroToma.objects.bulk_create(
+            RegistroToma(medicamento=meds[i % len(meds)], fecha_hora=ahora - timedelta(hours=i))
+            for i in range(1, tomas + 1)
+        )
+        # bulk_create no dispara signals: se recalcula la agenda desnormalizada
+        for med in meds:
+            med.recalcular_ultima_toma()
+    Notificacion.objects.bulk_create(
+        Notificacion(
+            usuario=user, tipo='agua', mensaje="¡Recuerda hidratarte! 💧",
+            fecha_envio=ahora - timedelta(hours=2 * i), enviado=True,
+        )
+        for i in range(notificaciones)
+    )
+    hoy = timezone.localdate()
+    RegistroHidratacion.objects.bulk_create(
+        RegistroHidratacion(usuario=user, fecha=hoy - timedelta(days=d), vasos_tomados=d % 10, meta_vasos=10)
+        for d in range(1, dias_hidratacion + 1)
+    )
+    return user
+
+
+class ContratoRendimientoMixin:
+    """Aserciones de cantidad de consultas y latencia por request."""
+
+    def medir(self, metodo, url, **kwargs):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            response = getattr(self.client, metodo)(url, **kwargs)
+            ms = (time.perf_counter() - inicio) * 1000
+        return response, len(consultas), ms
+
+    def assertContrato(self, metodo, url, max_consultas, **kwargs):
+        response, n, ms = self.medir(metodo, url, **kwargs)
+        self.assertLess(response.status_code, 400, f"{url} respondió {response.status_code}")
+        self.assertLessEqual(
+            n, max_consultas, f"{metodo.upper()} {url}: {n} consultas (máximo {max_consultas})"
+        )
+        self.assertLess(
+            ms, LATENCIA_MAX_MS, f"{metodo.upper()} {url}: {ms:.0f} ms (máximo {LATENCIA_MAX_MS:.0f} ms)"
+        )
+        return response
+
+
+class ContratoRendimientoTests(ContratoRendimientoMixin, TestCase):
+    """
+    Límite de consultas SQL por vista con datos realistas. Los límites no
+    dependen de cuántos medicamentos, tomas o notificaciones tenga el usuario:
+    una consulta dentro de un loop rompe el test.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = sembrar_usuario('paciente')
+        cls.medicamento = cls.user.medicamentos.first()
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def test_home(self):
+        # sesión, usuario, medicamentos, perfil, hidratación (sólo lectura)
+        self.assertContrato('get', reverse('home'), 5)
+        # tablero cacheado: sólo sesión y usuario
+        self.assertContrato('get', reverse('home'), 2)
+        self.assertFalse(Notificacion.objects.filter(usuario=self.user, tipo='resumen').exists())
+
+    def test_medicamentos(self):
+        # sesión, usuario, medicamentos
+        self.assertContrato('get', reverse('medicamentos'), 3)
+
+    def test_hidratacion(self):
+        # sesión, usuario, perfil, registro del día (+ alta en savepoint)
+        self.assertContrato('get', reverse('hidratacion'), 7)
+        self.assertContrato('get', reverse('hidratacion'), 4)
+
+    def test_obtener_notificaciones(self):
+        # Sin cursor (clientes viejos): sesión, usuario, pendientes y UPDATE de enviado
+        self.assertContrato('get', reverse('notificaciones'), 4)
+        Notificacion.objects.create(usuario=self.user, tipo='agua', mensaje="¡Recuerda hidratarte! 💧")
+        response = self.assertContrato('get', reverse('notificaciones'), 4)
+        self.assertEqual(len(response.json()['notificaciones']), 1)
+
+    def test_notificaciones_con_cursor(self):
+        cache.clear()
+        url = reverse('notificaciones')
+        # primera vez: sesión, usuario, último id (queda en cache) y pendientes
+        cursor = self.assertContrato('get', url + '?since=0', 4).json()['cursor']
+        # nada nuevo: sólo sesión y usuario
+        response = self.assertContrato('get', f"{url}?since={cursor}", 2)
+        self.assertEqual(response.json()['notificaciones'], [])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            nueva = Notificacion.objects.create(usuario=self.user, tipo='agua', mensaje="¡Recuerda hidratarte! 💧")
+        response = self.assertContrato('get', f"{url}?since={cursor}", 3)
+        self.assertEqual([n['id'] for n in response.json()['notificaciones']], [nueva.id])
+        self.assertEqual(response.json()['cursor'], nueva.id)
+        etag = response['ETag']
+
+        # sin confirmar sigue pendiente; la confirmación la marca como enviada
+        self.assertFalse(Notificacion.objects.get(id=nueva.id).enviado)
+        response = self.client.post(
+            reverse('confirmar_notificaciones'), {'ids': [nueva.id]}, content_type='application/json'
+        )
+        self.assertEqual(response.json()['confirmadas'], 1)
+        self.assertTrue(Notificacion.objects.get(id=nueva.id).enviado)
+
+        # confirmada desde otra pestaña: el ETag cambia y no se reusa el cuerpo viejo
+        response = self.client.get(f"{url}?since={cursor}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['notificaciones'], [])
+
+    def test_registrar_toma(self):
+        url = reverse('registrar_toma', args=[self.medicamento.id])
+        # sesión, usuario, medicamento, toma, dosis tomada, dosis futuras y agenda
+        response = self.assertContrato('post', url, 7)
+        self.assertAlmostEqual(response.json()['remaining_seconds'], 8 * 3600, delta=5)
+
+    def test_perfil_usuario(self):
+        # sesión, usuario, perfil
+        self.assertContrato('get', reverse('perfil_usuario'), 3)
+
+
+class ConsultasNoCrecenTests(ContratoRendimientoMixin, TestCase):
+    """La cantidad de consultas es la misma con 1 que con 40 medicamentos."""
+
+    def contar(self, user, nombre_url):
+        self.client.force_login(user)
+        self.client.get(reverse(nombre_url))  # primera visita: altas del día
+        _, n, _ = self.medir('get', reverse(nombre_url))
+        return n
+
+    def test_vistas_no_escalan_con_los_datos(self):
+        chico = sembrar_usuario('chico', medicamentos=1, tomas=5, notificaciones=5, dias_hidratacion=2)
+        grande = sembrar_usuario('grande', medicamentos=40, tomas=2000, notificaciones=500)
+        for nombre_url in ('home', 'medicamentos', 'hidratacion', 'perfil_usuario', 'notificaciones'):
+            with self.subTest(vista=nombre_url):
+                self.assertEqual(self.contar(chico, nombre_url), self.contar(grande, nombre_url))
+
+
+class HerramientasBenchmarkTests(TransactionTestCase):
+    """Humo: el generador y el benchmark siguen funcionando (los hilos ven los datos confirmados)."""
+
+    def test_genera_datos_y_mide_wsgi(self):
+        call_command(
+            'generar_datos_prueba', usuarios=2, medicamentos=2, tomas=10, dias_hidratacion=3,
+            notificaciones=5, prefijo='humo', stdout=io.StringIO(),
+        )
+        self.assertEqual(User.objects.filter(username__startswith='humo_').count(), 2)
+        self.assertEqual(RegistroToma.objects.count(), 20)
+
+        salida = io.StringIO()
+        call_command(
+            'benchmark', '--modo', 'wsgi', '--prefijo', 'humo', '--peticiones', '4', '--concurrencia', '2',
+            '--endpoints', 'home', 'notificaciones', '--json', stdout=salida,
+        )
+        resultado = json.loads(salida.getvalue())
+        for nombre in ('home', 'notificaciones'):
+            self.assertEqual(resultado['endpoints'][nombre]['errores'], 0)
+            self.assertEqual(resultado['endpoints'][nombre]['n'], 4)
+
+
+class VerificarIndicesTests(TestCase):
+    def test_las_consultas_frecuentes_usan_sus_indices(self):
+        salida = io.StringIO()
+        call_command('verificar_indices', '--plan', stdout=salida, no_color=True)
+        salida = salida.getvalue()
+        self.assertNotIn("FALLA", salida)
+        self.assertIn("OK    obtener_notificaciones: pendientes del usuario", salida)
+        for indice in ('notif_pendientes_idx', 'notif_usuario_tipo_fecha_idx', 'toma_medicamento_fecha_idx'):
+            self.assertIn(indice, salida)
+
+
+class ResumenDiarioTests(TestCase):
+    def crear_usuario(self, username, resumen=True, medicamentos=2):
+        user = User.objects.create(username=username)
+        PerfilUsuario.objects.create(user=user, notificar_resumen_diario=resumen)
+        for i in range(medicamentos):
+            Medicamento.objects.create(
+                usuario=user, nombre=f"Medicamento {i}", dosis="1", frecuencia_horas=8, duracion_dias=10,
+            )
+        return user
+
+    def test_crea_un_resumen_por_usuario_activado(self):
+        activado = self.crear_usuario('activado')
+        self.crear_usuario('desactivado', resumen=False)
+        self.crear_usuario('sin_medicamentos', medicamentos=0)
+
+        salida = io.StringIO()
+        call_command('generar_resumenes', stdout=salida)
+        self.assertIn('1 resúmenes creados', salida.getvalue())
+        resumen = Notificacion.objects.get(tipo='resumen')
+        self.assertEqual(resumen.usuario, activado)
+        self.assertIn('Medicamento 1: próxima dosis', resumen.mensaje)
+
+        # idempotente en el mismo día
+        call_command('generar_resumenes', stdout=salida)
+        self.assertEqual(Notificacion.objects.filter(tipo='resumen').count(), 1)
+
+    def test_idempotente_para_un_dia_pasado(self):
+        self.crear_usuario('ayer')
+        ayer = timezone.localdate() - timedelta(days=1)
+        for _ in range(2):
+            call_command('generar_resumenes', fecha=ayer.isoformat(), stdout=io.StringIO())
+        resumen = Notificacion.objects.get(tipo='resumen')
+        self.assertEqual(timezone.localdate(resumen.fecha_envio), ayer)
+
+    def test_consultas_constantes_por_lote(self):
+        for i in range(3):
+            self.crear_usuario(f"pocos_{i}")
+        # ids, resúmenes ya creados, medicamentos, INSERT y lote vacío final
+        with self.assertNumQueries(5):
+            generar_resumenes(lote=100)
+        Notificacion.objects.all().delete()
+        for i in range(20):
+            self.crear_usuario(f"muchos_{i}")
+        with self.assertNumQueries(5):
+            self.assertEqual(generar_resumenes(lote=100), 23)
+
+
+class RecordatoriosMaterializadosTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='grilla')
+        self.med = Medicamento.objects.create(
+            usuario=self.user, nombre="Amoxicilina", dosis="500 mg", frecuencia_horas=8, duracion_dias=7,
+        )
+        self.ahora = timezone.now()
+
+    def horas(self, **filtros):
+        return list(self.med.recordatorios.filter(**filtros).order_by('hora').values_list('hora', flat=True))
+
+    def test_genera_la_ventana_y_no_repite(self):
+        self.assertEqual(extender_recordatorios(self.ahora), 7)  # 0, 8, ..., 48 h
+        horas = self.horas()
+        self.assertEqual(horas[0], self.med.proxima_toma)
+        self.assertEqual(horas[1] - horas[0], timedelta(hours=8))
+        with self.assertNumQueries(1):
+            self.assertEqual(extender_recordatorios(self.ahora), 0)
+
+    def test_no_pasa_del_fin_del_tratamiento(self):
+        self.assertEqual(extender_recordatorios(self.ahora + timedelta(days=30)), 0)
+        extender_recordatorios(self.ahora + timedelta(days=6))
+        fin = self.med.created_at.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=7)
+        self.assertLess(max(self.horas()), fin)
+
+    def test_toma_marca_la_dosis_y_rehace_la_grilla(self):
+        extender_recordatorios(self.ahora)
+        primera = self.med.proxima_toma
+        toma = RegistroToma.objects.create(medicamento=self.med, fecha_hora=self.ahora + timedelta(hours=1))
+        self.assertEqual(self.horas(tomado=True), [primera])
+        self.assertEqual(self.horas(tomado=False), [])
+
+        extender_recordatorios(self.ahora)
+        self.assertEqual(self.horas(tomado=False)[0], toma.fecha_hora + timedelta(hours=8))
+
+    def test_editar_la_frecuencia_rehace_las_dosis_futuras(self):
+        extender_recordatorios(self.ahora)
+        med = Medicamento.objects.get(id=self.med.id)
+        med.frecuencia_horas = 12
+        med.save()
+        self.assertEqual(self.horas(hora__gt=timezone.now()), [])
+        extender_recordatorios(timezone.now())
+        futuras = self.horas(hora__gt=timezone.now())
+        self.assertEqual(futuras[1] - futuras[0], timedelta(hours=12))
+
+    def test_programador_avisa_las_dosis_vencidas(self):
+        programador = Programador()
+        programador.recargar()
+        self.assertEqual(programador.procesar_vencidos(), 1)
+        self.assertTrue(Notificacion.objects.filter(usuario=self.user, tipo='medicamento').exists())
+        self.assertTrue(self.med.recordatorios.get(hora=self.med.proxima_toma).notificado)
+
+
+class ProgramadorAguaTests(TestCase):
+    def setUp(self):
+        # Sin peso ni altura: el aviso de agua no depende del perfil fisiológico
+        self.user = User.objects.create(username='sediento')
+        self.perfil = PerfilUsuario.objects.create(user=self.user, recordatorio_horas=2)
+
+    def vencimientos(self, programador):
+        return sorted(cuando for cuando, tipo, _ in programador.heap if tipo == 'agua')
+
+    def test_avisa_y_reprograma_el_siguiente(self):
+        programador = Programador()
+        programador.recargar()
+        self.assertEqual(programador.procesar_vencidos(), 1)
+        aviso = Notificacion.objects.get(usuario=self.user, tipo='agua')
+        [siguiente] = self.vencimientos(programador)
+        self.assertAlmostEqual(siguiente, aviso.fecha_envio + timedelta(hours=2), delta=timedelta(seconds=1))
+        self.assertEqual(programador.procesar_vencidos(), 0)
+
+    def test_recarga_solo_los_perfiles_cambiados(self):
+        programador = Programador()
+        programador.recargar()
+        programador.procesar_vencidos()
+        aviso = Notificacion.objects.get(usuario=self.user, tipo='agua').fecha_envio
+        otro = PerfilUsuario.objects.create(user=User.objects.create(username='nuevo'), recordatorio_horas=1)
+
+        with CaptureQueriesContext(connection) as consultas:
+            programador.recargar()
+        [perfiles] = [q['sql'] for q in consultas if 'FROM "App_perfilusuario"' in q['sql']]
+        self.assertIn('"updated_at" >=', perfiles)
+        self.assertEqual(set(programador.agua), {self.perfil.id, otro.id})
+
+        # Un cambio de intervalo deja el vencimiento anterior sin efecto
+        self.perfil.recordatorio_horas = 5
+        self.perfil.save()
+        programador.recargar()
+        self.assertEqual(programador.agua[self.perfil.id], aviso + timedelta(hours=5))
+        self.assertEqual(len(self.vencimientos(programador)), 3)
+
+        # El vencimiento a las 2 h ya no vale y el de 5 h encuentra el perfil borrado
+        self.perfil.delete()
+        with mock.patch('App.recordatorios.timezone.now', return_value=aviso + timedelta(hours=6)):
+            self.assertEqual(programador.procesar_vencidos(), 1)  # sólo el de `otro`
+        self.assertEqual(set(programador.agua), {otro.id})
+
+
+class TratamientosTerminadosTests(TestCase):
+    def test_desactiva_en_un_update_y_las_vistas_los_omiten(self):
+        user = User.objects.create(username='barrido')
+        hace_10_dias = timezone.now() - timedelta(days=10)
+        nombres = {'terminado': 5, 'en_curso': 30, 'sin_fin': 0}
+        for nombre, dias in nombres.items():
+            med = Medicamento.objects.create(
+                usuario=user, nombre=nombre, dosis="1", frecuencia_horas=8, duracion_dias=dias,
+            )
+            Medicamento.objects.filter(id=med.id).update(created_at=hace_10_dias)
+            Medicamento.objects.get(id=med.id).save()  # recalcula fecha_fin_tratamiento
+
+        with self.assertNumQueries(1):
+            self.assertEqual(desactivar_tratamientos_terminados(), 1)
+        self.assertEqual(desactivar_tratamientos_terminados(), 0)
+        self.assertEqual(
+            set(Medicamento.objects.filter(activo=True).values_list('nombre', flat=True)), {'en_curso', 'sin_fin'}
+        )
+
+        self.client.force_login(user)
+        response = self.client.get(reverse('medicamentos'))
+        self.assertEqual([item['obj'].nombre for item in response.context['meds_info']].count('terminado'), 0)
+
+        salida = io.StringIO()
+        call_command('desactivar_tratamientos', stdout=salida)
+        self.assertIn('0 tratamientos desactivados', salida.getvalue())
+
+
+class RetencionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='historico')
+        self.med = Medicamento.objects.create(
+            usuario=self.user, nombre="Losartán", dosis="1", frecuencia_horas=12, duracion_dias=0,
+        )
+        self.abandonado = Medicamento.objects.create(
+            usuario=self.user, nombre="Abandonado", dosis="1", frecuencia_horas=12, duracion_dias=0,
+        )
+        ahora = timezone.now()
+        self.dia_viejo = ahora - timedelta(days=200)
+        RegistroToma.objects.bulk_create(
+            [RegistroToma(medicamento=self.med, fecha_hora=self.dia_viejo + timedelta(minutes=i)) for i in range(5)]
+            + [RegistroToma(medicamento=self.med, fecha_hora=ahora)]
+            + [RegistroToma(medicamento=self.abandonado, fecha_hora=self.dia_viejo + timedelta(minutes=i)) for i in range(3)]
+        )
+        for med in (self.med, self.abandonado):
+            med.recalcular_ultima_toma()
+        Notificacion.objects.bulk_create(
+            [Notificacion(usuario=self.user, tipo='agua', mensaje="💧", fecha_envio=self.dia_viejo) for _ in range(4)]
+            + [Notificacion(usuario=self.user, tipo='agua', mensaje="💧", fecha_envio=ahora)]
+        )
+
+    def test_resume_y_borra_por_lotes(self):
+        directorio = tempfile.mkdtemp()
+        salida = io.StringIO()
+        call_command('aplicar_retencion', '--lote', '2', '--archivo', directorio, stdout=salida)
+        self.assertIn('7 tomas depuradas', salida.getvalue())
+        self.assertIn('4 notificaciones depuradas', salida.getvalue())
+
+        fecha = timezone.localdate(self.dia_viejo)
+        self.assertEqual(ResumenDiarioToma.objects.get(medicamento=self.med, fecha=fecha).tomas, 5)
+        # se conserva la última toma de cada medicamento
+        self.assertEqual(ResumenDiarioToma.objects.get(medicamento=self.abandonado, fecha=fecha).tomas, 2)
+        self.assertEqual(self.abandonado.tomas.count(), 1)
+        self.assertEqual(self.med.tomas.count(), 1)
+        resumen = ResumenDiarioNotificacion.objects.get(usuario=self.user)
+        self.assertEqual((resumen.fecha, resumen.tipo, resumen.cantidad), (fecha, 'agua', 4))
+        self.assertEqual(Notificacion.objects.count(), 1)
+
+        archivo = os.path.join(directorio, f"tomas-{timezone.localdate()}.jsonl")
+        with open(archivo, encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 7)
+
+        # una segunda pasada suma a los resúmenes existentes
+        RegistroToma.objects.bulk_create([RegistroToma(medicamento=self.med, fecha_hora=self.dia_viejo)])
+        self.assertEqual(aplicar_retencion()['tomas'], 1)
+        self.assertEqual(ResumenDiarioToma.objects.get(medicamento=self.med, fecha=fecha).tomas, 6)
+
+    def test_lote_acotado_por_el_motor(self):
+        with mock.patch.object(connection.features, 'max_query_params', 3), \
+                CaptureQueriesContext(connection) as capturadas:
+            self.assertEqual(aplicar_retencion(lote=1000)['tomas'], 7)
+        borrados = [q['sql'] for q in capturadas if q['sql'].startswith('DELETE FROM "App_registrotoma"')]
+        self.assertEqual(len(borrados), 3)  # 3 + 3 + 1
+        # toma_eliminada no consulta el medicamento de cada toma borrada
+        self.assertFalse([q for q in capturadas if 'FROM "App_medicamento" WHERE' in q['sql']])
+
+
+class AdherenciaTests(TestCase):
+    def test_cuenta_dosis_a_tiempo_tardias_y_omitidas(self):
+        ahora = timezone.now()
+        user = User.objects.create(username='adherente')
+        med = Medicamento.objects.create(
+            usuario=user, nombre="Metformina", dosis="1", frecuencia_horas=24, duracion_dias=0,
+        )
+        inicio = ahora - timedelta(hours=241)
+        Medicamento.objects.filter(id=med.id).update(created_at=inicio)
+
+        def hora(h, m=0):
+            return inicio + timedelta(hours=h, minutes=m)
+
+        # Cada toma mueve la agenda: la dosis siguiente se debe 24 h después
+        RegistroToma.objects.bulk_create(RegistroToma(medicamento=med, fecha_hora=t) for t in [
+            hora(47, 30),                   # omitidas 0 h y 24 h; a tiempo (48 h), fuera de 7 días
+            hora(74, 30),                   # tardía (71:30), fuera de 7 días
+            hora(98, 35), hora(98, 40),     # a tiempo (98:30) y un doble toque que no cuenta
+            hora(171),                      # omitidas 122:40 y 146:40; a tiempo (170:40)
+            hora(195),                      # a tiempo, justo cuando tocaba
+        ])                                  # y omitida la de 219 h
+        otro = Medicamento.objects.create(
+            usuario=user, nombre="Sin tomas", dosis="1", frecuencia_horas=12, duracion_dias=0,
+        )
+        Medicamento.objects.filter(id=otro.id).update(created_at=ahora - timedelta(days=2, hours=2))
+
+        self.assertEqual(calcular_adherencia(ahora), 2)
+        self.assertEqual(calcular_adherencia(ahora), 2)  # vuelve a escribir las mismas filas
+        semana = AdherenciaMedicamento.objects.get(medicamento=med, ventana_dias=7)
+        self.assertEqual(
+            (semana.esperadas, semana.a_tiempo, semana.tardias, semana.omitidas), (6, 3, 0, 3)
+        )
+        mes = AdherenciaMedicamento.objects.get(medicamento=med, ventana_dias=30)
+        self.assertEqual((mes.esperadas, mes.tomadas, mes.omitidas), (10, 5, 5))
+        self.assertEqual(AdherenciaMedicamento.objects.get(medicamento=otro, ventana_dias=7).omitidas, 5)
+
+        self.client.force_login(user)
+        response = self.client.get(reverse('estadisticas'))
+        self.assertContains(response, "50.0%")  # 3 de 6 en la semana
+        self.assertEqual([t.esperadas for t in response.context['totales']], [11, 15, 15])
+
+    def test_una_toma_tardia_no_corre_las_siguientes(self):
+        ahora = timezone.now()
+        user = User.objects.create(username='puntual')
+        med = Medicamento.objects.create(
+            usuario=user, nombre="Amoxicilina", dosis="1", frecuencia_horas=8, duracion_dias=0,
+        )
+        inicio = ahora - timedelta(days=7) + timedelta(minutes=30)
+        Medicamento.objects.filter(id=med.id).update(created_at=inicio)
+        # La primera 2 h tarde y las demás justo en proxima_toma: 21 tomas hasta ahora
+        primera = inicio + timedelta(hours=2)
+        RegistroToma.objects.bulk_create(
+            RegistroToma(medicamento=med, fecha_hora=primera + timedelta(hours=8 * i)) for i in range(21)
+        )
+
+        calcular_adherencia(ahora)
+        semana = AdherenciaMedicamento.objects.get(medicamento=med, ventana_dias=7)
+        self.assertEqual(
+            (semana.esperadas, semana.a_tiempo, semana.tardias, semana.omitidas), (21, 20, 1, 0)
+        )
+
+    def test_la_dosis_en_curso_no_cuenta_como_omitida(self):
+        ahora = timezone.now()
+        med = Medicamento.objects.create(
+            usuario=User.objects.create(username='a_punto'), nombre="Amoxicilina", dosis="1",
+            frecuencia_horas=8, duracion_dias=0,
+        )
+        inicio = ahora - timedelta(hours=8, minutes=10)
+        Medicamento.objects.filter(id=med.id).update(created_at=inicio)
+        RegistroToma.objects.bulk_create([RegistroToma(medicamento=med, fecha_hora=inicio)])
+
+        def semana(cuando):
+            calcular_adherencia(cuando)
+            fila = AdherenciaMedicamento.objects.get(medicamento=med, ventana_dias=7)
+            return fila.esperadas, fila.a_tiempo, fila.tardias, fila.omitidas
+
+        # La segunda dosis se debía hace 10 minutos: todavía se puede tomar a tiempo
+        self.assertEqual(semana(ahora), (1, 1, 0, 0))
+        self.assertEqual(semana(ahora + timedelta(hours=1)), (2, 1, 0, 1))
+
+
+class HidratacionVasosTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='agua', password='clave-segura-123')
+        PerfilUsuario.objects.create(user=self.user, peso_kg=70, altura_cm=170, sexo='F', nivel_actividad='moderado')
+        self.client.force_login(self.user)
+        self.url = reverse('hidratacion_vasos')
+
+    def test_sumar_restar_y_fijar(self):
+        response = self.client.post(self.url, {'accion': 'sumar', 'cantidad': 3})
+        self.assertEqual(response.json()['vasos_tomados'], 3)  # crea el registro del día
+        meta = response.json()['meta_vasos']
+        self.assertEqual(meta, self.user.perfilusuario.calcular_meta_agua_vasos())
+
+        with self.assertNumQueries(4):  # sesión, usuario, UPDATE y lectura
+            response = self.client.post(self.url, {'accion': 'restar', 'cantidad': 5})
+        self.assertEqual(response.json()['vasos_tomados'], 0)  # no baja de cero
+
+        response = self.client.post(self.url, {'accion': 'fijar', 'cantidad': meta})
+        self.assertEqual(response.json()['progreso'], 100.0)
+        self.assertEqual(self.client.post(self.url, {'accion': 'otra'}).status_code, 400)
+
+    def test_formulario_sin_javascript_usa_el_mismo_update(self):
+        self.client.get(reverse('hidratacion'))
+        self.client.post(reverse('hidratacion'), {'agregar_vaso': ''})
+        self.client.post(reverse('hidratacion'), {'agregar_vaso': ''})
+        self.assertEqual(RegistroHidratacion.objects.get(usuario=self.user).vasos_tomados, 2)
+
+
+class TableroCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metricas.reiniciar()
+        self.user = User.objects.create_user(username='tablero', password='clave-segura-123')
+        self.perfil = PerfilUsuario.objects.create(
+            user=self.user, peso_kg=70, altura_cm=170, sexo='F', nivel_actividad='moderado',
+        )
+        self.med = Medicamento.objects.create(
+            usuario=self.user, nombre="Ibuprofeno", dosis="1", frecuencia_horas=8, duracion_dias=10,
+        )
+        self.client.force_login(self.user)
+
+    def visitar(self):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(reverse('home'))
+        return response, len(consultas)
+
+    def test_visita_repetida_sale_de_la_cache(self):
+        self.assertEqual(self.visitar()[1], 5)
+        response, n = self.visitar()
+        self.assertEqual(n, 2)  # sesión y usuario
+        self.assertEqual(len(response.context['medicamentos']), 1)
+        self.assertEqual(metricas._caches['tablero'], {'aciertos': 1, 'fallos': 1})
+
+    def test_las_signals_invalidan(self):
+        self.visitar()
+        cambios = [
+            lambda: RegistroToma.objects.create(medicamento=self.med, fecha_hora=timezone.now()),
+            lambda: views.ajustar_vasos(self.user, 'sumar', 2, timezone.localdate()),  # crea
+            lambda: views.ajustar_vasos(self.user, 'sumar', 1, timezone.localdate()),  # update()
+            lambda: self.perfil.save(),
+            lambda: Medicamento.objects.create(usuario=self.user, nombre="Otro", dosis="1", frecuencia_horas=12, duracion_dias=0),
+            lambda: self.med.delete(),
+        ]
+        for cambio in cambios:
+            cambio()
+            response, n = self.visitar()
+            self.assertGreater(n, 2)
+            self.assertEqual(self.visitar()[1], 2)
+        self.assertEqual(response.context['hidratacion'].vasos_tomados, 3)
+        self.assertEqual([m.nombre for m in response.context['medicamentos']], ["Otro"])
+
+    def test_barrido_de_tratamientos_invalida_a_todos(self):
+        self.visitar()
+        Medicamento.objects.filter(id=self.med.id).update(fecha_fin_tratamiento=timezone.localdate() - timedelta(days=1))
+        self.assertEqual(desactivar_tratamientos_terminados(), 1)
+        response, _ = self.visitar()
+        self.assertEqual(response.context['medicamentos'], [])
+
+
+class GetCondicionalTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='condicional', password='clave-segura-123')
+        PerfilUsuario.objects.create(user=self.user, peso_kg=70, altura_cm=170, sexo='F', nivel_actividad='moderado')
+        self.med = Medicamento.objects.create(
+            usuario=self.user, nombre="Ibuprofeno", dosis="1", frecuencia_horas=8, duracion_dias=10,
+        )
+        self.client.force_login(self.user)
+
+    def test_paginas_sin_cambios_responden_304_sin_consultar(self):
+        for nombre_url in ('home', 'medicamentos', 'hidratacion', 'perfil_usuario', 'agenda'):
+            with self.subTest(vista=nombre_url):
+                self.client.get(reverse(nombre_url))  # altas del día (hidratación)
+                etag = self.client.get(reverse(nombre_url))['ETag']
+                with self.assertNumQueries(2):  # sesión y usuario
+                    response = self.client.get(reverse(nombre_url), HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_un_cambio_de_datos_cambia_el_etag(self):
+        url = reverse('medicamentos')
+        etag = self.client.get(url)['ETag']
+        RegistroToma.objects.create(medicamento=self.med, fecha_hora=timezone.now())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # el contador usa la hora absoluta de la próxima dosis
+        proxima = Medicamento.objects.get(id=self.med.id).proxima_toma
+        self.assertContains(response, f'data-proxima="{int(proxima.timestamp())}"')
+
+    def test_agenda_json(self):
+        agenda = self.client.get(reverse('agenda')).json()
+        [med] = agenda['medicamentos']
+        self.assertEqual(med['nombre'], "Ibuprofeno")
+        horas = [datetime.fromisoformat(h) for h in med['horas']]
+        proxima = Medicamento.objects.get(id=self.med.id).proxima_toma
+        self.assertAlmostEqual(horas[0], proxima, delta=timedelta(milliseconds=1))  # JSON en milisegundos
+        self.assertTrue(all(b - a == timedelta(hours=8) for a, b in zip(horas, horas[1:])))
+        self.assertLess(horas[-1], datetime.fromisoformat(agenda['hasta']))
+        # el service worker la guarda por usuario
+        url = reverse('agenda')
+        self.assertEqual(self.client.get(f"{url}?usuario={self.user.id}").status_code, 200)
+        self.assertEqual(self.client.get(f"{url}?usuario={self.user.id + 1}").status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('agenda')).status_code, 302)
+        self.assertFalse(self.client.get(reverse('home')).has_header('ETag'))
+
+
+class FragmentosTests(TestCase):
+    def test_lista_de_medicamentos_cacheada(self):
+        cache.clear()
+        metricas.reiniciar()
+        user = User.objects.create(username='fragmentos')
+        meds = [
+            Medicamento.objects.create(usuario=user, nombre=f"Med {i}", dosis="1", frecuencia_horas=8, duracion_dias=5)
+            for i in range(3)
+        ]
+        self.client.force_login(user)
+        url = reverse('medicamentos')
+        self.client.get(url)
+        self.assertEqual(metricas._caches['fragmento_medicamentos'], {'aciertos': 0, 'fallos': 1})
+
+        # Otra visita sin cambios (otra cookie CSRF, sin 304): una lectura de cache y sin agenda
+        self.client.cookies.pop(settings.CSRF_COOKIE_NAME, None)
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(metricas._caches['fragmento_medicamentos'], {'aciertos': 1, 'fallos': 1})
+        self.assertFalse([q for q in consultas if 'FROM "App_medicamento"' in q['sql']])
+        self.assertContains(response, 'form="eliminar-medicamento"', count=3)
+        self.assertContains(response, 'name="csrfmiddlewaretoken"', count=2)  # eliminar y agregar, fuera de la lista
+
+        RegistroToma.objects.create(medicamento=meds[0])  # sube la versión de los datos
+        meds[1].nombre = "Renombrado"
+        meds[1].save()
+        response = self.client.get(url)
+        self.assertEqual(metricas._caches['fragmento_medicamentos'], {'aciertos': 1, 'fallos': 2})
+        self.assertContains(response, "Renombrado")
+        self.assertNotContains(response, "Med 1")
+
+
+class TendenciasHidratacionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='tendencias')
+        self.hoy = timezone.localdate()
+        self.lunes = self.hoy - timedelta(days=self.hoy.weekday())
+        # semana pasada completa: meta cumplida de martes a domingo (6 días seguidos)
+        RegistroHidratacion.objects.bulk_create(
+            RegistroHidratacion(usuario=self.user, fecha=self.lunes - timedelta(days=7 - d),
+                                vasos_tomados=4 if d == 0 else 8, meta_vasos=8)
+            for d in range(7)
+        )
+        self.client.force_login(self.user)
+        self.url = reverse('hidratacion_tendencias') + '?periodo=semana&n=3'
+
+    def test_agrega_por_semana_y_cachea_las_cerradas(self):
+        datos = self.client.get(self.url).json()
+        anterior, pasada, actual = datos['periodos']
+        self.assertEqual(pasada['inicio'], (self.lunes - timedelta(days=7)).isoformat())
+        self.assertEqual((pasada['dias_registrados'], pasada['dias_meta_cumplida']), (7, 6))
+        self.assertEqual(pasada['progreso_promedio'], round((50 + 6 * 100) / 7, 1))
+        self.assertEqual(anterior['dias_registrados'], 0)
+        self.assertEqual(actual['dias_registrados'], 0)
+        self.assertEqual((datos['racha_actual'], datos['racha_maxima']), (6 if self.hoy == self.lunes else 0, 6))
+
+        # update() no dispara la signal: la semana cerrada sale de la cache
+        RegistroHidratacion.objects.filter(usuario=self.user).update(vasos_tomados=0)
+        pasada = self.client.get(self.url).json()['periodos'][1]
+        self.assertEqual(pasada['dias_meta_cumplida'], 6)
+        # editar un día pasado con save() invalida su semana, al confirmar
+        with self.captureOnCommitCallbacks(execute=True):
+            RegistroHidratacion.objects.filter(usuario=self.user).first().save()
+            pasada = self.client.get(self.url).json()['periodos'][1]
+            self.assertEqual(pasada['dias_meta_cumplida'], 6)
+        pasada = self.client.get(self.url).json()['periodos'][1]
+        self.assertEqual(pasada['dias_meta_cumplida'], 0)
+
+        self.assertEqual(self.client.get(reverse('hidratacion_tendencias') + '?periodo=dia').status_code, 400)
+
+
+class PanelCuidadorTests(ContratoRendimientoMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cuidador = User.objects.create_user(username='cuidador', password='clave-segura-123')
+        PerfilUsuario.objects.create(user=cls.cuidador, es_cuidador=True)
+        pacientes = User.objects.bulk_create(User(username=f"paciente_{i:03}") for i in range(500))
+        RelacionCuidador.objects.bulk_create(RelacionCuidador(cuidador=cls.cuidador, paciente=p) for p in pacientes)
+        # Datos en una muestra de pacientes de varias páginas
+        ahora = timezone.now()
+        for p in pacientes[::40]:
+            for i in range(3):
+                med = Medicamento.objects.create(
+                    usuario=p, nombre=f"Med {i}", dosis="1", frecuencia_horas=8, duracion_dias=0,
+                )
+                RegistroToma.objects.create(medicamento=med, fecha_hora=ahora - timedelta(hours=i + 1))
+            RegistroHidratacion.objects.create(usuario=p, fecha=timezone.localdate(), vasos_tomados=3, meta_vasos=6)
+        cls.paciente = pacientes[0]
+
+    def setUp(self):
+        self.client.force_login(self.cuidador)
+
+    def test_consultas_constantes_con_500_pacientes(self):
+        # sesión, usuario, perfil, pacientes, medicamentos, hidratación: igual en todas las páginas
+        url, vistos = reverse('panel_cuidador'), []
+        while url:
+            response = self.assertContrato('get', url, 6)
+            vistos += [p.username for p in response.context['pacientes']]
+            siguiente = response.context['siguiente']
+            url = f"{reverse('panel_cuidador')}?despues={siguiente}" if siguiente else None
+        self.assertEqual(vistos, sorted(f"paciente_{i:03}" for i in range(500)))
+
+    def test_datos_del_paciente(self):
+        med = self.paciente.medicamentos.get(nombre="Med 0")
+        RecordatorioMedicamento.objects.filter(medicamento__usuario=self.paciente).delete()
+        inicio_dia, _ = rango_del_dia(timezone.localdate())
+        hora = max(timezone.now() - timedelta(minutes=30), inicio_dia)
+        RecordatorioMedicamento.objects.create(medicamento=med, hora=hora)
+        p = self.client.get(reverse('panel_cuidador')).context['pacientes'][0]
+        self.assertEqual(p.username, self.paciente.username)
+        self.assertEqual(p.proxima_dosis, min(m.proxima_toma for m in self.paciente.medicamentos.all()))
+        self.assertEqual(p.medicamentos_activos[0].proxima_toma, p.proxima_dosis)
+        self.assertEqual(p.dosis_atrasadas, 1)
+        self.assertEqual((p.vasos_hoy, p.meta_vasos_hoy, p.progreso_agua), (3, 6, 50.0))
+
+    def test_el_paciente_comparte_y_deja_de_compartir(self):
+        otro = User.objects.create_user(username='otro', password='clave-segura-123')
+        PerfilUsuario.objects.create(user=otro)
+        nuevo = User.objects.create_user(username='nuevo', password='clave-segura-123')
+        self.client.force_login(nuevo)
+        # Sólo con usuarios marcados como cuidador
+        self.client.post(reverse('cuidadores'), {'username': 'otro'})
+        self.client.post(reverse('cuidadores'), {'username': 'cuidador'})
+        relacion = RelacionCuidador.objects.get(paciente=nuevo)
+        self.assertEqual(relacion.cuidador, self.cuidador)
+
+        self.client.post(reverse('quitar_cuidador', args=[relacion.id]))
+        self.assertFalse(RelacionCuidador.objects.filter(paciente=nuevo).exists())
+
+    def test_sin_perfil_de_cuidador_no_ve_pacientes(self):
+        PerfilUsuario.objects.filter(user=self.cuidador).update(es_cuidador=False)
+        response = self.client.get(reverse('panel_cuidador'))
+        self.assertEqual(response.context['pacientes'], [])
+
+
+class SincronizacionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='sin_red', password='clave-segura-123')
+        PerfilUsuario.objects.create(user=self.user, peso_kg=70, altura_cm=170, sexo='F', nivel_actividad='moderado')
+        self.med = Medicamento.objects.create(
+            usuario=self.user, nombre="Ibuprofeno", dosis="1", frecuencia_horas=8, duracion_dias=0,
+        )
+        self.client.force_login(self.user)
+        self.ahora = timezone.now()
+
+    def sincronizar(self, eventos):
+        return self.client.post(reverse('sincronizar'), {'eventos': eventos}, content_type='application/json')
+
+    def evento(self, clave, horas, **datos):
+        return {'clave': clave, 'fecha_hora': (self.ahora - timedelta(hours=horas)).isoformat(), **datos}
+
+    def test_aplica_deduplica_y_devuelve_la_agenda(self):
+        ayer = timezone.localtime(self.ahora) - timedelta(days=1)
+        eventos = [
+            self.evento('t1', 10, tipo='toma', medicamento_id=self.med.id),
+            self.evento('t2', 0.5, tipo='toma', medicamento_id=self.med.id),
+            self.evento('t2', 0.5, tipo='toma', medicamento_id=self.med.id),
+            self.evento('a1', 0, tipo='agua'),
+            self.evento('a2', 0, tipo='agua', cantidad=2),
+            {'clave': 'a3', 'tipo': 'agua', 'fecha_hora': ayer.isoformat()},
+            self.evento('x1', 1, tipo='toma', medicamento_id=9999),
+            self.evento('x2', -2, tipo='agua'),
+        ]
+        data = self.sincronizar(eventos).json()
+        self.assertEqual(data['aplicados'], ['t1', 't2', 'a1', 'a2', 'a3'])
+        self.assertEqual(data['duplicados'], ['t2'])
+        self.assertEqual([r['clave'] for r in data['rechazados']], ['x1', 'x2'])
+
+        # bulk_create no dispara signals: la agenda y los vasos se actualizan igual
+        self.med.refresh_from_db()
+        self.assertEqual(self.med.tomas.count(), 2)
+        self.assertAlmostEqual(self.med.ultima_toma, self.ahora - timedelta(minutes=30), delta=timedelta(seconds=1))
+        agenda = data['agenda']['medicamentos'][0]
+        self.assertEqual(agenda['proxima_toma'][:19], self.med.proxima_toma.isoformat()[:19])
+        self.assertEqual(data['hidratacion']['vasos_tomados'], 3)
+        self.assertEqual(
+            RegistroHidratacion.objects.get(usuario=self.user, fecha=timezone.localdate(ayer)).vasos_tomados, 1,
+        )
+
+        # Reenviar el lote (respuesta perdida) no duplica nada
+        data = self.sincronizar(eventos).json()
+        self.assertEqual(data['aplicados'], [])
+        self.assertEqual(sorted(data['duplicados']), ['a1', 'a2', 'a3', 't1', 't2', 't2'])
+        self.assertEqual(self.med.tomas.count(), 2)
+        self.assertEqual(EventoSincronizado.objects.filter(usuario=self.user).count(), 5)
+
+    @override_settings(SINCRONIZACION_MAX_DIAS=30)
+    def test_invalida_tendencias_al_confirmar(self):
+        # La semana pasada es un período cerrado: queda cacheada sin vencimiento
+        url = reverse('hidratacion_tendencias') + '?periodo=semana&n=2'
+        semana_pasada = timezone.localtime(self.ahora) - timedelta(days=7)
+        self.assertEqual(self.client.get(url).json()['periodos'][0]['dias_registrados'], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.sincronizar([{'clave': 'a1', 'tipo': 'agua', 'fecha_hora': semana_pasada.isoformat()}])
+            # Antes de confirmar sigue la entrada cacheada
+            self.assertEqual(self.client.get(url).json()['periodos'][0]['dias_registrados'], 0)
+        self.assertEqual(self.client.get(url).json()['periodos'][0]['dias_registrados'], 1)
+
+    def test_un_insert_por_tabla(self):
+        eventos = [self.evento(f"t{i}", 8 * i + 1, tipo='toma', medicamento_id=self.med.id) for i in range(20)]
+        eventos += [self.evento(f"a{i}", 0, tipo='agua') for i in range(20)]
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(len(self.sincronizar(eventos).json()['aplicados']), 40)
+        inserts = [q['sql'].split('"')[1] for q in consultas.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(inserts.count('App_registrotoma'), 1)
+        self.assertEqual(inserts.count('App_eventosincronizado'), 1)
+        self.assertEqual(RegistroHidratacion.objects.get(usuario=self.user).vasos_tomados, 20)
+        # las dosis tomadas se marcan con un UPDATE por medicamento
+        marcadas = [q for q in consultas.captured_queries if q['sql'].startswith('UPDATE "App_recordatoriomedicamento"')]
+        self.assertEqual(len(marcadas), 1)
+
+    def test_reintenta_los_conflictos_de_claves(self):
+        original = sincronizacion._insertar
+        conflictos = iter([IntegrityError, IntegrityError])
+
+        def con_conflictos(*args):
+            if error := next(conflictos, None):
+                raise error
+            return original(*args)
+
+        with mock.patch.object(sincronizacion, '_insertar', con_conflictos):
+            response = self.sincronizar([self.evento('a1', 0, tipo='agua')])
+        self.assertEqual(response.json()['aplicados'], ['a1'])
+
+        with mock.patch.object(sincronizacion, '_insertar', side_effect=IntegrityError):
+            response = self.sincronizar([self.evento('a2', 0, tipo='agua')])
+        self.assertEqual(response.status_code, 409)
+
+    def test_la_cola_es_por_usuario(self):
+        # sincronizacion.js arma la clave de localStorage con este id
+        self.assertContains(
+            self.client.get(reverse('medicamentos')), f'<meta name="usuario-id" content="{self.user.id}">',
+        )
+
+    def test_lote_invalido(self):
+        self.assertEqual(self.client.post(reverse('sincronizar'), 'no', content_type='application/json').status_code, 400)
+        self.assertEqual(self.sincronizar({'clave': 'x'}).status_code, 400)
+
+
+class NotificacionesTokenTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='token', password='clave-segura-123')
+        self.url = reverse('poll_notificaciones')
+
+    def poll(self, token, **kwargs):
+        return self.client.get(self.url, {'since': 0}, HTTP_AUTHORIZATION=f"Bearer {token}", **kwargs)
+
+    def test_poll_sin_sesion_ni_consultas(self):
+        token = notificaciones.emitir_token(self.user.id)
+        self.poll(token)  # carga el cursor en la cache
+        with self.assertNumQueries(0):
+            response = self.poll(token)
+        self.assertEqual(response.json(), {'notificaciones': [], 'cursor': 0})
+        self.assertNotIn('X-Notificaciones-Token', response)
+
+    def test_token_invalido_o_vencido(self):
+        self.assertEqual(self.poll('falso').status_code, 401)
+        token = notificaciones.emitir_token(self.user.id)
+        with override_settings(NOTIFICACIONES_TOKEN_MAX_AGE=-1):
+            self.assertEqual(self.poll(token).status_code, 401)
+
+    def test_rota_pasada_la_mitad_de_su_vida(self):
+        viejo = signing.dumps(
+            {'u': self.user.id, 'iat': int(time.time()) - 10 * 60}, salt=notificaciones.SAL_TOKEN
+        )
+        response = self.poll(viejo)
+        self.assertEqual(response.status_code, 200)
+        nuevo = response['X-Notificaciones-Token']
+        self.assertEqual(notificaciones.verificar_token(nuevo), (self.user.id, None))
+
+    def test_confirma_con_token(self):
+        nota = Notificacion.objects.create(usuario=self.user, tipo='agua', mensaje="¡Recuerda hidratarte! 💧")
+        response = self.client.post(
+            self.url, {'ids': [nota.id]}, content_type='application/json',
+            HTTP_AUTHORIZATION=f"Bearer {notificaciones.emitir_token(self.user.id)}",
+        )
+        self.assertEqual(response.json()['confirmadas'], 1)
+
+
+class VistasAsyncTests(TestCase):
+    """Las vistas async (VISTAS_ASYNC) responden igual que las síncronas."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='asincrono', password='clave-segura-123')
+        self.med = Medicamento.objects.create(
+            usuario=self.user, nombre="Ibuprofeno", dosis="400 mg", frecuencia_horas=8, duracion_dias=5,
+        )
+
+    def peticion(self, metodo, url, **kwargs):
+        request = getattr(AsyncRequestFactory(), metodo)(url, **kwargs)
+        request.user = self.user
+
+        async def auser():
+            return self.user
+        request.auser = auser
+        return request
+
+    async def test_registrar_toma_async(self):
+        request = self.peticion('post', '/')
+        response = await views.registrar_toma_async(request, self.med.id)
+        self.assertEqual(response.status_code, 200)
+        await self.med.arefresh_from_db()
+        self.assertIsNotNone(self.med.ultima_toma)
+        self.assertEqual(await RegistroToma.objects.filter(medicamento=self.med).acount(), 1)
+
+        response = await views.registrar_toma_async(self.peticion('post', '/'), self.med.id + 1000)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_obtener_notificaciones_async(self):
+        nota = await Notificacion.objects.acreate(usuario=self.user, tipo='agua', mensaje="¡Recuerda hidratarte! 💧")
+        response = await views.obtener_notificaciones_async(self.peticion('get', '/', data={'since': 0}))
+        self.assertEqual(json.loads(response.content)['notificaciones'][0]['id'], nota.id)
+        self.assertFalse((await Notificacion.objects.aget(id=nota.id)).enviado)
+
+        response = await views.obtener_notificaciones_async(self.peticion('get', '/'))
+        self.assertEqual(len(json.loads(response.content)['notificaciones']), 1)
+        self.assertTrue((await Notificacion.objects.aget(id=nota.id)).enviado)
+
+    @override_settings(NOTIFICACIONES_STREAM_HEARTBEAT=0.05, NOTIFICACIONES_STREAM_DURACION=0.1)
+    async def test_stream_no_marca_y_sigue_desde_last_event_id(self):
+        vista = await Notificacion.objects.acreate(usuario=self.user, tipo='agua', mensaje="vista")
+        nueva = await Notificacion.objects.acreate(usuario=self.user, tipo='agua', mensaje="nueva")
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('stream_notificaciones'), headers={'Last-Event-ID': str(vista.id)},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        cuerpo = b''.join([parte async for parte in response.streaming_content]).decode()
+        self.assertIn(f"id: {nueva.id}\nevent: notificacion", cuerpo)
+        self.assertNotIn(f"id: {vista.id}\n", cuerpo)
+        # Sólo el ack del cliente las marca
+        self.assertFalse(await Notificacion.objects.filter(enviado=True).aexists())
+
+    def test_stream_bajo_wsgi_responde_204(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('stream_notificaciones')).status_code, 204)
+
+
+@override_settings(METRICAS_TOKEN='token-metricas')
+class MetricasTests(TestCase):
+    def setUp(self):
+        ajustes = override_settings(METRICAS_DIR=tempfile.mkdtemp())
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        metricas.reiniciar()
+        self.user = User.objects.create_user(username='metricas', password='clave-segura-123')
+        self.client.force_login(self.user)
+
+    def test_requiere_token_o_staff(self):
+        self.assertEqual(self.client.get(reverse('metricas')).status_code, 403)
+        response = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer token-metricas')
+        self.assertEqual(response.status_code, 200)
+
+    def test_registra_peticiones_y_consultas_por_vista(self):
+        self.client.get(reverse('medicamentos'))
+        contenido = self.client.get(
+            reverse('metricas'), HTTP_AUTHORIZATION='Bearer token-metricas'
+        ).content.decode()
+        self.assertIn('medalert_peticiones_total{vista="medicamentos"} 1', contenido)
+        self.assertIn('medalert_consultas_db_total{vista="medicamentos"} 3', contenido)
+        self.assertIn('medalert_latencia_segundos_bucket{vista="medicamentos",le="+Inf"} 1', contenido)
+
+    def test_aciertos_de_cache(self):
+        cache.clear()
+        self.client.get(reverse('home'))
+        self.client.get(reverse('home'))
+        contenido = self.client.get(
+            reverse('metricas'), HTTP_AUTHORIZATION='Bearer token-metricas'
+        ).content.decode()
+        self.assertIn('medalert_cache_total{cache="tablero",resultado="acierto"} 1', contenido)
+        self.assertIn('medalert_cache_total{cache="tablero",resultado="fallo"} 1', contenido)
+
+    def test_lee_volcados_del_formato_anterior(self):
+        # Antes de las métricas de cache el archivo era sólo {vista: métricas}
+        viejo = {'home': {**metricas._vacia(), 'peticiones': 4}}
+        with open(os.path.join(settings.METRICAS_DIR, 'viejo.json'), 'w') as archivo:
+            json.dump(viejo, archivo)
+        response = self.client.get(reverse('metricas'), HTTP_AUTHORIZATION='Bearer token-metricas')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('medalert_peticiones_total{vista="home"} 4', response.content.decode())
+
+
+class PerfiladorTests(TestCase):
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.user = User.objects.create_user(username='perfilado', password='clave-segura-123')
+        self.client.force_login(self.user)
+
+    def test_perfila_con_cabecera_y_resume(self):
+        with override_settings(PERFILADOR_DIR=self.directorio, PERFILADOR_TOKEN='perfilar', PERFILADOR_TASA=0):
+            self.client.get(reverse('medicamentos'))
+            self.assertEqual(os.listdir(self.directorio), [])
+            self.client.get(reverse('medicamentos'), HTTP_X_PERFILAR='perfilar')
+            self.assertEqual(len(os.listdir(self.directorio)), 1)
+
+            salida = io.StringIO()
+            call_command('resumen_perfiles', top=5, stdout=salida)
+            self.assertIn('medicamentos', salida.getvalue())
+
+    async def test_perfila_vistas_sincronas_con_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        with override_settings(PERFILADOR_DIR=self.directorio, PERFILADOR_TOKEN='perfilar', PERFILADOR_TASA=0):
+            response = await self.async_client.get(reverse('perfil_usuario'), headers={'X-Perfilar': 'perfilar'})
+        self.assertEqual(response.status_code, 200)
+        [archivo] = os.listdir(self.directorio)
+        self.assertIn('-perfil_usuario-', archivo)
+
+    def test_rota_los_archivos(self):
+        with override_settings(PERFILADOR_DIR=self.directorio, PERFILADOR_TASA=1, PERFILADOR_MAX_ARCHIVOS=2):
+            for _ in range(4):
+                self.client.get(reverse('perfil_usuario'))
+        self.assertEqual(len(os.listdir(self.directorio)), 2)
+
+
+class ConsultasLentasTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lento', password='clave-segura-123')
+        self.client.force_login(self.user)
+        cache.clear()
+        consultas_lentas._explicadas.clear()
+        consultas_lentas.instalar(connection)
+        self.addCleanup(connection.execute_wrappers.remove, consultas_lentas.registro)
+
+    def test_normaliza_literales_y_listas_in(self):
+        self.assertEqual(
+            consultas_lentas.normalizar("SELECT *  FROM t\n WHERE id IN (%s, %s, %s) AND n = 'x' AND k = 3"),
+            "SELECT * FROM t WHERE id IN (...) AND n = ? AND k = ?",
+        )
+
+    @override_settings(CONSULTAS_LENTAS_MS=0.0001)
+    def test_registra_origen_y_plan_una_vez_por_huella(self):
+        with self.assertLogs('App.consultas_lentas', 'WARNING') as logs:
+            self.client.get(reverse('medicamentos'))
+            cache.clear()  # la lista se cachea: sin esto la segunda visita no consulta
+            self.client.get(reverse('medicamentos'))
+        de_la_vista = [m for m in logs.output if 'App/views.py:' in m and 'App_medicamento' in m]
+        self.assertEqual(len(de_la_vista), 2)
+        self.assertIn('Plan:', de_la_vista[0])
+        self.assertNotIn('Plan:', de_la_vista[1])
+
+    def test_desactivado_no_registra(self):
+        with self.assertNoLogs('App.consultas_lentas'):
+            self.client.get(reverse('medicamentos'))
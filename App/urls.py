@@ -1,20 +1,42 @@
+from django.conf import settings
 from django.urls import path,include
 from . import views
 
+# Con ASGI (VISTAS_ASYNC, ver TomaBien/asgi.py) los endpoints JSON más usados
+# corren en el event loop en vez de ocupar un hilo por petición.
+if settings.VISTAS_ASYNC:
+    registrar_toma = views.registrar_toma_async
+    obtener_notificaciones = views.obtener_notificaciones_async
+else:
+    registrar_toma = views.registrar_toma
+    obtener_notificaciones = views.obtener_notificaciones
+
 urlpatterns = [
     path('', views.home, name='home'),
     path('login/', views.login_view, name='login'),
     path('register/', views.register_view, name='register'),
     path('logout/', views.logout_view, name='logout'),
     path('medicamentos/', views.medicamentos_view, name='medicamentos'),
+    path('medicamentos/agenda/', views.agenda_json, name='agenda'),
+    path('sincronizar/', views.sincronizar, name='sincronizar'),
+    path('estadisticas/', views.estadisticas_view, name='estadisticas'),
     path('medicamentos/eliminar/<int:id>/', views.eliminar_medicamento, name='eliminar_medicamento'),
     path('hidratacion/', views.hidratacion_view, name='hidratacion'),
+    path('hidratacion/vasos/', views.hidratacion_vasos, name='hidratacion_vasos'),
+    path('hidratacion/tendencias/', views.hidratacion_tendencias, name='hidratacion_tendencias'),
     path('perfil/completar/', views.completar_perfil_view, name='completar_perfil'),
-    path('medicamentos/<int:medicamento_id>/toma/', views.registrar_toma, name='registrar_toma'),
-    path('medicamentos/<int:medicamento_id>/toma/', views.registrar_toma, name='registrar_toma'),
+    path('medicamentos/<int:medicamento_id>/toma/', registrar_toma, name='registrar_toma'),
+    path('medicamentos/<int:medicamento_id>/toma/', registrar_toma, name='registrar_toma'),
     path('perfil/', views.perfil_usuario, name='perfil_usuario'),
+    path('perfil/cuidadores/', views.cuidadores_view, name='cuidadores'),
+    path('perfil/cuidadores/<int:id>/quitar/', views.quitar_cuidador, name='quitar_cuidador'),
+    path('cuidador/', views.panel_cuidador, name='panel_cuidador'),
     path('', include('pwa.urls')),
-    path("notificaciones/", views.obtener_notificaciones, name="notificaciones"),
+    path("notificaciones/", obtener_notificaciones, name="notificaciones"),
+    path("notificaciones/ack/", views.confirmar_notificaciones, name="confirmar_notificaciones"),
+    path("notificaciones/poll/", views.poll_notificaciones, name="poll_notificaciones"),
+    path("notificaciones/stream/", views.stream_notificaciones, name="stream_notificaciones"),
     path('notificaciones/configurar/', views.configurar_notificaciones, name='config_notificaciones'),
+    path('metrics', views.metricas_view, name='metricas'),
 
 ]
@@ -0,0 +1,63 @@
+"""
+Versión de los datos de cada usuario, para invalidar cache.
+
+Las signals de `Medicamento`, `RegistroToma`, `RegistroHidratacion` y
+`PerfilUsuario` llaman a `invalidar` al guardar o borrar; quien cachea algo
+derivado de esos datos (el tablero de `home`) lo guarda bajo `version()` y
+así una entrada vieja simplemente deja de leerse, sin borrarla.
+
+`update()` y `bulk_create` no disparan signals: esos caminos llaman a
+`invalidar` a mano, o a `invalidar_todos` si afectan a muchos usuarios (el
+barrido de tratamientos terminados).
+
+Las versiones arrancan en `time.time_ns()`, así si la cache las descarta no
+se vuelve a un número ya usado. Con la cache local de cada proceso un worker
+no ve lo que invalida otro: las entradas cacheadas llevan un TTL
+(`TABLERO_CACHE_TTL`) y en producción conviene una cache compartida.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+
+CLAVE_GLOBAL = 'App.versiones.global'
+
+
+def _clave(usuario_id):
+    return f"App.versiones.{usuario_id}"
+
+
+def _subir(clave):
+    try:
+        cache.incr(clave)
+    except ValueError:
+        cache.add(clave, time.time_ns(), None)
+
+
+def version(usuario_id):
+    """Versión actual de los datos del usuario, como texto para armar claves."""
+    claves = [CLAVE_GLOBAL, _clave(usuario_id)]
+    valores = cache.get_many(claves)
+    for clave in claves:
+        if clave not in valores:
+            cache.add(clave, time.time_ns(), None)
+            valores[clave] = cache.get(clave)
+    return f"{valores[CLAVE_GLOBAL]}.{valores[_clave(usuario_id)]}"
+
+
+def invalidar(usuario_id):
+    """
+    Sube la versión del usuario. Dentro de una transacción se vuelve a subir
+    al confirmar, por si otra petición cacheó los datos viejos entretanto.
+    """
+    _subir(_clave(usuario_id))
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _subir(_clave(usuario_id)))
+
+
+def invalidar_todos():
+    """Sube la versión de todos los usuarios a la vez."""
+    _subir(CLAVE_GLOBAL)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _subir(CLAVE_GLOBAL))
@@ -5,73 +5,92 @@ from django.http import JsonResponse
 from django.contrib.auth.models import User
 from django.contrib.auth import logout
 from django.contrib.auth.decorators import login_required
-from .models import Medicamento, RecordatorioMedicamento
+from .models import AdherenciaMedicamento, Medicamento, RecordatorioMedicamento, RelacionCuidador
 from django.utils import timezone
 from datetime import timedelta
 from django.utils.timezone import localdate
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import cache_control
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition
+from . import cuidadores, metricas, sincronizacion, tendencias, versiones
+
+
+def etag_usuario(request, *args, **kwargs):
+    """
+    ETag de una página del usuario sin renderizarla: vista y parámetros,
+    versión de sus datos (App/versiones.py), día y cookie CSRF (va en los
+    formularios).
+    """
+    if not request.user.is_authenticated:
+        return None
+    get_token(request)  # fija CSRF_COOKIE (el secreto, sin máscara)
+    partes = [
+        request.resolver_match.url_name, request.GET.urlencode(), versiones.version(request.user.id),
+        str(localdate()), request.META['CSRF_COOKIE'],
+    ]
+    return hashlib.sha1('|'.join(partes).encode()).hexdigest()[:24]
+
+
+def condicional(vista):
+    """GET condicional: 304 si la página no cambió; el navegador siempre revalida."""
+    return cache_control(private=True, no_cache=True)(condition(etag_func=etag_usuario)(vista))
+
+
+@condicional
 def home(request):
     """Página principal. Muestra distinto contenido según el estado del usuario."""
     if request.user.is_authenticated:
-        medicamentos = request.user.medicamentos.all()
-        hidratacion = None
+        # El contexto se cachea por usuario bajo la versión de sus datos (ver
+        # App/versiones.py): una visita repetida no consulta la base.
         hoy = localdate()
+        clave = f"App.tablero.{request.user.id}.{versiones.version(request.user.id)}.{hoy}"
+        contexto = cache.get(clave)
+        metricas.registrar_cache('tablero', contexto is not None)
+        if contexto is None:
+            contexto = tablero(request.user, hoy)
+            cache.set(clave, contexto, settings.TABLERO_CACHE_TTL)
+        return render(request, 'App/home.html', contexto)
 
-        notificacion_del_dia = Notificacion.objects.filter(
-            usuario=request.user,
-            tipo="resumen",
-            fecha_envio__date=hoy
-        ).exists()
-
-        if not notificacion_del_dia:
-            # Obtener medicamentos del usuario
-            medicamentos = request.user.medicamentos.all()
-            resumen = []
-
-            for m in medicamentos:
-                proxima, _, _ = calcular_proxima_toma(m)
-                resumen.append(f"{m.nombre}: próxima dosis a las {proxima.strftime('%H:%M')}")
+    else:
+        return render(request, 'App/home.html')
 
-            mensaje = "Resumen de hoy:\n" + "\n".join(resumen)
 
-            Notificacion.objects.create(
-                usuario=request.user,
-                tipo='resumen',
-                mensaje=mensaje
+def tablero(usuario, hoy):
+    """
+    Contexto de home: medicamentos activos e hidratación del día. Sólo lee;
+    el resumen del día lo crea `manage.py generar_resumenes` (o el programador
+    de recordatorios).
+    """
+    medicamentos = list(usuario.medicamentos.filter(activo=True))
+    hidratacion = None
+    try:
+        perfil = PerfilUsuario.objects.get(user=usuario)
+
+        # Registro de hidratación del día; si todavía no existe (lo crea la
+        # página de hidratación) se muestra uno vacío sin guardarlo.
+        hidratacion = RegistroHidratacion.objects.filter(usuario=usuario, fecha=hoy).first()
+
+        if not hidratacion and all([
+            perfil.peso_kg,
+            perfil.altura_cm,
+            perfil.sexo,
+            perfil.nivel_actividad
+        ]):
+            hidratacion = RegistroHidratacion(
+                usuario=usuario,
+                fecha=hoy,
+                meta_vasos=perfil.calcular_meta_agua_vasos()
             )
-        hoy = timezone.now().date()
 
-        try:
-            perfil = PerfilUsuario.objects.get(user=request.user)
-
-            # Buscar registro de hidratación del día
-            hidratacion = RegistroHidratacion.objects.filter(
-                usuario=request.user, fecha=hoy
-            ).first()
-
-            # Si no existe, crearlo automáticamente (si perfil completo)
-            if not hidratacion and all([
-                perfil.peso_kg,
-                perfil.altura_cm,
-                perfil.sexo,
-                perfil.nivel_actividad
-            ]):
-                hidratacion = RegistroHidratacion.objects.create(
-                    usuario=request.user,
-                    fecha=hoy,
-                    meta_vasos=perfil.calcular_meta_agua_vasos()
-                )
+    except PerfilUsuario.DoesNotExist:
+        # Si aún no tiene perfil, simplemente no mostrar nada
+        pass
 
-        except PerfilUsuario.DoesNotExist:
-            # Si aún no tiene perfil, simplemente no mostrar nada
-            pass
-
-        return render(request, 'App/home.html', {
-            'medicamentos': medicamentos,
-            'hidratacion': hidratacion,
-        })
-
-    else:
-        return render(request, 'App/home.html')
+    return {'medicamentos': medicamentos, 'hidratacion': hidratacion}
 
 def login_view(request):
     """Vista para manejar el login de usuarios."""
@@ -86,7 +105,10 @@ def login_view(request):
 
             # Si el formulario viene desde AJAX
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-                return JsonResponse({'success': True})
+                return JsonResponse({
+                    'success': True,
+                    'token_notificaciones': notificaciones.emitir_token(user.id),
+                })
             
             # Si es normal (no AJAX)
             return redirect('home')
@@ -150,47 +172,16 @@ from django.views.decorators.http import require_POST
 from .models import Medicamento, RegistroToma
 
 
-# === Función auxiliar para calcular la próxima dosis ===
-def calcular_proxima_toma(med):
-    """
-    Lógica:
-    - Sin tomas previas -> NO hay countdown (remaining=0) y el botón está habilitado.
-    - Con tomas previas  -> countdown hasta última_toma + frecuencia.
-    """
-    now = timezone.now()
-    freq = timedelta(hours=med.frecuencia_horas or 0)
-
-    last_toma = med.tomas.order_by('-fecha_hora').first() if hasattr(med, 'tomas') else None
-
-    # 1) Nunca se ha tomado -> permitir tomar ahora (como antes con localStorage)
-    if not last_toma or med.frecuencia_horas in (None, 0):
-        return now, 0, True  # next_due, remaining_seconds, can_take
-
-    # 2) Ya hubo una toma -> calcular próxima según frecuencia
-    next_due = last_toma.fecha_hora + freq
-    remaining_seconds = max(int((next_due - now).total_seconds()), 0)
-    can_take = remaining_seconds == 0
-    return next_due, remaining_seconds, can_take
-
-def calcular_dias_restantes(med):
-    """
-    Días restantes = duracion_dias - días transcurridos desde created_at.
-    Si no hay duracion_dias, retorna None.
-    """
-    if not med.duracion_dias:
-        return None
-
-    hoy = timezone.localdate()
-    # usa created_at si existe; si no existe (aún no migras), asume hoy como inicio
-    inicio = med.created_at.date() if hasattr(med, 'created_at') and med.created_at else hoy
-    transcurridos = (hoy - inicio).days
-    return max(med.duracion_dias - transcurridos, 0)
+# === Cálculo de próxima dosis y días restantes (ver agenda.py) ===
+from .agenda import info_medicamento, rango_del_dia, snapshot_medicamentos
+from .recordatorios import horas_dosis
 
 
 
 # === Vista principal de medicamentos ===
 from .models import Notificacion
 @login_required
+@condicional
 def medicamentos_view(request):
     """Lista y creación de medicamentos del usuario + cálculo del temporizador."""
 
@@ -214,41 +205,157 @@ def medicamentos_view(request):
         # Muy importante: recargar la página para ver el cambio
         return redirect('medicamentos')
 
-    # 2) GET normal: cargar medicamentos del usuario
-    medicamentos = Medicamento.objects.filter(usuario=request.user)
-
-    # 3) Crear notificaciones SOLO si el tratamiento NO está terminado
-    for m in medicamentos:
-        proxima, restantes, puede_tomar = calcular_proxima_toma(m)
-        dias_rest = calcular_dias_restantes(m)
+    # 2) GET normal: agenda de los medicamentos activos del usuario en una sola
+    #    consulta. Los recordatorios los crea `manage.py programador_recordatorios`,
+    #    que también desactiva los tratamientos terminados. La lista se cachea
+    #    entera en la plantilla ({% fragmento %}): la agenda se calcula sólo si falta.
+    meds_info = SimpleLazyObject(
+        lambda: snapshot_medicamentos(Medicamento.objects.filter(usuario=request.user, activo=True))
+    )
 
-        # si ya no quedan días → no notificar más de este medicamento
-        if dias_rest == 0:
-            continue
+    return render(request, 'App/medicamentos.html', {
+        'meds_info': meds_info, 'version': versiones.version(request.user.id), 'hoy': localdate(),
+    })
 
-        # Crear notificación solo si toca dosis
-        if puede_tomar and restantes == 0:
-            Notificacion.objects.get_or_create(
-                usuario=request.user,
-                tipo='medicamento',
-                mensaje=f"¡Es hora de tomar {m.nombre}! 💊",
-                enviado=False
-            )
 
-    # 4) Preparar info para el template (incluye finalizados)
-    meds_info = []
-    for m in medicamentos:
-        proxima, restantes, puede_tomar = calcular_proxima_toma(m)
-        dias_rest = calcular_dias_restantes(m)
-        meds_info.append({
-            'obj': m,
-            'restantes': restantes,
-            'puede_tomar': puede_tomar,
-            'proxima': proxima,
-            'dias_restantes': dias_rest,
+@login_required
+@condicional
+def agenda_json(request):
+    """
+    Agenda compacta para el service worker (uso sin conexión): medicamentos
+    activos y sus dosis desde el inicio del día hasta RECORDATORIOS_VENTANA_HORAS
+    después. No depende de la hora actual, así que vale el mismo ETag que las
+    páginas; el cliente descarta las dosis pasadas. El service worker la
+    guarda bajo `?usuario=<id>`, que tiene que ser el de la sesión.
+    """
+    if request.GET.get('usuario', str(request.user.id)) != str(request.user.id):
+        return JsonResponse({'error': 'usuario distinto del de la sesión'}, status=403)
+    return JsonResponse(agenda_usuario(request.user))
+
+
+def agenda_usuario(usuario):
+    """Datos de `agenda_json`; la sincronización sin conexión también los devuelve."""
+    desde = rango_del_dia(localdate())[0]
+    hasta = desde + timedelta(hours=settings.RECORDATORIOS_VENTANA_HORAS)
+    medicamentos = []
+    for med in Medicamento.objects.filter(usuario=usuario, activo=True).order_by('nombre'):
+        medicamentos.append({
+            'id': med.id,
+            'nombre': med.nombre,
+            'dosis': med.dosis,
+            'frecuencia_horas': med.frecuencia_horas,
+            'ultima_toma': med.ultima_toma,
+            'proxima_toma': med.proxima_toma,
+            'fin_tratamiento': med.fecha_fin_tratamiento if med.duracion_dias else None,
+            'horas': horas_dosis(med, desde, hasta) if med.frecuencia_horas and med.proxima_toma else [],
         })
+    return {'desde': desde, 'hasta': hasta, 'medicamentos': medicamentos}
+
+
+@login_required
+@require_POST
+def sincronizar(request):
+    """
+    Aplica la cola de eventos que la PWA registró sin conexión
+    (`{"eventos": [...]}`, ver sincronizacion.py) y devuelve el resultado de
+    cada uno con la agenda y la hidratación de hoy ya actualizadas.
+    """
+    try:
+        eventos = json.loads(request.body).get('eventos')
+        resultado = sincronizacion.aplicar(request.user, eventos)
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'error': str(e) or 'JSON inválido'}, status=400)
+    except IntegrityError:
+        # Conflictos con otras peticiones en cada reintento: el cliente reenvía la cola
+        return JsonResponse({'error': 'conflicto con otra sincronización, reintentar'}, status=409)
+
+    hidratacion = RegistroHidratacion.objects.filter(usuario=request.user, fecha=localdate()).first()
+    return JsonResponse({
+        **resultado,
+        'agenda': agenda_usuario(request.user),
+        'hidratacion': hidratacion and {
+            'vasos_tomados': hidratacion.vasos_tomados,
+            'meta_vasos': hidratacion.meta_vasos,
+            'progreso': hidratacion.progreso(),
+        },
+    })
+
 
-    return render(request, 'App/medicamentos.html', {'meds_info': meds_info})
+@login_required
+def estadisticas_view(request):
+    """Adherencia por medicamento y total del usuario, desde la tabla que llena `calcular_adherencia`."""
+    ventanas = sorted(settings.ADHERENCIA_VENTANAS)
+    filas = (
+        AdherenciaMedicamento.objects
+        .filter(medicamento__usuario=request.user)
+        .select_related('medicamento')
+        .order_by('medicamento__nombre', 'ventana_dias')
+    )
+    por_medicamento = {}
+    totales = {dias: AdherenciaMedicamento(ventana_dias=dias) for dias in ventanas}
+    calculado_en = None
+    for fila in filas:
+        por_medicamento.setdefault(fila.medicamento, {})[fila.ventana_dias] = fila
+        total = totales[fila.ventana_dias]
+        for campo in ('esperadas', 'a_tiempo', 'tardias', 'omitidas'):
+            setattr(total, campo, getattr(total, campo) + getattr(fila, campo))
+        calculado_en = fila.calculado_en
+
+    return render(request, 'App/estadisticas.html', {
+        'ventanas': ventanas,
+        'medicamentos': [
+            (med, [adherencias.get(dias) for dias in ventanas]) for med, adherencias in por_medicamento.items()
+        ],
+        'totales': [totales[dias] for dias in ventanas],
+        'calculado_en': calculado_en,
+    })
+
+
+@login_required
+def panel_cuidador(request):
+    """Pacientes que compartieron sus datos con el usuario, por páginas (ver cuidadores.py)."""
+    perfil = PerfilUsuario.objects.filter(user=request.user).only('es_cuidador').first()
+    es_cuidador = bool(perfil and perfil.es_cuidador)
+    despues = request.GET.get('despues')
+    pacientes, siguiente = cuidadores.pacientes(request.user.id, despues) if es_cuidador else ([], None)
+    return render(request, 'App/panel_cuidador.html', {
+        'es_cuidador': es_cuidador,
+        'pacientes': pacientes,
+        'siguiente': siguiente,
+        'paginado': bool(despues),
+        'ahora': timezone.now(),
+    })
+
+
+@login_required
+def cuidadores_view(request):
+    """El paciente elige con qué cuidadores comparte sus medicamentos e hidratación."""
+    if request.method == 'POST':
+        username = request.POST.get('username', '').strip()
+        cuidador = (
+            User.objects.filter(username=username, perfilusuario__es_cuidador=True)
+            .exclude(id=request.user.id).first()
+        )
+        if cuidador is None:
+            messages.error(request, "No hay ningún cuidador con ese nombre de usuario.")
+        else:
+            RelacionCuidador.objects.get_or_create(cuidador=cuidador, paciente=request.user)
+            messages.success(request, f"{cuidador.username} ya puede ver tus medicamentos e hidratación.")
+        return redirect('cuidadores')
+
+    relaciones = (
+        RelacionCuidador.objects.filter(paciente=request.user)
+        .select_related('cuidador').order_by('cuidador__username')
+    )
+    return render(request, 'App/cuidadores.html', {'relaciones': relaciones})
+
+
+@login_required
+@require_POST
+def quitar_cuidador(request, id):
+    """Deja de compartir los datos con un cuidador."""
+    RelacionCuidador.objects.filter(id=id, paciente=request.user).delete()
+    return redirect('cuidadores')
 
 
 
@@ -259,15 +366,19 @@ def medicamentos_view(request):
 @login_required
 @require_POST
 def registrar_toma(request, medicamento_id):
-    """Guarda una toma en la base de datos y devuelve nuevos segundos restantes."""
+    """Registra una toma y devuelve los segundos restantes y la hora de la próxima dosis."""
     try:
         med = Medicamento.objects.get(id=medicamento_id, usuario=request.user)
     except Medicamento.DoesNotExist:
         return JsonResponse({'error': 'Medicamento no encontrado'}, status=404)
 
-    RegistroToma.objects.create(medicamento=med)
-    _, restantes, _ = calcular_proxima_toma(med)
-    return JsonResponse({'remaining_seconds': restantes})
+    RegistroToma.objects.create(medicamento=med)  # actualiza med.ultima_toma (signals.py)
+    info = info_medicamento(med)
+    return JsonResponse({
+        'remaining_seconds': info['restantes'],
+        'message': f"Toma registrada correctamente para {med.nombre}",
+        'proxima': timezone.localtime(info['proxima']).strftime('%H:%M'),
+    })
 
 
 
@@ -283,30 +394,19 @@ def eliminar_medicamento(request, id):
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 from .models import PerfilUsuario, RegistroHidratacion
 from .forms import PerfilUsuarioForm,ConfigNotificacionesForm
 
 
 @login_required
+@condicional
 def hidratacion_view(request):
     """Muestra el control de hidratación o redirige a completar perfil si faltan datos."""
     perfil, _ = PerfilUsuario.objects.get_or_create(user=request.user)
-    ultima_notif = Notificacion.objects.filter(
-        usuario=request.user,
-        tipo='agua'
-    ).order_by('-fecha_envio').first()
-
-    if ultima_notif:
-        horas = (timezone.now() - ultima_notif.fecha_envio).total_seconds() / 3600
-    else:
-        horas = 999  # nunca ha enviado → mandar ahora
-
-    if horas >= perfil.recordatorio_horas:
-        Notificacion.objects.create(
-            usuario=request.user,
-            tipo='agua',
-            mensaje="¡Recuerda hidratarte! 💧"
-        )
+    # Los recordatorios de agua los crea `manage.py programador_recordatorios`.
 
     # Verificar si faltan datos fisiológicos
     if not all([perfil.peso_kg, perfil.altura_cm, perfil.sexo, perfil.nivel_actividad]):
@@ -320,10 +420,9 @@ def hidratacion_view(request):
         defaults={'meta_vasos': perfil.calcular_meta_agua_vasos()}
     )
 
-    # Incrementar vasos si se presiona el botón "+1"
+    # Incrementar vasos si se presiona el botón "+1" (formulario sin JavaScript)
     if request.method == 'POST' and 'agregar_vaso' in request.POST:
-        registro.vasos_tomados += 1
-        registro.save()
+        ajustar_vasos(request.user, 'sumar', 1, hoy)
         return redirect('hidratacion')
 
     progreso = registro.progreso()
@@ -333,6 +432,74 @@ def hidratacion_view(request):
     })
 
 
+@login_required
+@condicional
+def hidratacion_tendencias(request):
+    """
+    JSON: `periodo` = semana | mes | anio y `n` períodos hacia atrás (incluye
+    el actual), con días registrados, días con la meta cumplida, progreso y
+    vasos promedio, y las rachas de días con la meta cumplida.
+    """
+    periodo = request.GET.get('periodo', 'semana')
+    try:
+        cantidad = int(request.GET.get('n', 12))
+    except ValueError:
+        cantidad = 0
+    if periodo not in tendencias.PERIODOS or not 1 <= cantidad <= 104:
+        return JsonResponse({'error': 'periodo o n inválido'}, status=400)
+    return JsonResponse(tendencias.tendencias(request.user.id, periodo, cantidad, localdate()))
+
+
+def ajustar_vasos(usuario, accion, cantidad, hoy):
+    """
+    Suma, resta o fija los vasos del día con un UPDATE atómico (F()), así dos
+    toques simultáneos no se pisan. Crea el registro del día si no existe.
+    """
+    expresion = {
+        'sumar': F('vasos_tomados') + cantidad,
+        'restar': Greatest(F('vasos_tomados') - cantidad, 0),
+        'fijar': Value(cantidad),
+    }[accion]
+    registros = RegistroHidratacion.objects.filter(usuario=usuario, fecha=hoy)
+    if not registros.update(vasos_tomados=expresion):
+        perfil = PerfilUsuario.objects.filter(user=usuario).first()
+        try:
+            with transaction.atomic():
+                return RegistroHidratacion.objects.create(
+                    usuario=usuario,
+                    fecha=hoy,
+                    vasos_tomados=0 if accion == 'restar' else cantidad,
+                    meta_vasos=perfil.calcular_meta_agua_vasos() if perfil else 8,
+                )
+        except IntegrityError:
+            registros.update(vasos_tomados=expresion)  # otra petición lo creó recién
+    versiones.invalidar(usuario.id)  # update() no dispara signals
+    return registros.get()
+
+
+@login_required
+@require_POST
+def hidratacion_vasos(request):
+    """
+    AJAX: `accion` = sumar | restar | fijar y `cantidad` (por defecto 1).
+    El cliente agrupa los toques seguidos en una sola petición.
+    """
+    accion = request.POST.get('accion', 'sumar')
+    try:
+        cantidad = int(request.POST.get('cantidad', 1))
+    except ValueError:
+        cantidad = -1
+    if accion not in ('sumar', 'restar', 'fijar') or not 0 <= cantidad <= 100:
+        return JsonResponse({'error': 'accion o cantidad inválida'}, status=400)
+
+    registro = ajustar_vasos(request.user, accion, cantidad, timezone.now().date())
+    return JsonResponse({
+        'vasos_tomados': registro.vasos_tomados,
+        'meta_vasos': registro.meta_vasos,
+        'progreso': registro.progreso(),
+    })
+
+
 @login_required
 def completar_perfil_view(request):
     """Permite al usuario completar su perfil antes de acceder a hidratación."""
@@ -346,34 +513,15 @@ def completar_perfil_view(request):
         form = PerfilUsuarioForm(instance=perfil)
     return render(request, 'App/completar_perfil.html', {'form': form})
 
-from django.views.decorators.http import require_POST
-from .models import Medicamento, RegistroToma
-@login_required
-@require_POST
-def registrar_toma(request, medicamento_id):
-    """Registra una nueva toma del medicamento y devuelve la próxima hora estimada."""
-    try:
-        medicamento = Medicamento.objects.get(id=medicamento_id, usuario=request.user)
-    except Medicamento.DoesNotExist:
-        return JsonResponse({'error': 'Medicamento no encontrado'}, status=404)
-
-    # Crear registro de toma
-    RegistroToma.objects.create(medicamento=medicamento)
-
-    # Calcular hora de próxima dosis
-    proxima = timezone.now() + timezone.timedelta(hours=medicamento.frecuencia_horas)
-    return JsonResponse({
-        'message': f"Toma registrada correctamente para {medicamento.nombre}",
-        'proxima': proxima.strftime('%H:%M')
-    })
-
 from .models import PerfilUsuario
 from .forms import PerfilUsuarioForm  # lo haremos abajo
 
 @login_required
+@condicional
 def perfil_usuario(request):
     """Muestra y permite editar los datos del perfil del usuario."""
     perfil, created = PerfilUsuario.objects.get_or_create(user=request.user)
+    perfil.user = request.user  # el template usa perfil.user; evita volver a consultarlo
 
     if request.method == 'POST':
         form = PerfilUsuarioForm(request.POST, instance=perfil)
@@ -391,8 +539,28 @@ def perfil_usuario(request):
         'meta_agua': meta_agua,
     })
 
+import json
+from django.core import signing
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from . import notificaciones
+
 @login_required
 def obtener_notificaciones(request):
+    """
+    Con `?since=<cursor>` (o If-None-Match) devuelve las notificaciones
+    pendientes sólo si hay alguna más nueva que el cursor; si no, responde
+    sin consultar la base. Las pendientes se marcan como enviadas con
+    `confirmar_notificaciones`, así una respuesta perdida no las pierde.
+    Sin cursor se mantiene el comportamiento anterior (entrega y marca).
+    """
+    since = request.GET.get('since')
+    if since is not None or 'If-None-Match' in request.headers:
+        response = notificaciones_desde(request, request.user.id, since)
+        response['X-Notificaciones-Token'] = notificaciones.emitir_token(request.user.id)
+        return response
+
     pendientes = Notificacion.objects.filter(usuario=request.user, enviado=False)
 
     data = [
@@ -404,9 +572,152 @@ def obtener_notificaciones(request):
         for n in pendientes
     ]
 
-    pendientes.update(enviado=True)
+    if pendientes.update(enviado=True):
+        notificaciones.registrar_ack(request.user.id)
     return JsonResponse({"notificaciones": data})
 
+
+def notificaciones_desde(request, usuario_id, since):
+    try:
+        since = int(since or 0)
+    except ValueError:
+        return JsonResponse({"error": "cursor inválido"}, status=400)
+
+    # El cuerpo cambia con una notificación nueva o con una confirmación
+    ultima = notificaciones.ultima_notificacion_id(usuario_id)
+    etag = f'"n{ultima}-{notificaciones.version_ack(usuario_id)}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponse(status=304)
+    else:
+        data = []
+        if ultima > since:
+            data = list(
+                Notificacion.objects.filter(usuario_id=usuario_id, enviado=False)
+                .order_by('id').values('id', 'tipo', 'mensaje')
+            )
+        response = JsonResponse({"notificaciones": data, "cursor": ultima})
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def marcar_enviadas(request, usuario_id):
+    try:
+        ids = [int(i) for i in json.loads(request.body)['ids']]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "se esperaba {\"ids\": [...]}"}, status=400)
+
+    confirmadas = Notificacion.objects.filter(
+        usuario_id=usuario_id, id__in=ids, enviado=False
+    ).update(enviado=True)
+    if confirmadas:
+        notificaciones.registrar_ack(usuario_id)
+    return JsonResponse({"confirmadas": confirmadas})
+
+
+@login_required
+@require_POST
+def confirmar_notificaciones(request):
+    """Marca como enviadas las notificaciones indicadas: {"ids": [..]}."""
+    return marcar_enviadas(request, request.user.id)
+
+
+# --- Versiones async (se usan al servir con ASGI, ver VISTAS_ASYNC en urls.py) ---
+from asgiref.sync import sync_to_async
+
+@login_required
+async def obtener_notificaciones_async(request):
+    """Igual que `obtener_notificaciones`, con el ORM async."""
+    user = await request.auser()
+    since = request.GET.get('since')
+    if since is not None or 'If-None-Match' in request.headers:
+        response = await anotificaciones_desde(request, user.id, since)
+        response['X-Notificaciones-Token'] = notificaciones.emitir_token(user.id)
+        return response
+
+    data = await notificaciones.tomar_pendientes(user.id)
+    return JsonResponse({"notificaciones": data})
+
+
+# Cache y ORM síncronos en un solo salto de hilo, en lugar de uno por consulta
+anotificaciones_desde = sync_to_async(notificaciones_desde)
+
+
+@login_required
+@require_POST
+async def registrar_toma_async(request, medicamento_id):
+    """Igual que `registrar_toma`, con el ORM async."""
+    user = await request.auser()
+    try:
+        med = await Medicamento.objects.aget(id=medicamento_id, usuario=user)
+    except Medicamento.DoesNotExist:
+        return JsonResponse({'error': 'Medicamento no encontrado'}, status=404)
+
+    await RegistroToma.objects.acreate(medicamento=med)  # actualiza med.ultima_toma (signals.py)
+    info = info_medicamento(med)
+    return JsonResponse({
+        'remaining_seconds': info['restantes'],
+        'message': f"Toma registrada correctamente para {med.nombre}",
+        'proxima': timezone.localtime(info['proxima']).strftime('%H:%M'),
+    })
+
+
+def usuario_del_token(request):
+    """(usuario_id, token_nuevo) del `Authorization: Bearer`, o None."""
+    cabecera = request.headers.get('Authorization', '')
+    if not cabecera.startswith('Bearer '):
+        return None
+    try:
+        return notificaciones.verificar_token(cabecera[len('Bearer '):])
+    except signing.BadSignature:
+        return None
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+def poll_notificaciones(request):
+    """
+    Polling autenticado con el token firmado: no lee la sesión ni el usuario,
+    así que sin notificaciones nuevas no consulta la base. GET con `since`
+    como en `obtener_notificaciones`; POST {"ids": [..]} confirma. Sin CSRF:
+    la credencial va en una cabecera, no en una cookie.
+    """
+    autenticado = usuario_del_token(request)
+    if autenticado is None:
+        return JsonResponse({"error": "token inválido o vencido"}, status=401)
+    usuario_id, token_nuevo = autenticado
+
+    if request.method == 'POST':
+        response = marcar_enviadas(request, usuario_id)
+    else:
+        response = notificaciones_desde(request, usuario_id, request.GET.get('since'))
+    if token_nuevo:
+        response['X-Notificaciones-Token'] = token_nuevo
+    return response
+
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+@login_required
+async def stream_notificaciones(request):
+    """Stream SSE de notificaciones. Sólo disponible al servir con ASGI."""
+    if not isinstance(request, ASGIRequest):
+        # Bajo WSGI la conexión bloquearía un worker: el 204 cierra el
+        # EventSource y el cliente vuelve al polling de /notificaciones/.
+        return HttpResponse(status=204)
+
+    user = await request.auser()
+    try:
+        desde_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        desde_id = 0
+    return StreamingHttpResponse(
+        notificaciones.eventos_usuario(user.id, desde_id),
+        content_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 @login_required
 def configurar_notificaciones(request):
     perfil, _ = PerfilUsuario.objects.get_or_create(user=request.user)
@@ -431,3 +742,20 @@ def configurar_notificaciones(request):
     return render(request, 'App/config_notificaciones.html', {
         'form': ConfigNotificacionesForm(instance=perfil)
     })
+
+
+import hmac
+from django.conf import settings
+from . import metricas
+
+def metricas_view(request):
+    """Métricas en formato Prometheus. Requiere METRICAS_TOKEN (Bearer) o usuario staff."""
+    token = settings.METRICAS_TOKEN
+    autorizacion = request.headers.get('Authorization', '')
+    por_token = bool(token) and hmac.compare_digest(autorizacion, f"Bearer {token}")
+    if not (por_token or request.user.is_staff):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        metricas.formato_prometheus(*metricas.leer_todos()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -3,6 +3,15 @@ ASGI config for TomaBien project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Necesario para el stream de notificaciones (/notificaciones/stream/):
+
+    gunicorn TomaBien.asgi:application -k uvicorn.workers.UvicornWorker
+
+Activa VISTAS_ASYNC (salvo que el entorno diga otra cosa): registrar_toma y
+/notificaciones/ usan el ORM async y no ocupan un hilo mientras esperan.
+Para comparar con WSGI: `manage.py benchmark --modo ambos`, o
+`manage.py benchmark --servidor ...` contra cada despliegue.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +21,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TomaBien.settings')
+os.environ.setdefault('VISTAS_ASYNC', 'True')
 
 application = get_asgi_application()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 from pathlib import Path
+import tempfile
 import dj_database_url
 from decouple import config
 from pathlib import Path
@@ -52,6 +53,8 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # 👈 justo aquí, segundo
+    'App.middleware.MetricasMiddleware',  # después de whitenoise: no cuenta estáticos
+    'App.middleware.PerfiladorMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -72,12 +75,17 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'App.context_processors.token_notificaciones',
             ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'TomaBien.wsgi.application'
+ASGI_APPLICATION = 'TomaBien.asgi.application'
+# Vistas async para registrar_toma y /notificaciones/. TomaBien/asgi.py lo
+# activa por defecto; bajo WSGI cada vista async crearía su propio event loop.
+VISTAS_ASYNC = config("VISTAS_ASYNC", default=False, cast=bool)
 PWA_APP_NAME = 'MedAlert'
 PWA_APP_DESCRIPTION = "Recordatorios de medicamentos e hidratación"
 PWA_APP_THEME_COLOR = '#0d6efd'
@@ -98,6 +106,8 @@ PWA_APP_ICONS = [
         "sizes": "512x512"
     }
 ]
+# Guarda /medicamentos/agenda/ para verla sin conexión
+PWA_SERVICE_WORKER_PATH = BASE_DIR / 'static' / 'serviceworker.js'
 
 
 # Database
@@ -112,6 +122,14 @@ DATABASES = {
 DATABASES["default"] = dj_database_url.parse(config("DATABASE_URL"))
 
 
+CACHES = {
+    'default': {
+        'BACKEND': config("CACHE_BACKEND", default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config("CACHE_LOCATION", default='medalert'),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -155,4 +173,71 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = 'login'        # nombre de tu URL de login
 LOGIN_REDIRECT_URL = 'home'
-LOGOUT_REDIRECT_URL = 'login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'login'
+
+# Notificaciones en tiempo real (SSE). Requiere servir TomaBien.asgi.
+NOTIFICACIONES_STREAM_HEARTBEAT = 20   # segundos entre pings de keep-alive
+NOTIFICACIONES_STREAM_RESYNC = 60      # revisión de respaldo en la base
+NOTIFICACIONES_STREAM_DURACION = 300   # el cliente se reconecta al cerrar
+# Cursor del polling (id de la última notificación por usuario) en la cache.
+# Con la cache local de cada proceso un worker puede no ver una notificación
+# creada en otro hasta que expira el TTL; en producción conviene una cache
+# compartida (CACHE_BACKEND=django.core.cache.backends.redis.RedisCache).
+NOTIFICACIONES_CURSOR_TTL = 30
+# Contexto de home cacheado por usuario y versión de sus datos
+# (App/versiones.py). El TTL acota lo que puede quedar desactualizado un
+# worker que no ve las invalidaciones de otro (cache local por proceso).
+TABLERO_CACHE_TTL = 5 * 60
+# Tarjetas de medicamentos.html ({% fragmento %}); la clave lleva updated_at
+FRAGMENTOS_CACHE_TTL = 24 * 60 * 60
+# Token firmado de /notificaciones/poll/ (ver App/notificaciones.py)
+NOTIFICACIONES_TOKEN_MAX_AGE = 15 * 60
+# Hora local desde la que el programador genera los resúmenes diarios
+RESUMEN_DIARIO_HORA = 7
+# Dosis materializadas en RecordatorioMedicamento (App/recordatorios.py)
+RECORDATORIOS_VENTANA_HORAS = 48        # cuánto hacia adelante se generan
+RECORDATORIOS_TOLERANCIA_MINUTOS = 60   # dosis más atrasadas ya no se avisan
+# Retención (App/retencion.py, manage.py aplicar_retencion): las filas más
+# viejas pasan a resúmenes diarios y se borran
+RETENCION_TOMAS_DIAS = 120
+RETENCION_NOTIFICACIONES_DIAS = 30
+RETENCION_RECORDATORIOS_DIAS = 30
+RETENCION_EVENTOS_DIAS = 30              # claves de idempotencia de la sincronización
+# Adherencia (App/adherencia.py, manage.py calcular_adherencia)
+ADHERENCIA_VENTANAS = (7, 30, 90)        # días hacia atrás
+ADHERENCIA_TOLERANCIA_MINUTOS = 60       # más lejos de la dosis cuenta como tardía
+# Panel del cuidador (App/cuidadores.py)
+CUIDADOR_PACIENTES_POR_PAGINA = 50
+# Sincronización sin conexión de la PWA (App/sincronizacion.py)
+SINCRONIZACION_MAX_EVENTOS = 500         # por petición
+SINCRONIZACION_MAX_DIAS = 7              # eventos más viejos se rechazan
+SINCRONIZACION_DESFASE_MINUTOS = 5       # tolerancia al reloj adelantado del cliente
+
+# Métricas Prometheus (/metrics). Cada worker vuelca sus contadores a METRICAS_DIR.
+METRICAS_DIR = config("METRICAS_DIR", default=str(Path(tempfile.gettempdir()) / "medalert-metricas"))
+METRICAS_FLUSH_SEGUNDOS = 5
+METRICAS_TOKEN = config("METRICAS_TOKEN", default="")
+
+# Perfilador por muestreo (cProfile). TASA=0 lo desactiva salvo la cabecera
+# X-Perfilar con PERFILADOR_TOKEN. Resumen: manage.py resumen_perfiles
+PERFILADOR_TASA = config("PERFILADOR_TASA", default=0.0, cast=float)
+PERFILADOR_TOKEN = config("PERFILADOR_TOKEN", default="")
+PERFILADOR_DIR = config("PERFILADOR_DIR", default=str(Path(tempfile.gettempdir()) / "medalert-perfiles"))
+PERFILADOR_MAX_ARCHIVOS = 200
+
+# Registro de consultas lentas (App/consultas_lentas.py). 0 lo desactiva.
+# En Postgres el primer caso de cada consulta SELECT se vuelve a ejecutar con
+# EXPLAIN ANALYZE; CONSULTAS_LENTAS_ANALYZE=False usa solo EXPLAIN.
+CONSULTAS_LENTAS_MS = config("CONSULTAS_LENTAS_MS", default=0.0, cast=float)
+CONSULTAS_LENTAS_ANALYZE = config("CONSULTAS_LENTAS_ANALYZE", default=True, cast=bool)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'App.consultas_lentas': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
@@ -0,0 +1,56 @@
+// Service worker de MedAlert (PWA_SERVICE_WORKER_PATH en settings.py).
+//
+// - /medicamentos/agenda/ se pide siempre a la red (el navegador revalida con
+//   If-None-Match y el servidor responde 304 si no cambió) y la última copia
+//   queda guardada para mostrar la agenda sin conexión. La copia se guarda
+//   bajo la URL completa, que lleva ?usuario=<id> (sincronizacion.js): otro
+//   usuario en el mismo navegador no ve la agenda del anterior.
+// - Las páginas no se guardan (llevan token CSRF y datos de la sesión); sin
+//   conexión se muestra /offline/.
+
+const VERSION = "medalert-v2";
+const ESTATICOS = VERSION + "-estaticos";
+const DATOS = VERSION + "-datos";
+const AGENDA = "/medicamentos/agenda/";
+
+self.addEventListener("install", event => {
+  self.skipWaiting();
+  event.waitUntil(caches.open(ESTATICOS).then(cache => cache.addAll(["/offline/"])));
+});
+
+self.addEventListener("activate", event => {
+  event.waitUntil(
+    caches.keys().then(nombres => Promise.all(
+      nombres
+        .filter(nombre => nombre !== ESTATICOS && nombre !== DATOS)
+        .map(nombre => caches.delete(nombre))
+    ))
+  );
+});
+
+self.addEventListener("fetch", event => {
+  const peticion = event.request;
+  if (peticion.method !== "GET") return;
+  const url = new URL(peticion.url);
+  if (url.origin !== self.location.origin) return;
+
+  if (url.pathname === AGENDA) {
+    const usuario = url.searchParams.get("usuario");
+    event.respondWith(
+      fetch(peticion)
+        .then(respuesta => {
+          if (respuesta.ok && usuario) {
+            const copia = respuesta.clone();
+            caches.open(DATOS).then(cache => cache.put(peticion.url, copia));
+          }
+          return respuesta;
+        })
+        .catch(() => usuario ? caches.match(peticion.url) : Response.error())
+    );
+    return;
+  }
+
+  if (peticion.mode === "navigate") {
+    event.respondWith(fetch(peticion).catch(() => caches.match("/offline/")));
+  }
+});
@@ -0,0 +1,63 @@
+// Cola de eventos registrados sin conexión (App/sincronizacion.py).
+//
+// Las tomas y los vasos de agua que no llegan al servidor por falta de red se
+// guardan en localStorage con la hora del teléfono y una clave única. Al
+// volver la conexión (o al abrir la página) se manda la cola entera en un solo
+// POST a /sincronizar/; el servidor descarta las claves que ya recibió, así
+// que reenviar un lote cuya respuesta se perdió no duplica nada. La cola es
+// de cada usuario (meta usuario-id): quien inicie sesión después en el mismo
+// navegador no envía los eventos de otro. La agenda sin conexión también
+// (ColaSincronizacion.AGENDA, ver serviceworker.js).
+
+const ColaSincronizacion = (() => {
+  const USUARIO = document.querySelector('meta[name="usuario-id"]').content;
+  const CLAVE = `medalert-eventos-pendientes-${USUARIO}`;
+  const AGENDA = `/medicamentos/agenda/?usuario=${USUARIO}`;
+  const URL = "/sincronizar/";
+  let enviando = false;
+
+  const leer = () => JSON.parse(localStorage.getItem(CLAVE) || "[]");
+  const guardar = eventos => localStorage.setItem(CLAVE, JSON.stringify(eventos));
+  const nuevaClave = () =>
+    self.crypto?.randomUUID ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+
+  function encolar(evento) {
+    guardar([...leer(), {clave: nuevaClave(), fecha_hora: new Date().toISOString(), ...evento}]);
+  }
+
+  async function sincronizar() {
+    const eventos = leer();
+    if (enviando || !eventos.length || !navigator.onLine) return null;
+    enviando = true;
+    try {
+      const res = await fetch(URL, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          "X-CSRFToken": document.querySelector('meta[name="csrf-token"]').content,
+        },
+        body: JSON.stringify({eventos}),
+      });
+      if (!res.ok) return null;
+      const data = await res.json();
+      // Aplicados, duplicados y rechazados ya tienen respuesta definitiva
+      const resueltas = new Set([...data.aplicados, ...data.duplicados, ...data.rechazados.map(r => r.clave)]);
+      guardar(leer().filter(e => !resueltas.has(e.clave)));
+      // La respuesta trae la agenda actualizada: reemplaza la copia sin conexión del service worker
+      if (self.caches) {
+        const agenda = new Response(JSON.stringify(data.agenda), {headers: {"Content-Type": "application/json"}});
+        caches.open("medalert-v2-datos").then(cache => cache.put(AGENDA, agenda));
+      }
+      document.dispatchEvent(new CustomEvent("medalert:sincronizado", {detail: data}));
+      return data;
+    } catch (e) {
+      return null;  // sigue sin conexión: se reintenta con el próximo evento "online"
+    } finally {
+      enviando = false;
+    }
+  }
+
+  window.addEventListener("online", sincronizar);
+  document.addEventListener("DOMContentLoaded", sincronizar);
+  return {encolar, sincronizar, pendientes: () => leer().length, AGENDA};
+})();